@@ -0,0 +1 @@
+from .annotation_renderer import *
\ No newline at end of file
@@ -0,0 +1,185 @@
+import cv2
+from contextlib import contextmanager
+from player_ball_assigner import PossessionStats
+from .sprite_cache import SPRITES
+
+# Draw order of the overlay layers (lower layers are composited first)
+LAYER_BACKGROUND = 0   # camera movement panel
+LAYER_BACKGROUND_TEXT = 1
+LAYER_MARKER_FILL = 2  # translucent player discs
+LAYER_MARKER = 3       # outlines, ids, referee and ball markers
+LAYER_HUD = 4          # possession bar
+LAYER_LABEL_FILL = 5   # speed / distance boxes
+LAYER_LABEL = 6
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def _merge_rects(rects):
+    """Merge overlapping (x1, y1, x2, y2) rects until all remaining ones are disjoint."""
+    merged = []
+    for rect in rects:
+        x1, y1, x2, y2 = rect
+        i = 0
+        while i < len(merged):
+            mx1, my1, mx2, my2 = merged[i]
+            if x1 < mx2 and mx1 < x2 and y1 < my2 and my1 < y2:
+                x1, y1, x2, y2 = min(x1, mx1), min(y1, my1), max(x2, mx2), max(y2, my2)
+                merged.pop(i)
+                i = 0  # the grown rect may now touch one we already passed
+            else:
+                i += 1
+        merged.append((x1, y1, x2, y2))
+    return merged
+
+
+class AnnotationRenderer:
+    """
+    Collects the overlay primitives of one frame and composites them in a single pass.
+
+    Translucent primitives of the same layer and alpha are drawn into one overlay and
+    blended once, and only over the regions they touch instead of the whole frame.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    # ---------------- PRIMITIVES ---------------- #
+
+    def circle(self, center, radius, color, thickness=-1, alpha=1.0, layer=LAYER_MARKER):
+        pad = radius + max(thickness, 0) + 1
+        rect = (center[0] - pad, center[1] - pad, center[0] + pad + 1, center[1] + pad + 1)
+        self.ops.append((layer, alpha, rect, self._draw_circle, (center, radius, color, thickness)))
+
+    def rectangle(self, pt1, pt2, color, thickness=-1, alpha=1.0, layer=LAYER_MARKER):
+        pad = max(thickness, 0) + 1
+        rect = (min(pt1[0], pt2[0]) - pad, min(pt1[1], pt2[1]) - pad,
+                max(pt1[0], pt2[0]) + pad + 1, max(pt1[1], pt2[1]) + pad + 1)
+        self.ops.append((layer, alpha, rect, self._draw_rectangle, (pt1, pt2, color, thickness)))
+
+    def text(self, text, org, color, font_scale, thickness, alpha=1.0, layer=LAYER_MARKER):
+        (w, h), baseline = cv2.getTextSize(text, FONT, font_scale, thickness)
+        rect = (org[0] - thickness - 1, org[1] - h - thickness - 1,
+                org[0] + w + thickness + 1, org[1] + baseline + thickness + 1)
+        self.ops.append((layer, alpha, rect, self._draw_text, (text, org, color, font_scale, thickness)))
+
+    def sprite(self, sprite, org, layer=LAYER_MARKER):
+        """A cached Sprite anchored at org; it carries its own alpha, so it is stamped with the opaque ops."""
+        self.ops.append((layer, 1.0, sprite.bounds(org), self._draw_sprite, (sprite, org)))
+
+    def label(self, text, org, color, font_scale, thickness, outline_color=None, outline_thickness=0,
+              layer=LAYER_MARKER):
+        """putText, optionally over a thicker outline putText, stamped from the sprite cache."""
+        self.sprite(SPRITES.label(text, color, font_scale, thickness, outline_color, outline_thickness),
+                    org, layer)
+
+    def marker(self, center, shapes, layer=LAYER_MARKER):
+        """
+        Stack of (kind 'circle' / 'rect', radius, color, thickness, alpha) shapes centred on center,
+        stamped from the sprite cache as one unit.
+        """
+        self.sprite(SPRITES.marker(shapes), center, layer)
+
+    @staticmethod
+    def _draw_circle(image, dx, dy, center, radius, color, thickness):
+        cv2.circle(image, (center[0] - dx, center[1] - dy), radius, color, thickness)
+
+    @staticmethod
+    def _draw_rectangle(image, dx, dy, pt1, pt2, color, thickness):
+        cv2.rectangle(image, (pt1[0] - dx, pt1[1] - dy), (pt2[0] - dx, pt2[1] - dy), color, thickness)
+
+    @staticmethod
+    def _draw_sprite(image, dx, dy, sprite, org):
+        sprite.stamp(image, (org[0] - dx, org[1] - dy))
+
+    @staticmethod
+    def _draw_text(image, dx, dy, text, org, color, font_scale, thickness):
+        cv2.putText(image, text, (org[0] - dx, org[1] - dy), FONT, font_scale, color, thickness)
+
+    # ---------------- COMPOSITING ---------------- #
+
+    def render(self, frame):
+        """Composite every queued primitive onto frame in place, then clear the queue."""
+        h, w = frame.shape[:2]
+        # Within a layer translucent fills go under opaque strokes; the sort is stable,
+        # so submission order is kept otherwise
+        ops = sorted(self.ops, key=lambda op: (op[0], op[1] >= 1.0))
+        self.ops = []
+
+        i = 0
+        while i < len(ops):
+            layer, alpha = ops[i][0], ops[i][1]
+            j = i
+            while j < len(ops) and ops[j][0] == layer and ops[j][1] == alpha:
+                j += 1
+            group = ops[i:j]
+            i = j
+
+            if alpha >= 1.0:
+                for _, _, _, draw, args in group:
+                    draw(frame, 0, 0, *args)
+                continue
+
+            rects = []
+            for _, _, (x1, y1, x2, y2), _, _ in group:
+                x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+                if x1 < x2 and y1 < y2:
+                    rects.append((x1, y1, x2, y2))
+
+            for x1, y1, x2, y2 in _merge_rects(rects):
+                roi = frame[y1:y2, x1:x2]
+                overlay = roi.copy()
+                for _, _, (ox1, oy1, ox2, oy2), draw, args in group:
+                    if ox1 < x2 and x1 < ox2 and oy1 < y2 and y1 < oy2:
+                        draw(overlay, x1, y1, *args)
+                cv2.addWeighted(overlay, alpha, roi, 1 - alpha, 0, roi)
+
+        return frame
+
+
+@contextmanager
+def frame_renderer(frame, renderer=None):
+    """
+    Yield the renderer to queue primitives on. Without a shared renderer a private one
+    is created and rendered onto frame on exit, so draw helpers work standalone too.
+    """
+    if renderer is not None:
+        yield renderer
+        return
+
+    renderer = AnnotationRenderer()
+    yield renderer
+    renderer.render(frame)
+
+
+def iter_video_annotations(frames, camera_estimator, camera_movement_per_frame, tracker, tracks,
+                           team_ball_control, speed_distance_estimator):
+    """
+    Single-pass replacement for draw_camera_movement + draw_annotations +
+    draw_speed_and_distance: one frame copy and one composite per frame, yielded as
+    soon as it is drawn so an encoder can take it right away.
+    """
+    if tracks['players']:
+        first_frame_players = tracks['players'][0]
+        team_colors = {p['team_id']: p['team_color'] for p in first_frame_players.values() if 'team_id' in p}
+    else:
+        team_colors = {}
+
+    possession = PossessionStats(team_ball_control)
+    renderer = AnnotationRenderer()
+
+    for frame_num, frame in enumerate(frames):
+        frame = frame.copy()
+        camera_estimator.draw_frame_camera_movement(frame, camera_movement_per_frame[frame_num], renderer)
+        if frame_num < len(tracks['players']):
+            tracker.draw_frame_annotations(
+                frame, frame_num, tracks['players'][frame_num], tracks['referees'][frame_num],
+                tracks['ball'][frame_num], possession, team_colors, renderer
+            )
+            speed_distance_estimator.draw_frame_speed_and_distance(frame, tracks['players'][frame_num], renderer)
+        yield renderer.render(frame)
+
+
+def draw_video_annotations(*args):
+    """iter_video_annotations as a list of frames."""
+    return list(iter_video_annotations(*args))
@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+import threading
+from collections import OrderedDict
+from config import SPRITE_CACHE_SIZE
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def to_color_key(color):
+    if type(color) is tuple:
+        return color  # already hashable; this runs for every marker and label of every frame
+    # cv2 saturates float colors to uint8, so equal ints draw identical sprites
+    return tuple(int(round(float(c))) for c in color)
+
+
+class Sprite:
+    """
+    A pre-rasterized marker or label: its color premultiplied by alpha and the inverse
+    alpha, both as uint8 BGR patches, so stamping is one multiply and one add on the ROI.
+    """
+    __slots__ = ("premultiplied", "inverse_alpha", "offset", "width", "height")
+
+    def __init__(self, premultiplied, alpha, offset):
+        # Only keep the rows / columns something was drawn on
+        ys, xs = np.nonzero(alpha > 0)
+        if len(ys):
+            y1, y2, x1, x2 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        else:
+            y1 = y2 = x1 = x2 = 0
+        alpha = alpha[y1:y2, x1:x2]
+
+        self.premultiplied = np.clip(np.rint(premultiplied[y1:y2, x1:x2]), 0, 255).astype(np.uint8)
+        inverse_alpha = np.rint((1.0 - alpha) * 255).astype(np.uint8)
+        self.inverse_alpha = np.repeat(inverse_alpha[..., None], 3, axis=2)
+        self.offset = (offset[0] + int(x1), offset[1] + int(y1))
+        self.height, self.width = alpha.shape
+
+    def bounds(self, org):
+        x, y = org[0] + self.offset[0], org[1] + self.offset[1]
+        return x, y, x + self.width, y + self.height
+
+    def stamp(self, image, org):
+        """Alpha blend the sprite onto image (in place) with its anchor at org."""
+        h, w = image.shape[:2]
+        x1, y1 = org[0] + self.offset[0], org[1] + self.offset[1]
+        x2, y2 = x1 + self.width, y1 + self.height
+        if x1 >= 0 and y1 >= 0 and x2 <= w and y2 <= h:
+            roi = image[y1:y2, x1:x2]
+            inverse_alpha, premultiplied = self.inverse_alpha, self.premultiplied
+        else:
+            cx1, cy1, cx2, cy2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+            if cx1 >= cx2 or cy1 >= cy2:
+                return image
+            roi = image[cy1:cy2, cx1:cx2]
+            inside = (slice(cy1 - y1, cy2 - y1), slice(cx1 - x1, cx2 - x1))
+            inverse_alpha, premultiplied = self.inverse_alpha[inside], self.premultiplied[inside]
+
+        # frame * (1 - alpha) + color * alpha, written straight into the frame
+        cv2.multiply(roi, inverse_alpha, dst=roi, scale=1 / 255)
+        cv2.add(roi, premultiplied, dst=roi)
+        return image
+
+
+def _rasterize(height, width, offset, layers):
+    """
+    Composite layers with the "over" operator. Each layer is (draw, color, alpha) where
+    draw(mask) paints coverage 0..255 into a blank uint8 mask, so anti-aliased edges
+    blend the same way they would when drawn straight onto the frame.
+    """
+    premultiplied = np.zeros((height, width, 3), np.float32)
+    alpha = np.zeros((height, width), np.float32)
+    mask = np.zeros((height, width), np.uint8)
+
+    for draw, color, layer_alpha in layers:
+        mask[:] = 0
+        draw(mask)
+        coverage = mask.astype(np.float32) * (layer_alpha / 255.0)
+        keep = 1.0 - coverage
+        premultiplied *= keep[..., None]
+        premultiplied += coverage[..., None] * np.array(color, np.float32)
+        alpha = coverage + alpha * keep
+
+    return Sprite(premultiplied, alpha, offset)
+
+
+def rasterize_label(text, color, font_scale, thickness, outline_color=None, outline_thickness=0):
+    """Text drawn once, optionally over a thicker outline; anchor is the putText origin."""
+    max_thickness = max(thickness, outline_thickness)
+    (tw, th), baseline = cv2.getTextSize(text, FONT, font_scale, max_thickness)
+    pad = max_thickness + 1
+    width, height = tw + 2 * pad, th + baseline + 2 * pad
+    origin = (pad, pad + th)
+
+    def text_layer(layer_thickness):
+        return lambda mask: cv2.putText(mask, text, origin, FONT, font_scale, 255, layer_thickness)
+
+    # Same order as successive putText calls: outline first, then the text on top
+    layers = [(text_layer(outline_thickness), outline_color, 1.0)] if outline_color is not None else []
+    layers.append((text_layer(thickness), color, 1.0))
+    return _rasterize(height, width, (-origin[0], -origin[1]), layers)
+
+
+def rasterize_marker(shapes):
+    """
+    Shapes centred on the anchor, drawn in order. Each shape is
+    ('circle', radius, color, thickness, alpha) or ('rect', half_size, color, thickness, alpha).
+    """
+    extent = max(shape[1] + max(shape[3], 0) for shape in shapes) + 1
+    size = 2 * extent + 1
+    center = (extent, extent)
+
+    def shape_layer(kind, radius, thickness):
+        if kind == 'circle':
+            return lambda mask: cv2.circle(mask, center, radius, 255, thickness)
+        return lambda mask: cv2.rectangle(mask, (extent - radius, extent - radius),
+                                          (extent + radius, extent + radius), 255, thickness)
+
+    layers = [(shape_layer(kind, radius, thickness), color, alpha)
+              for kind, radius, color, thickness, alpha in shapes]
+    return _rasterize(size, size, (-extent, -extent), layers)
+
+
+class SpriteCache:
+    """Bounded LRU of rasterized sprites, keyed by everything that affects their pixels."""
+
+    def __init__(self, max_size=SPRITE_CACHE_SIZE):
+        self.max_size = max_size
+        self.sprites = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+
+        sprite = build()
+        with self.lock:
+            self.sprites[key] = sprite
+            while len(self.sprites) > self.max_size:
+                self.sprites.popitem(last=False)
+        return sprite
+
+    def label(self, text, color, font_scale, thickness, outline_color=None, outline_thickness=0):
+        color = to_color_key(color)
+        outline_color = to_color_key(outline_color) if outline_color is not None else None
+        key = ('label', text, color, font_scale, thickness, outline_color, outline_thickness)
+        return self.get(key, lambda: rasterize_label(text, color, font_scale, thickness,
+                                                     outline_color, outline_thickness))
+
+    def marker(self, shapes):
+        shapes = tuple((kind, radius, to_color_key(color), thickness, alpha)
+                       for kind, radius, color, thickness, alpha in shapes)
+        return self.get(('marker', shapes), lambda: rasterize_marker(shapes))
+
+
+# Shared by every renderer, so the standalone draw helpers reuse the same sprites
+SPRITES = SpriteCache()
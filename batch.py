@@ -0,0 +1,251 @@
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+# Settings are read as config.X (not from config import *) so --set overrides apply
+import config
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def parse_override(text):
+    """KEY=VALUE of a config.py setting; the value is read as a Python literal when it is one."""
+    key, sep, value = text.partition("=")
+    if not sep or not key.isupper() or not hasattr(config, key):
+        raise argparse.ArgumentTypeError(f"'{text}' is not KEY=VALUE with KEY a setting of config.py")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return key, value
+
+
+def apply_overrides(overrides):
+    # Must run before the pipeline modules are imported: they copy the settings at import
+    for key, value in overrides.items():
+        setattr(config, key, value)
+
+
+def find_videos(inputs):
+    """Video files from paths, directories and glob patterns, in order, without duplicates."""
+    videos = []
+    for pattern in inputs:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isdir(path):
+                videos += sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(VIDEO_EXTENSIONS))
+            else:
+                videos.append(path)
+    return list(dict.fromkeys(os.path.normpath(video) for video in videos))
+
+
+def output_name(video_path):
+    """File name stem of a video's outputs; the path hash keeps dirA/match.mp4 and dirB/match.mp4 apart."""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return f"{stem}_{hashlib.md5(os.path.abspath(video_path).encode()).hexdigest()[:8]}"
+
+
+def summary_path(video_path, output_dir):
+    return os.path.join(output_dir, output_name(video_path) + ".json")
+
+
+def load_summary(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_summary(path, summary):
+    # Written aside and renamed, so a killed worker never leaves half a summary
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp_", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(summary, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def is_complete(video_path, output_dir, settings):
+    """Whether a finished summary of this exact video, with these settings, is already there."""
+    from trackers import video_fingerprint
+
+    summary = load_summary(summary_path(video_path, output_dir))
+    return (summary is not None and summary.get("status") == "done" and summary.get("settings") == settings
+            and summary.get("fingerprint") == video_fingerprint(video_path)
+            and os.path.exists(summary.get("output_video", "")))
+
+
+def decoded_size(video_path):
+    """Bytes of the video's frames once decoded (what the non-streaming pipeline keeps in memory)."""
+    cap = cv2.VideoCapture(video_path)
+    width, height = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    return int(width * height * 3 * max(frames, 0))
+
+
+def available_memory():
+    """Memory available to new processes in bytes (None if unknown)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def pool_size(videos):
+    """Worker processes: one per core, as long as the biggest video fits in memory that many times."""
+    cores = os.cpu_count() or 1
+    per_worker = config.BATCH_WORKER_MEMORY
+    if not config.STREAMING_MODE:
+        per_worker += max(decoded_size(video) for video in videos)
+    memory = available_memory()
+    by_memory = memory // per_worker if memory else cores
+    return max(1, min(cores, by_memory, len(videos)))
+
+
+def init_worker(overrides, threads):
+    # Each worker gets its share of the cores for torch / OpenCV / ONNX Runtime
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    cv2.setNumThreads(threads)
+    apply_overrides(overrides)
+
+
+def process_video(video_path, output_dir, detail_level, settings):
+    """
+    Analyse one video in a worker process: writes the annotated video and a JSON summary
+    (possession, player stats, stage timings) next to it, and returns the summary. The
+    full stage metrics go to <name>.metrics.json / <name>.metrics.prom.
+    """
+    from utils import Metrics, get_video_frame_count, read_video, save_video
+    from trackers import Tracker, video_fingerprint
+    from player_ball_assigner import PossessionStats
+    from camera_movement_estimator import CameraMovementEstimator
+    from pipeline import StreamingPipeline, AnalysisPipeline
+    from annotation_renderer import iter_video_annotations
+    from speed_distance_estimator import player_stats_rows
+
+    name = output_name(video_path)
+    output_path = os.path.join(output_dir, f"{name}_annotated.mp4")
+    summary = {"video": os.path.abspath(video_path), "fingerprint": video_fingerprint(video_path),
+               "settings": settings, "output_video": output_path, "worker_pid": os.getpid()}
+    metrics = Metrics(job=name)
+    start = time.perf_counter()
+    try:
+        if config.STREAMING_MODE:
+            result = StreamingPipeline(config.MODEL_PATH, detail_level).run(video_path, output_path, metrics=metrics)
+            possession, player_stats = result["possession"], result["player_stats"]
+            schedule_report = result["schedule_report"]
+        else:
+            with metrics.stage("decode", items=get_video_frame_count(video_path)):
+                video_frames = read_video(video_path)
+
+            tracker = Tracker(config.MODEL_PATH, detail_level)
+            pipeline = AnalysisPipeline(tracker)
+            analysis = pipeline.run(video_path, video_frames, metrics=metrics)
+            summary.update(frames=len(video_frames), fps=analysis["fps"], stages=analysis["report"])
+
+            with metrics.stage("render", items=len(video_frames)):
+                camera_estimator = CameraMovementEstimator(video_frames[0])
+                output_frames = iter_video_annotations(video_frames, camera_estimator, analysis["camera_movement"],
+                                                       tracker, analysis["table"].as_tracks(),
+                                                       analysis["ball_possession"], pipeline.speed_distance_estimator)
+                save_video(output_frames, output_path, fps=analysis["fps"])
+
+            possession = PossessionStats(analysis["ball_possession"])
+            player_stats = player_stats_rows(analysis["speed_distance"], analysis["teams"])
+            schedule_report = tracker.schedule_report
+
+        shares = possession.percentages((1, 2))
+        summary.update(status="done", possession={f"team_{team_id}": round(share, 1) for team_id, share in shares.items()},
+                       player_stats=player_stats, detection=schedule_report.as_dict(),
+                       timings={stage: round(seconds, 3) for stage, seconds in metrics.wall_times().items()})
+    except Exception as error:
+        summary.update(status="failed", error=f"{type(error).__name__}: {error}")
+
+    summary["elapsed"] = round(time.perf_counter() - start, 3)
+    try:
+        metrics.write(output_dir, prefix=f"{name}.")
+    except Exception as error:
+        # The summary is what marks the video as done, so it is written regardless
+        summary["metrics_error"] = f"{type(error).__name__}: {error}"
+    write_summary(summary_path(video_path, output_dir), summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyse videos without the UI: an annotated video and a JSON summary per input.")
+    parser.add_argument("inputs", nargs="+", help="video files, directories or glob patterns (quoted)")
+    parser.add_argument("-o", "--output-dir", default=config.BATCH_OUTPUT_DIR)
+    parser.add_argument("--detail-level", choices=list(config.DETECTION_SCHEDULES), default=config.DETAIL_LEVEL)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: from cores and memory)")
+    parser.add_argument("--set", dest="overrides", type=parse_override, action="append", default=[],
+                        metavar="KEY=VALUE", help="override a config.py setting, e.g. --set STREAMING_MODE=True")
+    parser.add_argument("--force", action="store_true", help="reprocess videos that already have a summary")
+    args = parser.parse_args(argv)
+
+    overrides = dict(args.overrides)
+    apply_overrides(overrides)
+    videos = find_videos(args.inputs)
+    if not videos:
+        raise SystemExit(f"No videos found for {args.inputs}")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Compared with the summaries on disk, so in the form JSON gives back
+    settings = json.loads(json.dumps({"detail_level": args.detail_level, "overrides": overrides}))
+    todo = []
+    for video in videos:
+        if not args.force and is_complete(video, args.output_dir, settings):
+            print(f"[SKIP] {video}: summary up to date")
+        else:
+            todo.append(video)
+    if not todo:
+        return 0
+
+    workers = args.workers or pool_size(todo)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"[INFO] {len(todo)} videos on {workers} worker processes ({threads} threads each)")
+
+    failed = 0
+    # spawn: workers import the pipeline from scratch, after the overrides (and without forked threads)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(overrides, threads)) as pool:
+        futures = {pool.submit(process_video, video, args.output_dir, args.detail_level, settings): video
+                   for video in todo}
+        try:
+            for future in as_completed(futures):
+                video = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as error:    # the worker died (out of memory, ...)
+                    summary = {"status": "failed", "error": f"{type(error).__name__}: {error}"}
+                if summary["status"] == "done":
+                    print(f"[DONE] {video} in {summary['elapsed']:.1f}s -> {summary['output_video']}")
+                else:
+                    failed += 1
+                    print(f"[FAIL] {video}: {summary['error']}")
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    print(f"[INFO] {len(todo) - failed}/{len(todo)} videos processed, summaries in {args.output_dir}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
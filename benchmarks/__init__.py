@@ -0,0 +1,2 @@
+from .synthetic import SyntheticMatch
+from .mock_detector import MockDetector
@@ -0,0 +1,78 @@
+import time
+import cv2
+import numpy as np
+from trackers import DetectorBackend
+from .synthetic import TEAM_COLORS, REFEREE_COLOR, BALL_COLOR, HEAD_PART, JERSEY_PART, SHORTS_PART
+
+
+class MockDetector(DetectorBackend):
+    """
+    Deterministic stand-in for the YOLO model on SyntheticMatch clips: finds the players,
+    referees and ball by their palette colors, so it works on whole frames and on the
+    ball tiles alike, with the model's class names. Time spent in detect() is summed in
+    `seconds`, so benchmarks can leave it out of the tracking time.
+    """
+
+    name = "mock"
+    names = {0: 'ball', 1: 'goalkeeper', 2: 'player', 3: 'referee'}
+
+    def __init__(self, tolerance=25, min_area=12, padding=4):
+        super().__init__()
+        self.tolerance = tolerance
+        self.min_area = min_area
+        # Loose boxes like a real detector's, so crops have some grass around the player
+        self.padding = padding
+        self.seconds = 0.0
+        self.calls = 0
+
+    def find(self, frame, color, min_area):
+        """(x, y, w, h) of the blobs of one color."""
+        color = np.array(color, dtype=np.int16)
+        mask = cv2.inRange(frame, np.clip(color - self.tolerance, 0, 255).astype(np.uint8),
+                           np.clip(color + self.tolerance, 0, 255).astype(np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        stats = stats[1:count]
+        return stats[stats[:, cv2.CC_STAT_AREA] >= min_area, :4]
+
+    def person_boxes(self, frame, color):
+        # The jersey is found; head above and shorts below follow from the figure's proportions
+        boxes = self.find(frame, color, self.min_area).astype(np.float32)
+        x, y, w, h = boxes.T
+        top = y - h * HEAD_PART / JERSEY_PART - self.padding
+        bottom = y + h + h * SHORTS_PART / JERSEY_PART + self.padding
+        return np.stack([x - self.padding, top, x + w + self.padding, bottom], axis=1)
+
+    def detect(self, frames, conf, imgsz=None):
+        import supervision as sv
+
+        start = time.perf_counter()
+        detections = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            xyxy, class_id, confidence = [], [], []
+            for color in TEAM_COLORS.values():
+                boxes = self.person_boxes(frame, color)
+                xyxy.append(boxes)
+                class_id += [2] * len(boxes)
+                confidence += [0.9] * len(boxes)
+            boxes = self.person_boxes(frame, REFEREE_COLOR)
+            xyxy.append(boxes)
+            class_id += [3] * len(boxes)
+            confidence += [0.85] * len(boxes)
+
+            balls = self.find(frame, BALL_COLOR, 4).astype(np.float32)
+            xyxy.append(np.stack([balls[:, 0], balls[:, 1], balls[:, 0] + balls[:, 2], balls[:, 1] + balls[:, 3]], axis=1)
+                        if len(balls) else np.zeros((0, 4), np.float32))
+            class_id += [0] * len(balls)
+            confidence += [0.7] * len(balls)
+
+            xyxy = np.concatenate(xyxy).reshape(-1, 4)
+            xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+            xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+            keep = np.array(confidence, dtype=np.float32) >= conf
+            detections.append(sv.Detections(xyxy=xyxy[keep].astype(np.float32),
+                                            confidence=np.array(confidence, dtype=np.float32)[keep],
+                                            class_id=np.array(class_id, dtype=int)[keep]))
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        return detections
@@ -0,0 +1,182 @@
+"""
+Per-stage throughput (frames per second) and peak memory of the analysis on a synthetic
+clip, with MockDetector standing in for the YOLO model - no GPU, weights or footage needed.
+
+    python -m benchmarks.run_benchmarks --frames 200 --width 1280 --height 720
+    python -m benchmarks.run_benchmarks --output benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json   # after a change
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from config import *
+from utils import FrameCache, save_video
+from trackers import Tracker, TrackTable
+from camera_movement_estimator import CameraMovementEstimator
+from pipeline import AnalysisPipeline
+from annotation_renderer import iter_video_annotations
+from .synthetic import SyntheticMatch
+from .mock_detector import MockDetector
+
+
+# ---------------- STAGES ---------------- #
+# Each takes the shared context (like the StageGraph stages, which most of them call) and
+# may return seconds to leave out of its time. They can be run again on the same context.
+
+def tracking(context):
+    """Detection (mock) + ByteTrack + ball recovery and the ball trajectory, as in AnalysisPipeline.track_objects."""
+    detector = MockDetector()
+    tracker = Tracker(MODEL_PATH, context["detail_level"], detector=detector)
+    context["pipeline"].tracker = tracker
+
+    frame_rows = []
+    for _, detections in tracker.detect_batches(context["frames"]):
+        frame_rows.extend(tracker.get_frame_rows(detection) for detection in detections)
+    context["table"] = tracker.interpolate_ball_positions(TrackTable.from_frame_rows(frame_rows))
+    # The stand-in's own time says nothing about the pipeline
+    return detector.seconds
+
+
+def camera_movement(context):
+    context["frame_cache"] = FrameCache(context["frames"], max_frames=FRAME_CACHE_SIZE)
+    context["camera_movement"] = context["pipeline"].estimate_camera_movement(context)
+
+
+def view_transform(context):
+    context["pipeline"].compute_positions(context)
+
+
+def team_assignment(context):
+    context["teams"] = context["pipeline"].assign_teams(context)
+
+
+def ball_assignment(context):
+    context["ball_possession"] = context["pipeline"].assign_ball(context)
+
+
+def speed_distance(context):
+    context["speed_distance"] = context["pipeline"].compute_speed_and_distance(context)
+
+
+def drawing(context):
+    pipeline, frames = context["pipeline"], context["frames"]
+    annotated = iter_video_annotations(frames, CameraMovementEstimator(frames[0]), context["camera_movement"],
+                                       pipeline.tracker, context["table"].as_tracks(), context["ball_possession"],
+                                       pipeline.speed_distance_estimator)
+    for _ in annotated:
+        pass
+
+
+def encoding(context):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_video(context["frames"], os.path.join(tmp_dir, "benchmark.mp4"), fps=context["fps"], codec=context["codec"])
+
+
+STAGES = [
+    ("tracking", tracking),
+    ("camera_movement", camera_movement),
+    ("view_transform", view_transform),
+    ("team_assignment", team_assignment),
+    ("ball_assignment", ball_assignment),
+    ("speed_distance", speed_distance),
+    ("drawing", drawing),
+    ("save_video", encoding),
+]
+
+
+# ---------------- RUN ---------------- #
+
+def measure(stage, context, repeat, memory):
+    """Best time of `repeat` runs, then (if memory) the peak of what one more run allocates."""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        excluded = stage(context) or 0.0
+        seconds = min(seconds, time.perf_counter() - start - excluded)
+
+    peak = None
+    if memory:
+        # A run of its own: tracing slows down allocation-heavy code
+        tracemalloc.start()
+        stage(context)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run(args):
+    clip = {"frames": args.frames, "width": args.width, "height": args.height,
+            "players_per_team": args.players_per_team, "detail_level": args.detail_level, "seed": args.seed}
+    start = time.perf_counter()
+    match = SyntheticMatch(args.frames, args.width, args.height, args.players_per_team, seed=args.seed)
+    frames = match.frames()
+    print(f"Synthetic clip: {args.frames} frames {args.width}x{args.height}, "
+          f"{time.perf_counter() - start:.1f}s to generate\n")
+
+    context = {
+        "frames": frames,
+        "fps": match.fps,
+        "codec": args.codec,
+        "detail_level": args.detail_level,
+        "pipeline": AnalysisPipeline(Tracker(MODEL_PATH, args.detail_level, detector=MockDetector())),
+    }
+    results = {}
+    for name, stage in STAGES:
+        seconds, peak = measure(stage, context, args.repeat, not args.no_memory)
+        results[name] = {"seconds": round(seconds, 4), "fps": round(len(frames) / max(seconds, 1e-9), 1),
+                         "peak_mb": None if peak is None else round(peak / 1024 ** 2, 1)}
+    return {"clip": clip, "stages": results}
+
+
+def print_results(results, baseline=None):
+    stages = results["stages"]
+    if baseline is not None and baseline.get("clip") != results["clip"]:
+        print(f"[WARN] Baseline clip differs: {baseline.get('clip')}\n")
+    base_stages = (baseline or {}).get("stages", {})
+
+    print(f"{'stage':<18}{'fps':>10}{'ms/frame':>10}{'peak MB':>10}" + ("   vs baseline" if baseline else ""))
+    for name, result in stages.items():
+        peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+        line = f"{name:<18}{result['fps']:>10.1f}{1000 / result['fps']:>10.2f}{peak:>10}"
+        if name in base_stages:
+            line += f"   {100 * (result['fps'] / base_stages[name]['fps'] - 1):+6.1f}% fps"
+        print(line)
+
+    total = sum(result["seconds"] for result in stages.values())
+    print(f"{'total':<18}{results['clip']['frames'] / total:>10.1f}{1000 * total / results['clip']['frames']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage benchmark on a synthetic clip with a mock detector.")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--players-per-team", type=int, default=10)
+    parser.add_argument("--detail-level", choices=list(DETECTION_SCHEDULES), default="Full")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--codec", default=VIDEO_CODEC, help="codec of the save_video stage")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the best one counts")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--output", help="write the results as JSON (e.g. a baseline)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
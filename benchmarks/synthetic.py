@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+
+# Palette (BGR) shared with MockDetector, which finds objects by these colors
+TEAM_COLORS = {1: (40, 40, 200), 2: (200, 120, 30)}
+REFEREE_COLOR = (20, 200, 230)
+BALL_COLOR = (255, 255, 255)
+SHORTS_COLOR = (25, 25, 25)
+SKIN_COLOR = (140, 170, 210)
+GRASS_COLORS = ((40, 130, 40), (50, 150, 50))
+LINE_COLOR = (210, 210, 210)
+
+# Parts of a player's height, top to bottom
+HEAD_PART, JERSEY_PART, SHORTS_PART = 0.15, 0.45, 0.40
+
+
+class SyntheticMatch:
+    """
+    A broadcast-like clip made up on the fly: striped pitch with lines and grass texture,
+    two teams of colored player figures and referees wandering around, a ball passed
+    between players (and now and then hidden, so the ball interpolation has gaps to fill)
+    and a camera panning back and forth. Everything follows from the seed.
+
+        match = SyntheticMatch(num_frames=200, width=1280, height=720)
+        frames = match.frames()
+    """
+
+    def __init__(self, num_frames=200, width=1280, height=720, players_per_team=10, referees=2,
+                 pan=400, fps=24, ball_hidden_rate=0.1, seed=0):
+        self.num_frames = num_frames
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.rng = np.random.default_rng(seed)
+        # Sizes are tuned on 1080p and scale with the frame
+        self.scale = height / 1080
+        self.player_height = max(12, int(round(70 * self.scale)))
+        self.player_width = max(5, int(round(26 * self.scale)))
+        self.ball_radius = max(3, int(round(7 * self.scale)))
+
+        # Camera: slow horizontal pan over a wider pitch, with a little vertical sway
+        self.pan = int(pan * self.scale)
+        self.sway = int(20 * self.scale)
+        t = np.arange(num_frames)
+        self.camera_x = np.round(self.pan * (1 - np.cos(2 * np.pi * t / max(num_frames, 2))) / 2).astype(int)
+        self.camera_y = np.round(self.sway * (1 + np.sin(2 * np.pi * t / 97))).astype(int)
+        self.world = self.render_pitch(width + self.pan, height + 2 * self.sway)
+
+        self.teams = [1] * players_per_team + [2] * players_per_team + [0] * referees
+        self.positions = self.simulate_players(len(self.teams))
+        self.ball, self.ball_visible = self.simulate_ball(players_per_team * 2, ball_hidden_rate)
+
+    def render_pitch(self, width, height):
+        world = np.empty((height, width, 3), dtype=np.uint8)
+        stripe = max(1, int(120 * self.scale))
+        for x in range(0, width, stripe):
+            world[:, x:x + stripe] = GRASS_COLORS[(x // stripe) % 2]
+        # Grass texture gives the optical flow something to hold on to
+        noise = self.rng.integers(-12, 13, size=(height, width), dtype=np.int16)
+        world[..., 1] = np.clip(world[..., 1] + noise, 0, 255).astype(np.uint8)
+
+        thickness = max(1, int(4 * self.scale))
+        margin = int(40 * self.scale)
+        cv2.rectangle(world, (margin, margin), (width - margin, height - margin), LINE_COLOR, thickness)
+        for x in range(margin, width - margin, int(500 * self.scale)):
+            cv2.line(world, (x, margin), (x, height - margin), LINE_COLOR, thickness)
+        cv2.circle(world, (width // 2, height // 2), int(150 * self.scale), LINE_COLOR, thickness)
+        return world
+
+    def simulate_players(self, count):
+        """(num_frames, count, 2) foot positions in world pixels: smooth random walks bouncing off the edges."""
+        world_h, world_w = self.world.shape[:2]
+        low = np.array([self.player_width, 0.2 * world_h])
+        high = np.array([world_w - self.player_width, world_h - 0.05 * world_h])
+        max_speed = 5 * self.scale
+
+        position = low + self.rng.random((count, 2)) * (high - low)
+        velocity = self.rng.normal(0, max_speed / 2, (count, 2))
+        positions = np.empty((self.num_frames, count, 2))
+        for frame_num in range(self.num_frames):
+            velocity += self.rng.normal(0, 0.3 * self.scale, (count, 2))
+            speed = np.linalg.norm(velocity, axis=1, keepdims=True)
+            velocity *= np.minimum(1, max_speed / np.maximum(speed, 1e-9))
+            position += velocity
+            bounced = (position < low) | (position > high)
+            velocity[bounced] *= -1
+            position = np.clip(position, low, high)
+            positions[frame_num] = position
+        return positions
+
+    def simulate_ball(self, num_players, hidden_rate):
+        """Ball center per frame (world pixels) and whether it is drawn, passed between players."""
+        ball = np.empty((self.num_frames, 2))
+        carrier = 0
+        frame_num = 0
+        while frame_num < self.num_frames:
+            # Dribble for a while, then a pass of ~0.5s to another player
+            hold = int(self.rng.integers(self.fps, 3 * self.fps))
+            for _ in range(hold):
+                if frame_num >= self.num_frames:
+                    break
+                ball[frame_num] = self.positions[frame_num, carrier] + (self.player_width * 0.6, -self.ball_radius)
+                frame_num += 1
+            receiver = int(self.rng.integers(num_players - 1))
+            receiver += receiver >= carrier
+            start = ball[frame_num - 1]
+            flight = max(2, self.fps // 2)
+            for step in range(1, flight + 1):
+                if frame_num >= self.num_frames:
+                    break
+                target = self.positions[frame_num, receiver] + (self.player_width * 0.6, -self.ball_radius)
+                ball[frame_num] = start + (target - start) * step / flight
+                frame_num += 1
+            carrier = receiver
+
+        # Hidden in short stretches (occlusions / motion blur)
+        visible = np.ones(self.num_frames, dtype=bool)
+        for start in np.flatnonzero(self.rng.random(self.num_frames) < hidden_rate / 4):
+            visible[start:start + int(self.rng.integers(2, 8))] = False
+        return ball, visible
+
+    def draw_player(self, frame, foot, color):
+        x, y = int(foot[0]), int(foot[1])
+        h, w = self.player_height, self.player_width
+        top = y - h
+        jersey_top = top + int(h * HEAD_PART)
+        shorts_top = jersey_top + int(h * JERSEY_PART)
+        cv2.circle(frame, (x, top + int(h * HEAD_PART / 2)), max(2, int(h * HEAD_PART / 2)), SKIN_COLOR, -1)
+        cv2.rectangle(frame, (x - w // 2, jersey_top), (x + w // 2, shorts_top - 1), color, -1)
+        cv2.rectangle(frame, (x - w // 2 + 2, shorts_top), (x + w // 2 - 2, y), SHORTS_COLOR, -1)
+
+    def render(self, frame_num):
+        x0, y0 = self.camera_x[frame_num], self.camera_y[frame_num]
+        frame = self.world[y0:y0 + self.height, x0:x0 + self.width].copy()
+        offset = np.array([x0, y0])
+
+        # Far players first, so nearer ones are drawn on top
+        feet = self.positions[frame_num] - offset
+        for i in np.argsort(feet[:, 1]):
+            color = TEAM_COLORS[self.teams[i]] if self.teams[i] else REFEREE_COLOR
+            self.draw_player(frame, feet[i], color)
+        if self.ball_visible[frame_num]:
+            center = tuple(int(v) for v in self.ball[frame_num] - offset)
+            cv2.circle(frame, center, self.ball_radius, BALL_COLOR, -1)
+        return frame
+
+    def __iter__(self):
+        for frame_num in range(self.num_frames):
+            yield self.render(frame_num)
+
+    def frames(self):
+        return list(self)
+
+    def write(self, path, codec="auto"):
+        """Save the clip as a video file (for the whole-pipeline entry points)."""
+        from utils import save_video
+        save_video(iter(self), path, fps=self.fps, codec=codec)
+        return path
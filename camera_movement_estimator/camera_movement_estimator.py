@@ -2,14 +2,31 @@ import pickle
 import cv2
 import numpy as np
 import os
-from utils import measure_distance,measure_xy_distance, get_foot_position
+from utils import FrameCache
+from config import CAMERA_MOVEMENT_METHOD, CAMERA_MOVEMENT_DOWNSCALE_LEVEL
+from annotation_renderer import frame_renderer, LAYER_BACKGROUND, LAYER_BACKGROUND_TEXT
 
 # Estimates camera movement between frames using optical flow tracking
 # This helps compensate for camera panning/movement when tracking objects
 class CameraMovementEstimator():
-    def __init__(self,frame):
-        # Initialize camera movement detection parameters
-        self.minimum_distance = 5
+    # Feature mask columns, as (start, end) fractions of the frame width. These are the
+    # left edge (0:20) and the 900:1050 band of the 1920px broadcast feed they were tuned on
+    mask_columns = ((0 / 1920, 20 / 1920), (900 / 1920, 1050 / 1920))
+
+    def __init__(self,frame, method=CAMERA_MOVEMENT_METHOD, downscale_level=CAMERA_MOVEMENT_DOWNSCALE_LEVEL):
+        # "max": legacy single fastest feature at full resolution
+        # "median" / "ransac": robust global motion of all tracked features, on a downscaled frame
+        if method not in ("max", "median", "ransac"):
+            raise ValueError(f"Unknown camera movement method '{method}'")
+        self.method = method
+
+        # Initialize camera movement detection parameters (in full resolution pixels)
+        # The robust methods follow their features frame to frame, so they need no big dead zone
+        self.minimum_distance = 5 if method == "max" else 0.5
+        self.downscale_level = 0 if method == "max" else downscale_level
+        self.scale = 2 ** self.downscale_level
+        # Re-detect features when fewer than this many are still tracked
+        self.min_tracked_features = 10
 
         # Lucas-Kanade optical flow parameters for tracking features
         self.lk_params = dict(
@@ -20,10 +37,11 @@ class CameraMovementEstimator():
 
         # Create a mask to focus on edge areas where camera movement is most detectable
         # We track features on the left and right edges of the frame
-        first_frame_grayscale = cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY)
-        mask_features = np.zeros_like(first_frame_grayscale)
-        mask_features[:,0:20] = 1
-        mask_features[:,900:1050] = 1
+        # (only the frame size is needed, so no grayscale conversion here)
+        height, width = frame.shape[0] // self.scale, frame.shape[1] // self.scale
+        mask_features = np.zeros((height, width), dtype=np.uint8)
+        for start, end in self.mask_columns:
+            mask_features[:, int(round(start * width)):max(int(round(end * width)), int(round(start * width)) + 1)] = 1
 
         # Parameters for detecting good features to track
         self.features = dict(
@@ -34,6 +52,14 @@ class CameraMovementEstimator():
             mask = mask_features
         )
 
+    def to_gray(self, frame):
+        # Grayscale at the working resolution (FrameCache.gray(frame_num, downscale_level) is the same)
+        frame_gray = cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY)
+        for _ in range(self.downscale_level):
+            frame_gray = cv2.resize(frame_gray, (max(1, frame_gray.shape[1] // 2), max(1, frame_gray.shape[0] // 2)),
+                                    interpolation=cv2.INTER_AREA)
+        return frame_gray
+
     def add_adjust_positions_to_tracks(self, tracks, camera_movement_per_frame):
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
@@ -49,7 +75,88 @@ class CameraMovementEstimator():
                     )
                     tracks[object][frame_num][track_id]['position_adjusted'] = position_adjusted
 
-    def get_camera_movement(self,frames,read_from_stub=False, stub_path=None):
+    @staticmethod
+    def add_adjust_positions_to_table(table, camera_movement_per_frame):
+        # Columnar add_adjust_positions_to_tracks
+        movement = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        table['position_adjusted'] = table['position'] - movement[table.frame]
+
+    def reset(self, frame, frame_gray=None):
+        # Use this frame as the reference for the next update() call
+        # frame_gray can come from a shared FrameCache to skip the conversion
+        self.old_gray = self.to_gray(frame) if frame_gray is None else frame_gray
+        self.old_features = cv2.goodFeaturesToTrack(self.old_gray,**self.features)
+
+    def update(self, frame, frame_gray=None):
+        # Camera movement between the previous frame and this one (streaming friendly)
+        if frame_gray is None:
+            frame_gray = self.to_gray(frame)
+
+        if self.old_features is None or len(self.old_features) == 0:
+            self.reset(frame, frame_gray)
+            return [0,0]
+
+        # Track features from previous frame to current frame using optical flow
+        new_features, status,_ = cv2.calcOpticalFlowPyrLK(self.old_gray,frame_gray,self.old_features,None,**self.lk_params)
+
+        # Displacement of every feature at once, in full resolution pixels
+        old_points = self.old_features.reshape(-1, 2)
+        new_points = new_features.reshape(-1, 2)
+        displacement = (old_points - new_points) * self.scale
+
+        if self.method == "max":
+            # Find the feature that moved the most - this indicates camera movement
+            distances = np.hypot(displacement[:, 0], displacement[:, 1])
+            fastest = int(np.argmax(distances))
+            max_distance = distances[fastest]
+            camera_movement_x, camera_movement_y = displacement[fastest].tolist()
+            tracked = len(distances)
+        else:
+            tracked_mask = status.ravel() == 1
+            tracked = int(tracked_mask.sum())
+            camera_movement_x, camera_movement_y = self.estimate_global_motion(
+                old_points[tracked_mask], new_points[tracked_mask], displacement[tracked_mask], frame_gray.shape)
+            max_distance = np.hypot(camera_movement_x, camera_movement_y)
+
+        movement = [0,0]
+        # Only register movement if it's significant enough
+        if max_distance > self.minimum_distance:
+            movement = [float(camera_movement_x),float(camera_movement_y)]
+
+        if self.method == "max":
+            if movement != [0,0]:
+                self.old_features = cv2.goodFeaturesToTrack(frame_gray,**self.features)
+        elif tracked < self.min_tracked_features:
+            self.old_features = cv2.goodFeaturesToTrack(frame_gray,**self.features)
+        else:
+            # Keep following the same features where they are now; they drift out of the
+            # mask with the pan and get replaced once too few are left
+            self.old_features = new_features[status.ravel() == 1]
+
+        # Grayscale frames are never modified, so no copy is needed
+        self.old_gray = frame_gray
+        return movement
+
+    def estimate_global_motion(self, old_points, new_points, displacement, shape):
+        """Robust camera motion (old - new, full resolution) from all tracked features."""
+        if len(displacement) == 0:
+            return 0.0, 0.0
+
+        if self.method == "ransac" and len(displacement) >= 3:
+            # Partial affine (translation, rotation, uniform scale) from new to old positions;
+            # the camera movement is how the frame center moves under it
+            matrix, _ = cv2.estimateAffinePartial2D(new_points, old_points, method=cv2.RANSAC,
+                                                    ransacReprojThreshold=1.0)
+            if matrix is not None:
+                center = np.array([shape[1] / 2, shape[0] / 2])
+                moved_center = matrix[:, :2] @ center + matrix[:, 2]
+                return tuple((moved_center - center) * self.scale)
+
+        # Median displacement ignores the players moving in front of the camera
+        return tuple(np.median(displacement, axis=0))
+
+    def get_camera_movement(self,frames,read_from_stub=False, stub_path=None, frame_cache=None, progress=None):
+        # progress(stage, done, total) is called every frame
         # Load pre-calculated camera movement if available
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             with open(stub_path,'rb') as f:
@@ -59,35 +166,17 @@ class CameraMovementEstimator():
         camera_movement = [[0,0]]*len(frames)
 
         # Start with the first frame and detect good features to track
-        old_gray = cv2.cvtColor(frames[0],cv2.COLOR_BGR2GRAY)
-        old_features = cv2.goodFeaturesToTrack(old_gray,**self.features)
+        if frame_cache is None:
+            frame_cache = FrameCache(frames, max_frames=2)
+        self.reset(frames[0], frame_cache.gray(0, self.downscale_level))
 
         # Process each subsequent frame to detect camera movement
         for frame_num in range(1,len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num],cv2.COLOR_BGR2GRAY)
-            # Track features from previous frame to current frame using optical flow
-            new_features, _,_ = cv2.calcOpticalFlowPyrLK(old_gray,frame_gray,old_features,None,**self.lk_params)
-
-            max_distance = 0
-            camera_movement_x, camera_movement_y = 0,0
+            camera_movement[frame_num] = self.update(frames[frame_num],
+                                                     frame_cache.gray(frame_num, self.downscale_level))
+            if progress is not None:
+                progress("Camera movement", frame_num + 1, len(frames))
 
-            # Find the feature that moved the most - this indicates camera movement
-            for i, (new,old) in enumerate(zip(new_features,old_features)):
-                new_features_point = new.ravel()
-                old_features_point = old.ravel()
-
-                distance = measure_distance(new_features_point,old_features_point)
-                if distance>max_distance:
-                    max_distance = distance
-                    camera_movement_x,camera_movement_y = measure_xy_distance(old_features_point, new_features_point ) 
-            
-            # Only register movement if it's significant enough
-            if max_distance > self.minimum_distance:
-                camera_movement[frame_num] = [camera_movement_x,camera_movement_y]
-                old_features = cv2.goodFeaturesToTrack(frame_gray,**self.features)
-
-            old_gray = frame_gray.copy()
-        
         # Save results for future use
         if stub_path is not None:
             with open(stub_path,'wb') as f:
@@ -101,18 +190,19 @@ class CameraMovementEstimator():
 
         for frame_num, frame in enumerate(frames):
             frame= frame.copy()
+            frame = self.draw_frame_camera_movement(frame, camera_movement_per_frame[frame_num])
+            output_frames.append(frame) 
 
-            # Create a semi-transparent overlay for the text background
-            overlay = frame.copy()
-            cv2.rectangle(overlay,(0,0),(500,100),(255,255,255),-1)
-            alpha =0.6
-            cv2.addWeighted(overlay,alpha,frame,1-alpha,0,frame)
+        return output_frames
 
-            # Display the camera movement values on the frame
-            x_movement, y_movement = camera_movement_per_frame[frame_num]
-            frame = cv2.putText(frame,f"Camera Movement X: {x_movement:.2f}",(10,30), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
-            frame = cv2.putText(frame,f"Camera Movement Y: {y_movement:.2f}",(10,60), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
+    def draw_frame_camera_movement(self, frame, camera_movement, renderer=None):
+        x_movement, y_movement = camera_movement
+        with frame_renderer(frame, renderer) as r:
+            # Semi-transparent panel behind the text
+            r.rectangle((0,0),(500,100),(255,255,255),-1, alpha=0.6, layer=LAYER_BACKGROUND)
 
-            output_frames.append(frame) 
+            # Display the camera movement values on the frame
+            r.text(f"Camera Movement X: {x_movement:.2f}",(10,30),(0,0,0),1,3, layer=LAYER_BACKGROUND_TEXT)
+            r.text(f"Camera Movement Y: {y_movement:.2f}",(10,60),(0,0,0),1,3, layer=LAYER_BACKGROUND_TEXT)
 
-        return output_frames
\ No newline at end of file
+        return frame
@@ -6,23 +6,114 @@
 MODEL_PATH = "./models/best.pt"
 CONFIDENCE_THRESHOLD = 0.1
 BATCH_SIZE = 20
+PIPELINE_QUEUE_SIZE = 4    # items each pipeline thread (decode, inference, analysis) may run ahead
+PIPELINE_QUEUE_FRAMES = BATCH_SIZE  # decoded frames the streaming decode / inference queues may each hold
+
+# --- Inference Backend --- #
+# "pytorch" runs MODEL_PATH through ultralytics; "onnx" / "onnx-int8" run its ONNX export
+# (models/best.onnx, models/best.int8.onnx) with ONNX Runtime - see validate_backend.py
+DETECTOR_BACKEND = "pytorch"
+INFERENCE_IMGSZ = 640        # detector input size (multiple of 32); smaller is faster, misses small objects
+ONNX_THREADS = 0             # ONNX Runtime intra-op threads, 0 = one per core
+ONNX_NMS_IOU = 0.7           # same NMS as ultralytics
+ONNX_MAX_DETECTIONS = 300
+MODEL_WARMUP = True          # one blank inference when a model is first loaded (see trackers/registry.py)
+
+# --- Detection Schedule ("Detail Level") --- #
+# Fast / Balanced run the detector on keyframes only and move boxes along with optical flow in
+# between. A frame also becomes a keyframe when it differs from the previous one by more than
+# motion_threshold (mean 0-255 difference) or its boxes kept < min_track_quality of their flow points.
+DETAIL_LEVEL = "Full"
+DETECTION_SCHEDULES = {
+    "Fast": {"keyframe_interval": 6, "motion_threshold": 20.0, "min_track_quality": 0.5},
+    "Balanced": {"keyframe_interval": 3, "motion_threshold": 12.0, "min_track_quality": 0.7},
+    "Full": {"keyframe_interval": 1},
+}
+
+# --- Ball Recovery --- #
+# Frames without a confident ball get a second, ball-only pass on a small tile around where
+# the ball should be, at a higher input size; after long losses the whole frame is swept in tiles
+BALL_RECOVERY = True
+BALL_MIN_CONFIDENCE = 0.3     # balls below this confidence count as missing
+BALL_TILE_SIZE = 320          # tile side in frame pixels (grows up to 2x while the ball stays lost)
+BALL_TILE_IMGSZ = 640         # inference size for tiles, i.e. a 2x upscale of a 320 tile
+BALL_SWEEP_AFTER = 24         # frames without a ball before sweeping the whole frame
+BALL_SWEEP_INTERVAL = 12      # and then at most one sweep every this many frames
+
+# --- Ball Trajectory --- #
+# Detections that would need the ball to move faster than BALL_MAX_SPEED are cut into runs;
+# short runs in between are dropped as false positives before the gaps are interpolated
+BALL_MAX_SPEED = 50               # px per frame between two detections
+BALL_OUTLIER_MAX_RUN = 3          # detections in a run that can still be rejected as a false positive
+BALL_SMOOTHING = False            # constant-velocity Kalman smoothing of the interpolated trajectory
+BALL_SMOOTHING_NOISE_RATIO = 0.1  # process / measurement noise; higher follows the detections more closely
 
 # --- Video I/O --- #
 INPUT_VIDEO_PATH = "./input_videos/input_4.mp4"
 OUTPUT_VIDEO_PATH = "./output_videos/output_video_4.avi"
+VIDEO_CODEC = "auto"          # "auto" (H.264 for .mp4 if ffmpeg is found, XVID otherwise), "h264", "xvid", "mp4v", "mjpg"
+FFMPEG_PATH = None            # ffmpeg for "h264"; None = PATH, then imageio-ffmpeg
+H264_CRF = 23                 # quality (lower is better / bigger)
+H264_PRESET = "veryfast"
 
 # --- Stubs (for caching detections & movement) --- #
 STUB_PATH = "stubs/track_stubs_new_4.pkl"
 CAMERA_MOVEMENT_STUB = "stubs/camera_movement_stub_4.pkl"
+TRACK_CACHE_DIR = "stubs"                  # one directory of .npy columns per video + tracker config
+TRACK_CACHE_MAX_BYTES = 2 * 1024 ** 3      # least recently used entries are evicted past this
+TRACK_CACHE_FULL_HASH = False              # also MD5 the whole video (slow) instead of size/mtime/samples
+STAGE_CACHE_DIR = "stubs/stages"           # per-stage results, keyed by their inputs and parameters
+STAGE_CACHE_MAX_BYTES = 1024 ** 3          # least recently used stage results are evicted past this
 
 # --- Processing --- #
 TEST_FRAMES_LIMIT = 30
-FPS = 24
+FPS = 24                           # fallback when the video file doesn't report its frame rate
+STREAMING_MODE = False             # stream frames through the pipeline instead of loading the whole video
+BALL_INTERPOLATION_MAX_GAP = 48    # longest ball gap (frames) that gets interpolated / a streaming stage holds back
+FRAME_CACHE_SIZE = 32              # frames whose grayscale / downscaled versions are kept
+
+# --- Annotation --- #
+SPRITE_CACHE_SIZE = 2048           # pre-rasterized marker / label sprites kept (a few KB each)
+
+# --- Jobs (dashboard queue) --- #
+JOB_WORKERS = 1                    # analyses running at the same time (each one holds a model and a video)
+JOB_MAX_QUEUED = 4                 # jobs waiting beyond that before new ones are turned away
+JOB_OUTPUT_DIR = "output_videos/jobs"  # one subdirectory per job
+JOB_POLL_INTERVAL = 0.5            # seconds between progress updates sent to the UI
+
+# --- Batch CLI (batch.py) --- #
+BATCH_OUTPUT_DIR = "output_videos/batch"   # annotated videos + one JSON summary per input
+BATCH_WORKER_MEMORY = 2 * 1024 ** 3        # bytes a worker needs besides its decoded frames (model, buffers)
+
+# --- Metrics / Profiling --- #
+METRICS_PREFIX = "football"   # Prometheus metric names: football_stage_wall_seconds, ...
+PROFILE_STAGE = None          # stage to run under the sampling profiler ("tracks", "teams", "render", ...), None = off
+                              # samples only the stage's own thread: inference / decode prefetch, team color
+                              # pool and encoder threads are not in the profile (see the latency metrics)
+PROFILE_INTERVAL = 0.005      # seconds between profiler samples
+
+# --- Camera Movement --- #
+CAMERA_MOVEMENT_METHOD = "median"      # "max" (legacy fastest feature), "median" or "ransac"
+CAMERA_MOVEMENT_DOWNSCALE_LEVEL = 1    # optical flow on a 1 / 2**level frame (ignored by "max")
 
 # --- Team Assignment --- #
 KMEANS_CLUSTERS = 2
 KMEANS_INIT = "k-means++"
 KMEANS_N_INIT = 10
+TEAM_SAMPLES_PER_TRACK = 5       # appearances per track used for the team vote
+TEAM_COLOR_WORKERS = 4           # threads extracting jersey colors
+GOALKEEPER_OUTLIER_FACTOR = 3.0  # colors this many median distances from both teams are goalkeepers
+TEAM_STREAMING_WARMUP = 12       # frames the streaming pipeline holds back to fit the team colors
+
+# --- Ball Assignment --- #
+PLAYER_BALL_MAX_DISTANCE = 70    # pixels between the ball and a player's foot to count as possession
+POSSESSION_MIN_FRAMES = 3        # frames a new player must be closest before possession switches to them
+
+# --- Kinematics (speed / distance) --- #
+KINEMATICS_SMOOTHING_WINDOW = 5    # frames in the centered moving average of court positions (1 = off)
+KINEMATICS_MAX_GAP = 12            # frames a player may go unseen without breaking their track
+SPRINT_SPEED = 25.0                # km/h
+SPRINT_MIN_DURATION = 1.0          # seconds above SPRINT_SPEED to count as a sprint
 
 # --- Drawing (OpenCV Config) --- #
 ELLIPSE_THICKNESS = 3
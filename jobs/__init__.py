@@ -0,0 +1 @@
+from .job_queue import Job, JobQueue, JobCancelled, JobRejected
@@ -0,0 +1,193 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from config import JOB_WORKERS, JOB_MAX_QUEUED, JOB_OUTPUT_DIR, JOB_POLL_INTERVAL
+from utils import Metrics
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work (from its progress callback) once it was cancelled."""
+
+
+class JobRejected(Exception):
+    """The queue is full; try again later."""
+
+
+class Job:
+    """
+    One analysis run: its status, progress and result. The work reports progress through
+    job.progress(stage, done, total), which is also where cancellation takes effect -
+    the call raises JobCancelled and unwinds the pipeline (and its worker threads).
+    Every stage of the pipelines reports at least once as it starts and the long ones per
+    frame or batch, so a cancel takes effect within a stage, not only between stages.
+    Stage timings go to job.metrics, written to output_dir however the job ends.
+    """
+
+    def __init__(self, func, args, kwargs, output_root=JOB_OUTPUT_DIR):
+        self.id = uuid.uuid4().hex[:12]
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.output_dir = os.path.join(output_root, self.id)
+
+        self.status = "queued"    # queued -> running -> done / failed / cancelled
+        self.stage = None
+        self.done = 0
+        self.total = None
+        self.stage_started = None
+        self.created = time.time()
+        self.result = None
+        self.error = None
+        self.metrics = Metrics(job=self.id)
+
+        self.cancel_requested = threading.Event()
+        self.finished = threading.Event()
+        self.lock = threading.RLock()
+
+    @property
+    def is_finished(self):
+        return self.finished.is_set()
+
+    def cancel(self):
+        """Stop the job: right away when queued, at its next progress report when running."""
+        with self.lock:
+            self.cancel_requested.set()
+            if self.status == "queued":
+                self._finish("cancelled")
+
+    def progress(self, stage, done=0, total=None):
+        if self.cancel_requested.is_set():
+            raise JobCancelled(self.id)
+        with self.lock:
+            if stage != self.stage:
+                self.stage, self.stage_started = stage, time.time()
+            self.done, self.total = done, total
+
+    def track(self, iterable, stage, total=None):
+        """Yield from iterable, reporting one progress step per item."""
+        self.progress(stage, 0, total)
+        for done, item in enumerate(iterable, start=1):
+            yield item
+            self.progress(stage, done, total)
+
+    @property
+    def eta(self):
+        """Seconds left in the current stage, from its rate so far (None if unknown)."""
+        if not self.total or not self.done or self.stage_started is None:
+            return None
+        elapsed = time.time() - self.stage_started
+        return elapsed / self.done * (self.total - self.done)
+
+    def describe(self):
+        """One status line for the UI."""
+        if self.status == "queued":
+            return "⏳ Queued..."
+        if self.status != "running":
+            return {"done": "✅ Done", "failed": f"❌ Failed: {self.error}", "cancelled": "🛑 Cancelled"}[self.status]
+        text = f"⚙️ {self.stage or 'Starting'}"
+        if self.total:
+            text += f": {self.done}/{self.total} frames ({100 * self.done / self.total:.0f}%)"
+            if self.eta is not None:
+                text += f", ~{self.eta:.0f}s left"
+        return text
+
+    def updates(self, interval=JOB_POLL_INTERVAL):
+        """Yield the job (for describe() / result) every interval it changed, until it is finished."""
+        last = None
+        while True:
+            with self.lock:
+                state = (self.status, self.stage, self.done)
+            if state != last:
+                last = state
+                yield self
+            if self.is_finished:
+                return
+            self.finished.wait(interval)
+
+    def run(self):
+        with self.lock:
+            if self.is_finished:
+                return
+            self.status = "running"
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.result = self.func(self, *self.args, **self.kwargs)
+            self._finish("done")
+        except JobCancelled:
+            self._finish("cancelled")
+        except Exception as error:
+            self.error = error
+            self._finish("failed")
+
+    def _finish(self, status):
+        with self.lock:
+            ran = self.status == "running"
+            self.status = status
+        try:
+            # Before finished is set, so whoever waits on the job finds them (none if it never ran)
+            if ran:
+                self.metrics.write(self.output_dir)
+        except Exception as error:
+            print(f"[WARN] Could not write the metrics of job {self.id}: {error}")
+        finally:
+            # Always, or updates() would wait forever
+            self.finished.set()
+
+
+class JobQueue:
+    """
+    Fixed pool of worker threads running Jobs in submission order. Admission control:
+    at most `workers` jobs run and `max_queued` wait; submit() raises JobRejected beyond that.
+
+        jobs = JobQueue()
+        job = jobs.submit(run_analysis, video_path)    # run_analysis(job, video_path)
+        for job in job.updates():
+            print(job.describe())
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, output_root=JOB_OUTPUT_DIR):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.output_root = output_root
+        self.pending = queue.Queue()
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self.pending.get()
+            job.run()
+
+    def active(self):
+        with self.lock:
+            return [job for job in self.jobs.values() if not job.is_finished]
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(job, *args, **kwargs) and return its Job."""
+        with self.lock:
+            active = sum(1 for job in self.jobs.values() if not job.is_finished)
+            if active >= self.workers + self.max_queued:
+                raise JobRejected(f"{active} jobs already running or queued")
+            job = Job(func, args, kwargs, self.output_root)
+            self.jobs[job.id] = job
+            # Finished jobs are only kept for lookups by id; their files stay in output_dir
+            for job_id in [job_id for job_id, other in self.jobs.items() if other.is_finished][:-100]:
+                del self.jobs[job_id]
+        self.pending.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
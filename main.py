@@ -1,88 +1,102 @@
 import gradio as gr
 import os
-from utils import read_video, save_video
-from trackers import Tracker
+from utils import iter_video, save_video, get_video_frame_count, FrameCache
+from trackers import Tracker, model_registry
 from config import *
-from speed_distance_estimator import SpeedDistanceEstimator
-from team_assigner import TeamAssigner
-from player_ball_assigner import PlayerBallAssigner
+from player_ball_assigner import PossessionStats
 from camera_movement_estimator import CameraMovementEstimator
-from view_transformer import ViewTransformer
+from pipeline import StreamingPipeline, AnalysisPipeline
+from annotation_renderer import iter_video_annotations
+from speed_distance_estimator import player_stats_rows
+from jobs import JobQueue, JobRejected
+
+
+def build_possession_summary(possession):
+    # Team ids are 1 and 2; frames before anyone had the ball (-1) are left out
+    shares = possession.percentages((1, 2))
+    team1_possession = int(shares[1])
+    team2_possession = 100 - team1_possession if any(shares.values()) else 0
+    return f"Team 1: {team1_possession}% | Team 2: {team2_possession}%"
+
+
+def run_analysis(job, video_file, detail_level):
+    """The analysis of one job, run on a queue worker; its files go to job.output_dir."""
+    output_path = os.path.join(job.output_dir, "processed_output.mp4")
+
+    # Bounded-memory mode: frames flow through every stage without being kept around
+    if STREAMING_MODE:
+        summary = StreamingPipeline(MODEL_PATH, detail_level).run(video_file, output_path, progress=job.progress,
+                                                                  metrics=job.metrics)
+        possession_summary = build_possession_summary(summary["possession"])
+        status = f"✅ Processing complete! {summary['schedule_report'].summary()}"
+        return output_path, status, possession_summary, summary["player_stats"]
+
+    total = get_video_frame_count(video_file)
+    with job.metrics.stage("decode", items=total):
+        video_frames = list(job.track(iter_video(video_file), "Decoding", total))
+    # Detail level picks the detection schedule: Full runs YOLO on every frame, Balanced / Fast on keyframes
+    tracker = Tracker(MODEL_PATH, detail_level)
+
+    # Steps 1-5: tracking, camera correction, positions, teams, ball possession, speed & distance
+    # (each stage is cached per video and reruns only when its inputs or settings change)
+    frame_cache = FrameCache(video_frames, max_frames=FRAME_CACHE_SIZE)
+    pipeline = AnalysisPipeline(tracker)
+    analysis = pipeline.run(video_file, video_frames, frame_cache, progress=job.progress, metrics=job.metrics)
+    tracks = analysis["table"].as_tracks()
+    team_ball_control = analysis["ball_possession"]
 
+    # Step 6: Draw video
+    camera_estimator = CameraMovementEstimator(video_frames[0])
+    output_frames = iter_video_annotations(video_frames, camera_estimator, analysis["camera_movement"],
+                                           tracker, tracks, team_ball_control, pipeline.speed_distance_estimator)
 
-def process_video(video_file, show_boxes, show_ids, show_ball_control, show_speed, detail_level, conf_threshold):
-    """Main video processing pipeline, wrapped for Gradio."""
-    if video_file is None:
-        return None, "❌ Please upload a video first.", None, None
+    with job.metrics.stage("render", items=len(video_frames)):
+        save_video(job.track(output_frames, "Rendering video", len(video_frames)), output_path, fps=analysis["fps"])
 
-    video_frames = read_video(video_file)
-    tracker = Tracker(MODEL_PATH)
+    # === Build Summary === #
+    possession_summary = build_possession_summary(PossessionStats(team_ball_control))
 
-    # Step 1: Tracking
-    tracks = tracker.get_object_tracks(video_frames, video_file)
-    tracks['ball'] = tracker.interpolate_ball_positions(tracks['ball'])
-    tracker.add_position_to_tracks(tracks)
+    # Per-player stats: distance, average / max speed and sprints of every track
+    player_stats = player_stats_rows(analysis["speed_distance"], analysis["teams"])
 
-    # Step 2: Camera correction
-    camera_estimator = CameraMovementEstimator(video_frames[0])
-    camera_movement_per_frame = camera_estimator.get_camera_movement(video_frames)
-    camera_estimator.add_adjust_positions_to_tracks(tracks, camera_movement_per_frame)
-
-    # Step 3: Team assignment
-    team_assigner = TeamAssigner()
-    team_assigner.assign_team_color(video_frames[0], tracks['players'][0])
-    for frame_num, players in enumerate(tracks['players']):
-        for pid, player in players.items():
-            team_id = team_assigner.get_player_team(video_frames[frame_num], player['bbox'], pid)
-            player['team_id'] = team_id
-            player['team_color'] = team_assigner.team_colors[team_id]
-
-    # Step 4: Ball assignment
-    assigner = PlayerBallAssigner()
-    team_ball_control = []
-    for frame_num, players in enumerate(tracks['players']):
-        ball_dict = tracks['ball'][frame_num]
-        if 1 not in ball_dict:
-            team_ball_control.append(team_ball_control[-1] if team_ball_control else -1)
-            continue
-        ball_bbox = ball_dict[1]['bbox']
-        assigned_player = assigner.assign_ball_to_player(players, ball_bbox)
-        if assigned_player != -1:
-            players[assigned_player]['has_ball'] = True
-            team_ball_control.append(players[assigned_player]['team_id'])
-        else:
-            team_ball_control.append(team_ball_control[-1] if team_ball_control else -1)
-
-    # Step 5: Speed & Distance
-    speed_distance_estimator = SpeedDistanceEstimator()
-    speed_distance_estimator.add_speed_and_distance_to_tracks(tracks)
+    status = f"✅ Processing complete! {tracker.schedule_report.summary()}"
+    return output_path, status, possession_summary, player_stats
 
-    # Step 6: Draw video
-    output_frames = camera_estimator.draw_camera_movement(video_frames, camera_movement_per_frame)
-    output_frames = tracker.draw_annotations(output_frames, tracks, team_ball_control)
-    output_frames = speed_distance_estimator.draw_speed_and_distance(output_frames, tracks)
 
-    output_path = "processed_output.mp4"
-    save_video(output_frames, output_path)
+def process_video(video_file, show_boxes, show_ids, show_ball_control, show_speed, detail_level, conf_threshold):
+    """
+    Queue the analysis and stream its progress to the UI (a Gradio generator): yields
+    (video, status, possession, player stats, job id) until the job is finished.
+    """
+    if video_file is None:
+        yield None, "❌ Please upload a video first.", None, None, None
+        return
 
-    # === Build Summary === #
-    team1_possession = int(100 * team_ball_control.count(0) / len(team_ball_control)) if team_ball_control else 0
-    team2_possession = 100 - team1_possession
-    possession_summary = f"Team 1: {team1_possession}% | Team 2: {team2_possession}%"
+    try:
+        job = job_queue.submit(run_analysis, video_file, detail_level)
+    except JobRejected:
+        yield None, "❌ The server is busy, please try again in a few minutes.", None, None, None
+        return
+
+    try:
+        for job in job.updates():
+            if job.status == "done":
+                output_path, status, possession_summary, player_stats = job.result
+                yield output_path, status, possession_summary, player_stats, job.id
+            else:
+                yield None, job.describe(), None, None, job.id
+    finally:
+        # The page was closed or the event cancelled: stop the job instead of finishing it for nobody
+        job.cancel()
+
+
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id) if job_id else None
+    return "🛑 Cancelling..." if job is not None and not job.is_finished else "Nothing to cancel."
 
-    # Per-player stats
-    player_stats = []
-    for frame_players in tracks['players']:
-        for pid, pdata in frame_players.items():
-            if "distance" in pdata and "speed" in pdata:
-                player_stats.append({
-                    "Player ID": pid,
-                    "Team": pdata.get("team_id", "-"),
-                    "Distance (m)": round(pdata.get("distance", 0), 2),
-                    "Avg Speed (km/h)": round(pdata.get("speed", 0), 2),
-                })
 
-    return output_path, "✅ Processing complete!", possession_summary, player_stats
+# Analyses run on a small pool of workers; each job writes to its own directory
+job_queue = JobQueue()
 
 
 # Gradio UI
@@ -100,19 +114,26 @@ with gr.Blocks(title="⚽ Football Analysis Dashboard") as demo:
             detail_level = gr.Dropdown(["Fast", "Balanced", "Full"], label="Detail Level", value="Balanced")
             conf_threshold = gr.Slider(0.1, 1.0, 0.5, step=0.05, label="Confidence Threshold")
             run_btn = gr.Button("🚀 Run Analysis", variant="primary")
+            cancel_btn = gr.Button("🛑 Cancel")
 
         with gr.Column(scale=2):
             output_video = gr.Video(label="🎥 Processed Video")
             status = gr.Textbox(label="ℹ️ Status", interactive=False)
             possession_summary = gr.Textbox(label="📊 Ball Possession", interactive=False)
-            player_stats = gr.Dataframe(headers=["Player ID", "Team", "Distance (m)", "Avg Speed (km/h)"],
+            player_stats = gr.Dataframe(headers=["Player ID", "Team", "Distance (m)", "Avg Speed (km/h)",
+                                                 "Max Speed (km/h)", "Sprints"],
                                         label="🏃 Player Stats")
 
-    run_btn.click(
+    job_id = gr.State(None)
+    run_event = run_btn.click(
         fn=process_video,
         inputs=[input_video, show_boxes, show_ids, show_ball_control, show_speed, detail_level, conf_threshold],
-        outputs=[output_video, status, possession_summary, player_stats]
+        outputs=[output_video, status, possession_summary, player_stats, job_id]
     )
+    cancel_btn.click(fn=cancel_job, inputs=job_id, outputs=status, cancels=[run_event])
 
 if __name__ == "__main__":
-    demo.launch()
+    # Load and warm the detector before the first upload instead of during it
+    model_registry.detector()
+    # Every waiting job keeps a UI connection open to stream its progress
+    demo.queue(default_concurrency_limit=JOB_WORKERS + JOB_MAX_QUEUED).launch()
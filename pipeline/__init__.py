@@ -0,0 +1,3 @@
+from .streaming import StreamingPipeline
+from .stage_graph import StageGraph, StageCache
+from .analysis import AnalysisPipeline
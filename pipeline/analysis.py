@@ -0,0 +1,124 @@
+from config import *
+from utils import FrameCache, Metrics, get_video_fps
+from trackers import Tracker, video_fingerprint
+from team_assigner import TrackTeamAssigner
+from player_ball_assigner import PlayerBallAssigner
+from camera_movement_estimator import CameraMovementEstimator
+from view_transformer import ViewTransformer
+from speed_distance_estimator import SpeedDistanceEstimator, Kinematics
+from .stage_graph import StageGraph
+
+
+class AnalysisPipeline:
+    """
+    The whole-video analysis as a StageGraph: tracking, camera movement, positions,
+    teams, ball possession and kinematics (speed / distance). Every stage but tracking (which has its
+    own track cache) is cached per video, so rerunning with one setting changed only
+    recomputes the stages downstream of it.
+
+        pipeline = AnalysisPipeline(tracker)
+        pipeline.ball_assigner.max_player_ball_distance = 50
+        result = pipeline.run(video_path, video_frames)   # only ball_possession reruns
+    """
+
+    def __init__(self, tracker=None, model_path=MODEL_PATH, cache=None):
+        self.tracker = tracker if tracker is not None else Tracker(model_path)
+        self.view_transformer = ViewTransformer()
+        self.team_assigner = TrackTeamAssigner()
+        self.ball_assigner = PlayerBallAssigner()
+        # Kinematics computes speed / distance, the estimator draws them
+        self.kinematics = Kinematics()
+        self.speed_distance_estimator = SpeedDistanceEstimator()
+        # Settings of the camera stage; the estimator itself needs the first frame
+        self.camera_method = CAMERA_MOVEMENT_METHOD
+        self.camera_downscale_level = CAMERA_MOVEMENT_DOWNSCALE_LEVEL
+
+        graph = StageGraph(cache)
+        graph.add("tracks", self.track_objects, inputs=["video"], cache=False,
+                  params=lambda: {**self.tracker.track_cache_config(),
+                                  "ball_trajectory": self.tracker.ball_trajectory.as_config()})
+        graph.add("camera_movement", self.estimate_camera_movement, inputs=["video"],
+                  params=lambda: {"method": self.camera_method, "downscale_level": self.camera_downscale_level})
+        graph.add("positions", self.compute_positions, inputs=["tracks", "camera_movement"],
+                  columns=["position", "position_adjusted", "position_transformed"],
+                  params=lambda: {"pixel_vertices": self.view_transformer.pixel_vertices.tolist(),
+                                  "target_vertices": self.view_transformer.target_vertices.tolist()})
+        graph.add("teams", self.assign_teams, inputs=["video", "tracks"],
+                  columns=["team_id"], attributes=["team_colors"],
+                  params=lambda: {"samples_per_track": self.team_assigner.samples_per_track,
+                                  "max_overlap": self.team_assigner.max_overlap,
+                                  "outlier_factor": self.team_assigner.outlier_factor})
+        graph.add("ball_possession", self.assign_ball, inputs=["tracks", "teams"], columns=["has_ball"],
+                  params=lambda: {"max_player_ball_distance": self.ball_assigner.max_player_ball_distance,
+                                  "min_possession_frames": self.ball_assigner.min_possession_frames})
+        graph.add("speed_distance", self.compute_speed_and_distance, inputs=["positions"],
+                  columns=["speed", "acceleration", "distance"], params=lambda: self.kinematics.as_config())
+        self.graph = graph
+
+    # ---------------- STAGES ---------------- #
+
+    def track_objects(self, context):
+        table = self.tracker.get_track_table(context["frames"], context["video_path"],
+                                             progress=context.get("progress"), metrics=context["metrics"])
+        context["table"] = self.tracker.interpolate_ball_positions(table)
+        return len(context["table"])
+
+    def estimate_camera_movement(self, context):
+        frames = context["frames"]
+        estimator = CameraMovementEstimator(frames[0], self.camera_method, self.camera_downscale_level)
+        return estimator.get_camera_movement(frames, frame_cache=context["frame_cache"],
+                                             progress=context.get("progress"))
+
+    def compute_positions(self, context):
+        table = context["table"]
+        self.tracker.add_position_to_table(table)
+        CameraMovementEstimator.add_adjust_positions_to_table(table, context["camera_movement"])
+        self.view_transformer.add_transformed_position_to_table(table)
+
+    def assign_teams(self, context):
+        table = context["table"]
+        player_teams = self.team_assigner.assign_teams(context["frames"], table, context.get("progress"))
+
+        players = table.type_mask('players')
+        table['team_id'][players] = [player_teams[track_id] for track_id in table.track_id[players].tolist()]
+        table.filled.add('team_id')
+        table.team_colors = dict(self.team_assigner.team_colors)
+        return player_teams
+
+    def assign_ball(self, context):
+        """Team in control of the ball per frame (last team to have it, -1 before anyone did)."""
+        _, team_ball_control = self.ball_assigner.assign_ball_to_players(context["table"])
+        return team_ball_control.tolist()
+
+    def compute_speed_and_distance(self, context):
+        """Per-player speed / acceleration / distance columns; returns the per-track summaries."""
+        return self.kinematics.add_kinematics_to_table(context["table"])
+
+    # ---------------- RUN ---------------- #
+
+    def run(self, video_path, video_frames, frame_cache=None, targets=None, progress=None, metrics=None):
+        """
+        Analyse video_frames (decoded from video_path) and return the context: the
+        TrackTable under 'table', each stage's value under its name, the video's frame
+        rate under 'fps', which stages were cached or computed under 'report' and the
+        per-stage timings / inference latencies under 'metrics' (a Metrics, new if not given).
+        progress(stage, done=0, total=None) is called as every stage starts, per detection
+        batch and per frame of the camera movement and team color stages; an exception it
+        raises (a cancelled job) aborts the run there.
+        """
+        fps = get_video_fps(video_path)
+        self.kinematics.fps = fps
+        self.speed_distance_estimator.frame_rate = fps
+
+        context = {
+            "fps": fps,
+            "progress": progress,
+            "metrics": metrics if metrics is not None else Metrics(),
+            "video": video_path,
+            "video_path": video_path,
+            "frames": video_frames,
+            "frame_cache": frame_cache if frame_cache is not None else FrameCache(video_frames, max_frames=FRAME_CACHE_SIZE),
+        }
+        source_keys = {"video": f"{video_fingerprint(video_path)}:{len(video_frames)}"}
+        context["report"] = self.graph.run(context, source_keys, targets)
+        return context
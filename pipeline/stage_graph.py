@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from config import STAGE_CACHE_DIR, STAGE_CACHE_MAX_BYTES
+from utils import Metrics
+
+
+class Stage:
+    """
+    One node of a StageGraph: func(context) computes the stage's value from the context
+    (sources plus the values of `inputs`). params is a dict, or a callable returning one
+    so it follows the current settings. A stage may also write TrackTable `columns` /
+    `attributes`; they are cached with the value and restored on a hit.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, columns=(), attributes=(), version=1, cache=True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.columns = tuple(columns)
+        self.attributes = tuple(attributes)
+        self.version = version
+        self.cache = cache
+
+
+class StageCache:
+    """
+    Stage results on disk, one pickle per (stage, key). Like TrackCache, the least
+    recently used results are evicted once the directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=STAGE_CACHE_DIR, max_bytes=STAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}_{key}.pkl")
+
+    def load(self, name, key):
+        path = self.path(name, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+        # Last access time drives eviction
+        os.utime(path)
+        return result
+
+    def save(self, name, key, result):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Written aside and renamed, so an interrupted run never leaves half a result
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp_")
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(name, key))
+        self.evict(keep=self.path(name, key))
+
+    def evict(self, keep=None):
+        """Delete least recently used results until the cache fits in max_bytes."""
+        if self.max_bytes is None or not os.path.isdir(self.cache_dir):
+            return
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".pkl") and not entry.name.startswith(".tmp_"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class StageGraph:
+    """
+    Pipeline stages with declared inputs and parameters. Each result is cached under a hash
+    of the stage's own parameters and the keys of everything upstream, so changing one
+    parameter only reruns that stage and the ones depending on it.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else StageCache()
+        self.stages = {}
+
+    def add(self, name, func, **kwargs):
+        # Inputs that are not stages are sources, passed to run()
+        stage = Stage(name, func, **kwargs)
+        self.stages[name] = stage
+        return stage
+
+    def stage_key(self, name, source_keys, keys):
+        if name in keys:
+            return keys[name]
+        stage = self.stages.get(name)
+        if stage is None:
+            # A source: its key is given by the caller (video fingerprint, ...)
+            keys[name] = source_keys[name]
+            return keys[name]
+
+        upstream = [self.stage_key(input_name, source_keys, keys) for input_name in stage.inputs]
+        params = stage.params() if callable(stage.params) else stage.params
+        payload = json.dumps([name, stage.version, params, upstream], sort_keys=True, default=str)
+        keys[name] = hashlib.md5(payload.encode()).hexdigest()[:16]
+        return keys[name]
+
+    def run(self, context, source_keys, targets=None):
+        """
+        Evaluate targets (every stage by default) and their dependencies. context holds the
+        sources and receives each stage value under the stage name; context['table'] is the
+        TrackTable that stage columns are restored into; context['progress'], if set, is
+        called as progress(stage) before each stage. Each stage is timed (without its inputs)
+        into context['metrics'], a Metrics. Returns {stage: 'cached' | 'computed'}.
+        """
+        keys = {}
+        report = {}
+        metrics = context.setdefault('metrics', Metrics())
+        frames = context.get('frames')
+        num_frames = len(frames) if frames is not None else None
+
+        def evaluate(name):
+            if name in report:
+                return
+            stage = self.stages.get(name)
+            if stage is None:
+                if name not in context:
+                    raise KeyError(f"Missing pipeline source '{name}'")
+                return
+            for input_name in stage.inputs:
+                evaluate(input_name)
+
+            if context.get('progress') is not None:
+                context['progress'](name)
+            key = self.stage_key(name, source_keys, keys)
+            with metrics.stage(name, items=num_frames):
+                cached = self.cache.load(name, key) if stage.cache else None
+                if cached is not None:
+                    value, columns, attributes = cached
+                    table = context.get('table')
+                    for column, values in columns.items():
+                        table[column] = values
+                    for attribute, values in attributes.items():
+                        setattr(table, attribute, values)
+                    report[name] = 'cached'
+                else:
+                    value = stage.func(context)
+                    if stage.cache:
+                        table = context.get('table')
+                        columns = {column: table[column].copy() for column in stage.columns}
+                        attributes = {attribute: getattr(table, attribute) for attribute in stage.attributes}
+                        self.cache.save(name, key, (value, columns, attributes))
+                    report[name] = 'computed'
+            context[name] = value
+
+        for name in targets or list(self.stages):
+            evaluate(name)
+        return report
@@ -0,0 +1,455 @@
+from collections import deque, defaultdict
+import numpy as np
+from config import *
+from utils import iter_video, save_video, get_video_fps, get_video_frame_count, FrameCache, Metrics
+from trackers import Tracker, BallTrajectory, BALL_MISSING, BALL_OBSERVED, BALL_INTERPOLATED
+from team_assigner import TrackTeamAssigner
+from player_ball_assigner import PlayerBallAssigner, PossessionStats
+from camera_movement_estimator import CameraMovementEstimator
+from view_transformer import ViewTransformer
+from speed_distance_estimator import SpeedDistanceEstimator, Kinematics, PositionLog, player_stats_rows
+from annotation_renderer import AnnotationRenderer
+
+
+class FrameRecord:
+    """One frame travelling through the streaming pipeline plus everything derived from it."""
+    __slots__ = ("frame_num", "frame", "tracks", "camera_movement", "team_ball_control")
+
+    def __init__(self, frame_num, frame, tracks):
+        self.frame_num = frame_num
+        self.frame = frame
+        self.tracks = tracks
+        self.camera_movement = [0, 0]
+        self.team_ball_control = -1
+
+    def as_tracks(self):
+        # Single-frame view in the usual tracks[obj_type][frame_num] layout, so the batch
+        # methods of every stage can be reused as-is (the inner dicts are shared, not copied)
+        return {obj_type: [objects] for obj_type, objects in self.tracks.items()}
+
+
+# ---------------- STAGES ---------------- #
+# Every stage is a generator transform over FrameRecords. `lookahead` is the number of
+# frames it may hold back before yielding, so peak memory is bounded by the sum of all
+# lookaheads, whatever the length of the video.
+
+class DetectionStage:
+    name = "detection"
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        # Decoded frames queued for inference, batches queued for tracking, the batch being
+        # detected and the one being tracked
+        self.lookahead = PIPELINE_QUEUE_FRAMES + (tracker.inference_queue_batches() + 2) * BATCH_SIZE
+
+    def __call__(self, frames, metrics=None):
+        for frame_num, (frame, frame_tracks) in enumerate(self.tracker.stream_object_tracks(frames, metrics)):
+            yield FrameRecord(frame_num, frame, frame_tracks)
+
+
+class BallInterpolationStage:
+    """
+    Streaming counterpart of Tracker.interpolate_ball_positions. Each frame is released
+    once the max_gap frames after it have arrived, with the ball BallTrajectory gives it
+    over the max_gap frames either side: outliers dropped, gaps of at most max_gap frames
+    filled (flagged 'interpolated'), longer gaps left without a ball.
+    """
+    name = "ball_interpolation"
+
+    def __init__(self, trajectory=None):
+        self.trajectory = trajectory or BallTrajectory()
+        # A gap any longer can't be filled, so this much context on either side is enough
+        self.max_gap = self.trajectory.max_gap if self.trajectory.max_gap is not None else BALL_INTERPOLATION_MAX_GAP
+        self.lookahead = self.max_gap
+        self.stats = {}
+
+    @staticmethod
+    def _detected_bbox(record):
+        ball = record.tracks['ball'].get(1)
+        return ball['bbox'] if ball is not None else [np.nan] * 4
+
+    def _release(self, pending, history):
+        record, bbox = pending.popleft()
+        window = np.array(list(history) + [bbox] + [b for _, b in pending], dtype=np.float64)
+        bboxes, flags = self.trajectory.process(window)
+        i = len(history)
+        history.append(bbox)
+
+        if flags[i] == BALL_MISSING:
+            record.tracks['ball'] = {}
+        elif flags[i] == BALL_INTERPOLATED:
+            record.tracks['ball'] = {1: {'bbox': bboxes[i].tolist(), 'interpolated': True}}
+        else:
+            record.tracks['ball'] = {1: {'bbox': bboxes[i].tolist()}}
+
+        detected = not np.isnan(window[i]).any() and window[i].any()
+        self.stats["observed"] += int(flags[i] == BALL_OBSERVED)
+        self.stats["rejected"] += int(detected and flags[i] != BALL_OBSERVED)
+        self.stats["interpolated"] += int(flags[i] == BALL_INTERPOLATED)
+        self.stats["missing"] += int(flags[i] == BALL_MISSING)
+        return record
+
+    def __call__(self, records):
+        self.stats = {"observed": 0, "rejected": 0, "interpolated": 0, "missing": 0}
+        pending = deque()                       # (record, detected bbox) not released yet
+        history = deque(maxlen=self.max_gap)    # detected bboxes of the released frames
+
+        for record in records:
+            pending.append((record, self._detected_bbox(record)))
+            if len(pending) > self.lookahead:
+                yield self._release(pending, history)
+
+        while pending:
+            yield self._release(pending, history)
+        print(f"[INFO] Ball trajectory: {self.stats}")
+
+
+class PositionStage:
+    name = "positions"
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.lookahead = 0
+
+    def __call__(self, records):
+        for record in records:
+            self.tracker.add_position_to_tracks(record.as_tracks())
+            yield record
+
+
+class CameraMovementStage:
+    name = "camera_movement"
+
+    def __init__(self, frame_cache):
+        self.estimator = None
+        self.frame_cache = frame_cache
+        self.lookahead = 0
+
+    def __call__(self, records):
+        for record in records:
+            if self.estimator is None:
+                self.estimator = CameraMovementEstimator(record.frame)
+            frame_gray = self.frame_cache.gray(record.frame_num, self.estimator.downscale_level, frame=record.frame)
+            if record.frame_num == 0:
+                self.estimator.reset(record.frame, frame_gray)
+            else:
+                record.camera_movement = self.estimator.update(record.frame, frame_gray)
+            self.estimator.add_adjust_positions_to_tracks(record.as_tracks(), [record.camera_movement])
+            yield record
+
+
+class ViewTransformStage:
+    name = "view_transform"
+
+    def __init__(self):
+        self.view_transformer = ViewTransformer()
+        self.lookahead = 0
+
+    def __call__(self, records):
+        for record in records:
+            self.view_transformer.add_transformed_position_to_tracks(record.as_tracks())
+            yield record
+
+
+class SpeedDistanceStage:
+    name = "speed_distance"
+
+    def __init__(self):
+        self.estimator = SpeedDistanceEstimator()
+        self.lookahead = self.estimator.frame_window
+        self.total_distance = {}
+
+    def _flush(self, window):
+        players = [record.tracks['players'] for record in window]
+        self.estimator.add_speed_and_distance_to_window(players, 0, len(window) - 1, self.total_distance)
+
+    def __call__(self, records):
+        # A window spans frame_window + 1 frames; its last frame starts the next window
+        window = []
+        for record in records:
+            window.append(record)
+            if len(window) == self.estimator.frame_window + 1:
+                self._flush(window)
+                yield from window[:-1]
+                window = window[-1:]
+
+        if window:
+            self._flush(window)
+            yield from window
+
+
+class TeamAssignmentStage:
+    """
+    Streaming counterpart of TrackTeamAssigner. Each track gets up to samples_per_track
+    jersey colors from unoccluded appearances a few frames apart; the first `warmup`
+    frames are held back to fit the team colors on them. A track's team is then the
+    majority vote of its samples so far, and a track whose color fits neither team (a
+    goalkeeper) joins the team whose players stand closest to it in the same frames.
+    """
+    name = "teams"
+
+    def __init__(self, warmup=TEAM_STREAMING_WARMUP):
+        self.team_assigner = TrackTeamAssigner()
+        self.lookahead = warmup
+        # Samples spread over the warmup when a track is there from the start
+        self.sample_spacing = max(1, warmup // self.team_assigner.samples_per_track)
+        self.samples = defaultdict(list)
+        self.last_sample = {}
+        # {track_id: team_id, or None for an outlier} of the samples so far
+        self.track_teams = {}
+        # Outliers: summed horizontal distance to each team's players and frames compared
+        self.team_distance = defaultdict(lambda: np.zeros(2))
+        self.team_frames = defaultdict(lambda: np.zeros(2))
+
+    def sample(self, record):
+        players = record.tracks['players']
+        if not players:
+            return
+        track_ids = list(players)
+        overlaps = self.team_assigner.get_overlaps([players[pid]['bbox'] for pid in track_ids])
+        picked = [pid for pid, overlap in zip(track_ids, overlaps)
+                  if len(self.samples[pid]) < self.team_assigner.samples_per_track
+                  and (overlap <= self.team_assigner.max_overlap or not self.samples[pid])
+                  and record.frame_num - self.last_sample.get(pid, -self.sample_spacing) >= self.sample_spacing]
+        if not picked:
+            return
+        colors = self.team_assigner.get_player_colors(record.frame, [players[pid]['bbox'] for pid in picked])
+        for pid, color in zip(picked, colors):
+            self.samples[pid].append(color)
+            self.last_sample[pid] = record.frame_num
+            self.track_teams.pop(pid, None)
+
+    def fit(self):
+        track_ids = [pid for pid, colors in self.samples.items() if colors]
+        if len(track_ids) < 2:
+            return False
+        self.team_assigner.fit_team_colors(np.array([np.median(self.samples[pid], axis=0) for pid in track_ids]))
+        self.track_teams.clear()
+        return True
+
+    def track_team(self, pid):
+        if pid not in self.track_teams:
+            colors = np.array(self.samples[pid])
+            distance = self.team_assigner.kmeans.transform(np.median(colors, axis=0)[None]).min()
+            self.track_teams[pid] = (self.team_assigner.vote_team(colors)
+                                     if distance <= self.team_assigner.outlier_distance else None)
+        return self.track_teams[pid]
+
+    def assign(self, record):
+        players = record.tracks['players']
+        teams = {pid: self.track_team(pid) for pid in players if self.samples[pid]}
+
+        # Outliers: compared with each team's mean foot x in this frame
+        xs = {pid: (player['bbox'][0] + player['bbox'][2]) / 2 for pid, player in players.items()}
+        team_x = np.array([np.mean([xs[pid] for pid, team in teams.items() if team == team_id] or [np.nan])
+                           for team_id in (1, 2)])
+        for pid, team in teams.items():
+            if team is not None:
+                continue
+            seen = ~np.isnan(team_x)
+            self.team_distance[pid][seen] += np.abs(xs[pid] - team_x[seen])
+            self.team_frames[pid][seen] += 1
+            if self.team_frames[pid].any():
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    teams[pid] = int(np.nanargmin(self.team_distance[pid] / self.team_frames[pid])) + 1
+            else:
+                color = np.median(self.samples[pid], axis=0)[None]
+                teams[pid] = int(self.team_assigner.kmeans.predict(color)[0]) + 1
+
+        for pid, team_id in teams.items():
+            players[pid]['team_id'] = team_id
+            players[pid]['team_color'] = self.team_assigner.team_colors[team_id]
+        return record
+
+    def __call__(self, records):
+        pending = deque()
+        fitted = False
+        for record in records:
+            self.sample(record)
+            pending.append(record)
+            if not fitted and len(pending) > self.lookahead:
+                fitted = self.fit()
+            if fitted:
+                while pending:
+                    yield self.assign(pending.popleft())
+            elif len(pending) > self.lookahead:
+                # Fewer than two players seen so far: nothing to tell teams apart by yet
+                yield pending.popleft()
+
+        fitted = fitted or self.fit()
+        for record in pending:
+            yield self.assign(record) if fitted else record
+
+
+class BallAssignmentStage:
+    """
+    Streaming counterpart of PlayerBallAssigner.assign_ball_to_players: frames are held
+    back until the closest player's run is long enough to count (or has ended), so the
+    possession hysteresis matches the batch path.
+    """
+    name = "ball_possession"
+
+    def __init__(self):
+        self.assigner = PlayerBallAssigner()
+        self.lookahead = max(self.assigner.min_possession_frames - 1, 0)
+
+    def __call__(self, records):
+        run, run_closest, run_counts = [], None, False
+        holder, holder_team, last_team = -1, -1, -1
+
+        def release(records, holder, team):
+            nonlocal last_team
+            for record in records:
+                players = record.tracks['players']
+                if holder in players:
+                    players[holder]['has_ball'] = True
+                if team != -1:
+                    last_team = team
+                record.team_ball_control = last_team
+                yield record
+
+        for record in records:
+            players = record.tracks['players']
+            ball_dict = record.tracks['ball']
+            closest = self.assigner.assign_ball_to_player(players, ball_dict[1]['bbox']) if 1 in ball_dict else -1
+            team = players[closest].get('team_id', -1) if closest != -1 else -1
+
+            if closest != run_closest:
+                # The previous run ended too short to count: it keeps the holder before it
+                yield from release(run, holder, holder_team)
+                run, run_closest, run_counts = [], closest, False
+
+            run.append(record)
+            if closest == -1 or len(run) >= self.assigner.min_possession_frames:
+                run_counts = True
+            if run_counts:
+                holder, holder_team = closest, team
+                yield from release(run, holder, holder_team)
+                run = []
+
+        yield from release(run, holder, holder_team)
+
+
+class AnnotationStage:
+    """Draws camera movement, markers, possession bar and speed boxes onto each frame."""
+    name = "annotation"
+
+    def __init__(self, tracker, camera_stage, speed_stage):
+        self.tracker = tracker
+        self.camera_stage = camera_stage
+        self.speed_stage = speed_stage
+        self.team_colors = None
+        # Running per-team counts, which is all the bar and the summary need
+        self.possession = PossessionStats()
+        self.renderer = AnnotationRenderer()
+        self.lookahead = 0
+
+    def __call__(self, records):
+        for record in records:
+            if not self.team_colors:
+                self.team_colors = {p['team_id']: p['team_color']
+                                    for p in record.tracks['players'].values() if 'team_id' in p}
+            self.possession.append(record.team_ball_control)
+
+            # The decoded frame is not needed afterwards, so it is annotated in place
+            frame = record.frame
+            self.camera_stage.estimator.draw_frame_camera_movement(frame, record.camera_movement, self.renderer)
+            self.tracker.draw_frame_annotations(
+                frame, record.frame_num, record.tracks['players'], record.tracks['referees'],
+                record.tracks['ball'], self.possession, self.team_colors, self.renderer
+            )
+            self.speed_stage.estimator.draw_frame_speed_and_distance(frame, record.tracks['players'], self.renderer)
+            self.renderer.render(frame)
+            yield record
+
+
+# ---------------- PIPELINE ---------------- #
+
+class StreamingPipeline:
+    """
+    Runs the whole analysis frame-by-frame from a video file to an output file,
+    keeping only a bounded window of frames in memory. Decoding, inference, the
+    analysis stages and encoding each run in their own thread, linked by bounded queues.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, detail_level=DETAIL_LEVEL):
+        self.tracker = Tracker(model_path, detail_level)
+        # Grayscale / pyramid cache of the camera stage. Its entries keep their decoded frame
+        # alive, and the stage only ever reads the current one
+        self.frame_cache = FrameCache(max_frames=1)
+        camera_stage = CameraMovementStage(self.frame_cache)
+        speed_stage = SpeedDistanceStage()
+        self.annotation_stage = AnnotationStage(self.tracker, camera_stage, speed_stage)
+
+        self.stages = [
+            BallInterpolationStage(self.tracker.ball_trajectory),
+            PositionStage(self.tracker),
+            camera_stage,
+            ViewTransformStage(),
+            speed_stage,
+            TeamAssignmentStage(),
+            BallAssignmentStage(),
+            self.annotation_stage,
+        ]
+        self.detection_stage = DetectionStage(self.tracker)
+
+    @property
+    def max_buffered_frames(self):
+        # Plus the annotated frames queued for the encoder and the ones the frame cache holds on to
+        return (self.detection_stage.lookahead + sum(stage.lookahead for stage in self.stages)
+                + PIPELINE_QUEUE_SIZE + self.frame_cache.max_frames)
+
+    def iter_records(self, frames, metrics=None):
+        """
+        The stages chained over frames. With metrics (a Metrics), each stage's own time
+        (without the stages it pulls from) and the inference latencies are recorded.
+        """
+        if metrics is None:
+            records = self.detection_stage(frames)
+            for stage in self.stages:
+                records = stage(records)
+            return records
+
+        records = metrics.stream(self.detection_stage.name, self.detection_stage(frames, metrics))
+        upstream = self.detection_stage.name
+        for stage in self.stages:
+            records = metrics.stream(stage.name, stage(records), upstream=upstream)
+            upstream = stage.name
+        return records
+
+    def run(self, input_path, output_path, progress=None, metrics=None):
+        """
+        Process input_path into output_path and return a small summary of the match.
+        progress(stage, done, total) is called for every frame handed to the encoder;
+        per-stage metrics go to metrics (a new Metrics if not given, returned in the summary).
+        """
+        metrics = metrics if metrics is not None else Metrics()
+        fps = get_video_fps(input_path)
+        total = get_video_frame_count(input_path)
+        self.annotation_stage.speed_stage.estimator.frame_rate = fps
+        # Court positions of every player row, in NumPy chunks, for the kinematics summary
+        position_log, player_teams = PositionLog(), {}
+
+        def annotated_frames():
+            for record in self.iter_records(iter_video(input_path), metrics):
+                for pid, pdata in record.tracks['players'].items():
+                    position_log.add(record.frame_num, pid, pdata.get('position_transformed'))
+                    if 'team_id' in pdata:
+                        player_teams[pid] = pdata['team_id']
+                yield record.frame
+                if progress is not None:
+                    progress("Streaming analysis", record.frame_num + 1, total)
+
+        # Frames are encoded on the encoder's thread while this one runs the analysis
+        with metrics.stage("streaming", items=total):
+            save_video(annotated_frames(), output_path, fps=fps)
+
+        kinematics = Kinematics(fps)
+        frames, track_ids, positions = position_log.arrays()
+        summaries = kinematics.summarize(frames, track_ids, kinematics.compute(frames, track_ids, positions))
+        return {
+            "possession": self.annotation_stage.possession,
+            "player_stats": player_stats_rows(summaries, player_teams),
+            "schedule_report": self.tracker.schedule_report,
+            "metrics": metrics,
+        }
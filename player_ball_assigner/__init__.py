@@ -1 +1,2 @@
-from .player_ball_assigner import PlayerBallAssigner
\ No newline at end of file
+from .player_ball_assigner import PlayerBallAssigner
+from .possession_stats import PossessionStats
\ No newline at end of file
@@ -1,27 +1,84 @@
-import sys 
+import sys
 sys.path.append('../')
-from utils import get_center_of_bbox, measure_distance
+import numpy as np
+from config import PLAYER_BALL_MAX_DISTANCE, POSSESSION_MIN_FRAMES
 
 class PlayerBallAssigner():
-    def __init__(self):
-        self.max_player_ball_distance = 70
-    
+    def __init__(self, max_player_ball_distance=PLAYER_BALL_MAX_DISTANCE, min_possession_frames=POSSESSION_MIN_FRAMES):
+        self.max_player_ball_distance = max_player_ball_distance
+        # A new player only gets the ball once they were closest this many frames in a row
+        self.min_possession_frames = min_possession_frames
+
+    def foot_distances(self, player_bboxes, ball_centers):
+        """Distance from each ball center to the nearer bottom corner of its player's bbox."""
+        bottom = player_bboxes[:, 3]
+        left = np.sqrt((player_bboxes[:, 0] - ball_centers[:, 0]) ** 2 + (bottom - ball_centers[:, 1]) ** 2)
+        right = np.sqrt((player_bboxes[:, 2] - ball_centers[:, 0]) ** 2 + (bottom - ball_centers[:, 1]) ** 2)
+        return np.minimum(left, right)
+
     def assign_ball_to_player(self,players,ball_bbox):
-        ball_position = get_center_of_bbox(ball_bbox)
+        if not players:
+            return -1
+
+        player_ids = list(players)
+        player_bboxes = np.array([players[player_id]['bbox'] for player_id in player_ids], dtype=np.float64)
+        # Same rounding as get_center_of_bbox
+        ball_center = np.trunc([(ball_bbox[0] + ball_bbox[2]) / 2, (ball_bbox[1] + ball_bbox[3]) / 2])
+
+        distances = self.foot_distances(player_bboxes, ball_center[None, :])
+        closest = int(np.argmin(distances))
+        return player_ids[closest] if distances[closest] < self.max_player_ball_distance else -1
+
+    def held_frames(self, closest):
+        """
+        Possession hysteresis: for each frame, the frame whose closest player counts. Runs of
+        a player shorter than min_possession_frames are flicker and keep the previous holder;
+        frames where nobody is close (-1) always count. -1 before anything counted.
+        """
+        closest = np.asarray(closest)
+        if len(closest) == 0:
+            return np.zeros(0, dtype=np.int64)
+        run = np.cumsum(np.r_[True, closest[1:] != closest[:-1]]) - 1
+        counts = (closest == -1) | (np.bincount(run)[run] >= self.min_possession_frames)
+        return np.maximum.accumulate(np.where(counts, np.arange(len(closest)), -1))
+
+    def assign_ball_to_players(self, table):
+        """
+        Whole-match assign_ball_to_player on a TrackTable, all frames at once. Sets the
+        'has_ball' column and returns frame-aligned arrays: the track id of the player
+        holding the ball (-1 for nobody) and the team in control (the last team to hold
+        it, -1 before anyone did).
+        """
+        num_frames = table.num_frames
+        bbox = table['bbox'].astype(np.float64)
+        team_id = table['team_id'].astype(np.int64)
+
+        # Ball center per frame, NaN where there is none (same rounding as get_center_of_bbox)
+        ball_centers = np.full((num_frames, 2), np.nan)
+        balls = np.flatnonzero(table.type_mask('ball'))
+        ball_centers[table.frame[balls]] = np.trunc((bbox[balls, :2] + bbox[balls, 2:]) / 2)
 
-        miniumum_distance = 99999
-        assigned_player=-1
+        # Closest player within range per frame; ties go to the first row, like the dict loop
+        players = np.flatnonzero(table.type_mask('players'))
+        distances = self.foot_distances(bbox[players], ball_centers[table.frame[players]])
+        in_range = players[distances < self.max_player_ball_distance]
+        order = np.lexsort((distances[distances < self.max_player_ball_distance], table.frame[in_range]))
+        sorted_rows = in_range[order]
+        first = sorted_rows[np.r_[True, np.diff(table.frame[sorted_rows]) != 0]] if len(sorted_rows) else sorted_rows
 
-        for player_id, player in players.items():
-            player_bbox = player['bbox']
+        closest = np.full(num_frames, -1, dtype=np.int64)
+        closest_team = np.full(num_frames, -1, dtype=np.int64)
+        closest[table.frame[first]] = table.track_id[first]
+        closest_team[table.frame[first]] = team_id[first]
 
-            distance_left = measure_distance((player_bbox[0],player_bbox[-1]),ball_position)
-            distance_right = measure_distance((player_bbox[2],player_bbox[-1]),ball_position)
-            distance = min(distance_left,distance_right)
+        source = self.held_frames(closest)
+        holder = np.where(source >= 0, closest[source], -1)
+        holder_team = np.where(source >= 0, closest_team[source], -1)
 
-            if distance < self.max_player_ball_distance:
-                if distance < miniumum_distance:
-                    miniumum_distance = distance
-                    assigned_player = player_id
+        # Team in control: the last holder's team carries over frames without one
+        last = np.maximum.accumulate(np.where(holder_team != -1, np.arange(num_frames), -1)) if num_frames else source
+        team_ball_control = np.where(last >= 0, holder_team[last], -1)
 
-        return assigned_player
\ No newline at end of file
+        player_rows = table.type_mask('players')
+        table['has_ball'] = player_rows & (holder[table.frame] != -1) & (table.track_id == holder[table.frame])
+        return holder, team_ball_control
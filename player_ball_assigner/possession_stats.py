@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class PossessionStats:
+    """
+    Cumulative per-team possession counts built from team_ball_control
+    (one team id per frame), answering "possession up to frame N" in O(1).
+    """
+
+    def __init__(self, team_ball_control=()):
+        control = np.asarray(list(team_ball_control), dtype=np.int64)
+        self.team_ids = sorted(set(control.tolist()))
+        # cumulative[frame_num, i] = frames up to frame_num where team_ids[i] had the ball
+        onehot = control[:, None] == np.array(self.team_ids, dtype=np.int64)[None, :]
+        self.cumulative = np.cumsum(onehot, axis=0, dtype=np.int64)
+        self.num_frames = len(control)
+
+    def __len__(self):
+        return self.num_frames
+
+    def append(self, team_id):
+        """Add the next frame's possession (streaming use), amortized O(1)."""
+        if team_id not in self.team_ids:
+            column = int(np.searchsorted(self.team_ids, team_id))
+            self.team_ids.insert(column, team_id)
+            self.cumulative = np.insert(self.cumulative, column, 0, axis=1)
+
+        if self.num_frames == len(self.cumulative):
+            grown = np.zeros((max(16, 2 * self.num_frames), len(self.team_ids)), dtype=np.int64)
+            grown[:self.num_frames] = self.cumulative[:self.num_frames]
+            self.cumulative = grown
+
+        row = self.cumulative[self.num_frames - 1].copy() if self.num_frames else 0
+        self.cumulative[self.num_frames] = row
+        self.cumulative[self.num_frames, self.team_ids.index(team_id)] += 1
+        self.num_frames += 1
+
+    def counts_up_to(self, frame_num):
+        """{team_id: frames with possession} over frames 0..frame_num, teams with zero left out."""
+        if self.num_frames == 0 or frame_num < 0:
+            return {}
+        row = self.cumulative[min(frame_num, self.num_frames - 1)]
+        return {team_id: int(count) for team_id, count in zip(self.team_ids, row) if count}
+
+    def percentages(self, team_ids=(1, 2), frame_num=None):
+        """Share of possession between team_ids (ignoring frames nobody had the ball), in %."""
+        frame_num = self.num_frames - 1 if frame_num is None else frame_num
+        counts = self.counts_up_to(frame_num)
+        total = sum(counts.get(team_id, 0) for team_id in team_ids)
+        if total == 0:
+            return {team_id: 0 for team_id in team_ids}
+        return {team_id: 100 * counts.get(team_id, 0) / total for team_id in team_ids}
@@ -1 +1,2 @@
-from .speed_distance_estimator import *
\ No newline at end of file
+from .speed_distance_estimator import *
+from .kinematics import Kinematics, PositionLog, player_stats_rows
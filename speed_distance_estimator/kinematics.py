@@ -0,0 +1,204 @@
+import numpy as np
+from config import (FPS, KINEMATICS_SMOOTHING_WINDOW, KINEMATICS_MAX_GAP, SPRINT_SPEED,
+                    SPRINT_MIN_DURATION)
+
+
+class Kinematics:
+    """
+    Per-track motion from court positions (position_transformed, in meters), for every
+    row of every track at once: speed, acceleration and cumulative distance, plus
+    per-track summaries (max / average speed, distance, sprints).
+
+    Rows of a track are split into segments wherever its position is unknown (off the
+    court) or it goes unseen for more than max_gap frames; positions are smoothed with a
+    centered moving average of smoothing_window samples inside each segment, and no
+    distance is counted across a break.
+    """
+
+    def __init__(self, fps=FPS, smoothing_window=KINEMATICS_SMOOTHING_WINDOW, max_gap=KINEMATICS_MAX_GAP,
+                 sprint_speed=SPRINT_SPEED, sprint_min_duration=SPRINT_MIN_DURATION):
+        self.fps = fps
+        self.smoothing_window = smoothing_window
+        self.max_gap = max_gap
+        self.sprint_speed = sprint_speed
+        self.sprint_min_duration = sprint_min_duration
+
+    def as_config(self):
+        # What the results depend on, for cache keys
+        return {"fps": self.fps, "smoothing_window": self.smoothing_window, "max_gap": self.max_gap,
+                "sprint_speed": self.sprint_speed, "sprint_min_duration": self.sprint_min_duration}
+
+    @staticmethod
+    def backfill(values, segment_end):
+        """NaNs replaced by the next finite value of the same segment (rows end at segment_end)."""
+        index = np.where(np.isnan(values), len(values), np.arange(len(values)))
+        following = np.minimum.accumulate(index[::-1])[::-1]
+        usable = following < segment_end
+        filled = values.copy()
+        filled[usable] = values[following[usable]]
+        return filled
+
+    def smooth(self, positions, segment_start, segment_end):
+        """
+        Centered moving average inside each row's segment [start, end). Near the ends the
+        window shrinks symmetrically, so steady motion isn't slowed down at the edges.
+        """
+        half = self.smoothing_window // 2
+        if half == 0:
+            return positions
+        index = np.arange(len(positions))
+        half = np.minimum(half, np.minimum(index - segment_start, segment_end - 1 - index))
+        low, high = index - half, index + half + 1
+        cumulative = np.concatenate([np.zeros((1, 2)), np.cumsum(positions, axis=0)])
+        return (cumulative[high] - cumulative[low]) / (high - low)[:, None]
+
+    def compute(self, frames, track_ids, positions):
+        """
+        Kinematics of rows given as (frame, track id, (x, y) in meters), in any order.
+        Returns row-aligned arrays: speed (km/h), acceleration (m/s^2), distance (m, running
+        total of the track) and segment (-1 where the position is unknown), plus the sorted
+        order of the rows that were used.
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        count = len(frames)
+        result = {"speed": np.full(count, np.nan), "acceleration": np.full(count, np.nan),
+                  "distance": np.full(count, np.nan), "segment": np.full(count, -1, dtype=np.int64)}
+
+        known = np.flatnonzero(~np.isnan(positions).any(axis=1))
+        order = known[np.lexsort((frames[known], track_ids[known]))]
+        result["order"] = order
+        if len(order) == 0:
+            return result
+
+        f, ids = frames[order], track_ids[order]
+        new_track = np.r_[True, ids[1:] != ids[:-1]]
+        new_segment = new_track | np.r_[True, np.diff(f) > self.max_gap]
+        segment = np.cumsum(new_segment) - 1
+        starts = np.flatnonzero(new_segment)
+        ends = np.r_[starts[1:], len(order)]
+        p = self.smooth(positions[order], starts[segment], ends[segment])
+
+        # Step from the previous row of the same segment; none at segment starts
+        dt = np.r_[1, np.diff(f)] / self.fps
+        step = np.r_[0.0, np.sqrt(((p[1:] - p[:-1]) ** 2).sum(axis=1))]
+        step[new_segment] = 0.0
+        speed = np.where(new_segment, np.nan, step / dt)
+        acceleration = np.r_[np.nan, np.diff(speed)] / dt
+        # The first rows of a segment take the first value that can be computed
+        speed = self.backfill(speed, ends[segment])
+        acceleration = self.backfill(acceleration, ends[segment])
+
+        # Running distance per track
+        cumulative = np.cumsum(step)
+        track_start = np.maximum.accumulate(np.where(new_track, np.arange(len(order)), 0))
+        distance = cumulative - cumulative[track_start]
+
+        result["speed"][order] = speed * 3.6
+        result["acceleration"][order] = acceleration
+        result["distance"][order] = distance
+        result["segment"][order] = segment
+        return result
+
+    def summarize(self, frames, track_ids, kinematics):
+        """
+        Per-track summaries from compute()'s output: {track_id: {"max_speed" (km/h),
+        "avg_speed" (km/h, distance over time tracked), "total_distance" (m), "sprints"}}.
+        A sprint is a stretch of at least sprint_min_duration seconds at sprint_speed or more.
+        """
+        order = kinematics["order"]
+        if len(order) == 0:
+            return {}
+        f = np.asarray(frames, dtype=np.int64)[order]
+        ids = np.asarray(track_ids, dtype=np.int64)[order]
+        speed = kinematics["speed"][order]
+        segment = kinematics["segment"][order]
+
+        track_starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        track_ends = np.r_[track_starts[1:], len(order)]
+        track_of_row = np.repeat(np.arange(len(track_starts)), track_ends - track_starts)
+
+        max_speed = np.fmax.reduceat(speed, track_starts)
+        total_distance = np.nan_to_num(kinematics["distance"][order][track_ends - 1])
+        # Time tracked: the frames spanned by each segment
+        segment_starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+        segment_ends = np.r_[segment_starts[1:], len(order)]
+        seconds = np.bincount(track_of_row[segment_starts], weights=f[segment_ends - 1] - f[segment_starts],
+                              minlength=len(track_starts)) / self.fps
+        avg_speed = np.divide(total_distance * 3.6, seconds, out=np.zeros_like(seconds), where=seconds > 0)
+
+        # Sprints: runs at sprint speed that stay inside one segment
+        fast = speed >= self.sprint_speed
+        continues = np.r_[segment[1:] == segment[:-1], False]
+        run_starts = np.flatnonzero(fast & ~np.r_[False, fast[:-1] & continues[:-1]])
+        run_ends = np.flatnonzero(fast & ~np.r_[fast[1:] & continues[:-1], False])
+        long_enough = (f[run_ends] - f[run_starts] + 1) / self.fps >= self.sprint_min_duration
+        sprints = np.bincount(track_of_row[run_starts[long_enough]], minlength=len(track_starts))
+
+        return {int(track_id): {"max_speed": float(np.nan_to_num(max_speed[i])), "avg_speed": float(avg_speed[i]),
+                                "total_distance": float(total_distance[i]), "sprints": int(sprints[i])}
+                for i, track_id in enumerate(ids[track_starts].tolist())}
+
+    def add_kinematics_to_table(self, table, obj_type='players'):
+        """Fill speed / acceleration / distance for obj_type's rows and return the per-track summaries."""
+        rows = np.flatnonzero(table.type_mask(obj_type))
+        frames, track_ids = table.frame[rows], table.track_id[rows]
+        kinematics = self.compute(frames, track_ids, table['position_transformed'][rows])
+
+        table['speed'][rows] = kinematics["speed"]
+        table['acceleration'][rows] = kinematics["acceleration"]
+        table['distance'][rows] = kinematics["distance"]
+        table.filled.update(('speed', 'acceleration', 'distance'))
+        return self.summarize(frames, track_ids, kinematics)
+
+
+class PositionLog:
+    """
+    (frame, track id, court position) rows collected frame by frame into fixed-size NumPy
+    chunks, with the TrackTable dtypes, for Kinematics.compute / summarize at the end of a
+    stream: 20 bytes a row instead of about 150 in Python lists.
+    """
+
+    def __init__(self, chunk_rows=1 << 16):
+        self.chunk_rows = chunk_rows
+        self.chunks = []
+        self.used = 0  # rows filled in the last chunk
+
+    def _new_chunk(self):
+        self.chunks.append((np.empty(self.chunk_rows, np.int32), np.empty(self.chunk_rows, np.int64),
+                            np.empty((self.chunk_rows, 2), np.float32)))
+        self.used = 0
+
+    def add(self, frame_num, track_id, position):
+        """One row; position is (x, y) in meters or None off the court."""
+        if not self.chunks or self.used == self.chunk_rows:
+            self._new_chunk()
+        frames, track_ids, positions = self.chunks[-1]
+        frames[self.used] = frame_num
+        track_ids[self.used] = track_id
+        positions[self.used] = position if position is not None else (np.nan, np.nan)
+        self.used += 1
+
+    def __len__(self):
+        return max(len(self.chunks) - 1, 0) * self.chunk_rows + self.used
+
+    def arrays(self):
+        """frames, track_ids, positions of every row so far."""
+        if not self.chunks:
+            return np.empty(0, np.int32), np.empty(0, np.int64), np.empty((0, 2), np.float32)
+        parts = self.chunks[:-1] + [tuple(column[:self.used] for column in self.chunks[-1])]
+        return tuple(np.concatenate(columns) for columns in zip(*parts))
+
+
+def player_stats_rows(summaries, player_teams=None):
+    """Rows of the player stats table (UI / summaries) from Kinematics.summarize output."""
+    player_teams = player_teams or {}
+    return [{
+        "Player ID": track_id,
+        "Team": player_teams.get(track_id, "-"),
+        "Distance (m)": round(summary["total_distance"], 2),
+        "Avg Speed (km/h)": round(summary["avg_speed"], 2),
+        "Max Speed (km/h)": round(summary["max_speed"], 2),
+        "Sprints": summary["sprints"],
+    } for track_id, summary in sorted(summaries.items())]
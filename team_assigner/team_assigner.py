@@ -1,4 +1,4 @@
-from sklearn.cluster import KMeans
+import numpy as np
 
 class TeamAssigner:
     def __init__(self):
@@ -6,11 +6,15 @@ class TeamAssigner:
         self.team_colors = {}
         # Stores which player_id is assigned to which team
         self.player_team_dict = {}
+        # Iteration cap of the per-crop jersey 2-means (it usually converges in a few)
+        self.color_max_iter = 20
     
     def get_clustering_model(self, image):
         """
         Runs KMeans clustering on an image to find 2 dominant colors.
         """
+        from sklearn.cluster import KMeans    # imported on use, sklearn is slow to load
+
         # Reshape the image to a 2D array of pixels (num_pixels, 3 for RGB)
         image_2d = image.reshape(-1, 3)
 
@@ -20,57 +24,97 @@ class TeamAssigner:
 
         return kmeans
 
-    def get_player_color(self, frame, bbox):
+    def get_player_colors(self, frame, bboxes):
         """
-        Extracts the dominant jersey color for a single player given their bounding box.
-        """
-        # Crop player image from the frame using bounding box coordinates
-        image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-
-        # Only take the top half of the player (usually jersey area)
-        top_half_image = image[0:int(image.shape[0]/2), :]
+        Extracts the dominant jersey color of every bounding box in one batch.
 
-        # Run clustering on the top half
-        kmeans = self.get_clustering_model(top_half_image)
-
-        # Cluster labels for each pixel
-        labels = kmeans.labels_
-
-        # Reshape labels back to image shape
-        clustered_image = labels.reshape(top_half_image.shape[0], top_half_image.shape[1])
+        Runs a vectorized 2-means over the stacked top-half crops with NumPy (no
+        per-crop sklearn model) and applies the same corner-pixel background rule.
+        Returns an (N, 3) array of colors.
+        """
+        h, w = frame.shape[:2]
+        crops, starts, shapes = [], [], []
+        offset = 0
+        for bbox in bboxes:
+            # Crop the top half of the player (usually jersey area), kept inside the frame
+            x1, y1 = min(max(int(bbox[0]), 0), w - 1), min(max(int(bbox[1]), 0), h - 1)
+            x2, y2 = max(min(int(bbox[2]), w), x1 + 1), max(min(int(bbox[3]), h), y1 + 1)
+            top_half_image = frame[y1:y1 + max(1, int((y2 - y1) / 2)), x1:x2]
+
+            crops.append(top_half_image.reshape(-1, 3))
+            starts.append(offset)
+            shapes.append(top_half_image.shape[:2])
+            offset += top_half_image.shape[0] * top_half_image.shape[1]
+
+        if not crops:
+            return np.zeros((0, 3))
+
+        n = len(crops)
+        pixels = np.concatenate(crops).astype(np.float64)
+        sizes = np.array([len(crop) for crop in crops])
+        segment = np.repeat(np.arange(n), sizes)
+        starts = np.array(starts)
+
+        # Deterministic init: the top-left corner pixel (usually background) and the
+        # pixel of the same crop furthest from it
+        centers = np.empty((n, 2, 3))
+        centers[:, 0] = pixels[starts]
+        far_distance = ((pixels - centers[segment, 0]) ** 2).sum(axis=1)
+        order = np.lexsort((far_distance, segment))
+        centers[:, 1] = pixels[order[starts + sizes - 1]]
+
+        labels = None
+        for _ in range(self.color_max_iter):
+            # Nearer to center 1 than center 0 <=> p.(c1 - c0) > (|c1|^2 - |c0|^2) / 2
+            direction = centers[:, 1] - centers[:, 0]
+            threshold = ((centers[:, 1] ** 2).sum(axis=1) - (centers[:, 0] ** 2).sum(axis=1)) / 2
+            projection = np.einsum('ij,ij->i', pixels, direction[segment])
+            new_labels = (projection > threshold[segment]).astype(np.int64)
+            if labels is not None and np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+            # Per-crop cluster means via bincount over (crop, cluster) bins
+            bins = segment * 2 + labels
+            counts = np.bincount(bins, minlength=2 * n).reshape(n, 2)
+            for channel in range(3):
+                sums = np.bincount(bins, weights=pixels[:, channel], minlength=2 * n).reshape(n, 2)
+                # An empty cluster keeps its previous center
+                centers[:, :, channel] = np.where(counts > 0, sums / np.maximum(counts, 1),
+                                                  centers[:, :, channel])
 
         # Look at the corner pixels → likely background
-        corner_clusters = [
-            clustered_image[0, 0],         # top-left corner
-            clustered_image[0, -1],        # top-right corner
-            clustered_image[-1, 0],        # bottom-left corner
-            clustered_image[-1, -1]        # bottom-right corner
-        ]
-
-        # Find the most common cluster among corners → background
-        non_player_cluster = max(set(corner_clusters), key=corner_clusters.count)
-
-        # Player jersey cluster is the opposite one
+        heights, widths = np.array(shapes).T
+        corners = np.stack([
+            starts,                                  # top-left corner
+            starts + widths - 1,                     # top-right corner
+            starts + (heights - 1) * widths,         # bottom-left corner
+            starts + heights * widths - 1,           # bottom-right corner
+        ], axis=1)
+        corner_votes = labels[corners].sum(axis=1)
+
+        # Most common corner cluster is the background (a 2-2 tie goes to cluster 0,
+        # like max(set(...), key=count) did); the jersey is the other one
+        non_player_cluster = (corner_votes > 2).astype(np.int64)
         player_cluster = 1 - non_player_cluster
 
-        # Extract jersey RGB color from cluster centers
-        player_color = kmeans.cluster_centers_[player_cluster]
+        return centers[np.arange(n), player_cluster]
 
-        return player_color
+    def get_player_color(self, frame, bbox):
+        """
+        Extracts the dominant jersey color for a single player given their bounding box.
+        """
+        return self.get_player_colors(frame, [bbox])[0]
 
     def assign_team_color(self, frame, player_detections):
         """
         Determines the team colors by clustering all players' jersey colors.
         """
-        player_colors = []
-
-        # For each detected player
-        for _, player_detection in player_detections.items():
-            bbox = player_detection["bbox"]
-            # Get that player’s jersey color
-            player_color = self.get_player_color(frame, bbox)
-            player_colors.append(player_color)
-        
+        from sklearn.cluster import KMeans
+
+        # Jersey colors of every detected player, in one batch
+        player_colors = self.get_player_colors(frame, [d["bbox"] for d in player_detections.values()])
+
         # Cluster all players into 2 teams based on jersey color
         kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10)
         kmeans.fit(player_colors)
@@ -86,24 +130,26 @@ class TeamAssigner:
         """
         Assigns a player to a team based on their jersey color.
         """
-        # If player already has a team assigned, return it directly
-        if player_id in self.player_team_dict:
-            return self.player_team_dict[player_id]
+        return self.get_player_teams(frame, {player_id: player_bbox})[player_id]
 
-        # Otherwise, get jersey color
-        player_color = self.get_player_color(frame, player_bbox)
+    def get_player_teams(self, frame, player_bboxes):
+        """
+        Assigns every {player_id: bbox} of a frame to a team; colors of players not
+        seen before are extracted together in one batch.
+        """
+        # Players that already have a team assigned are returned directly
+        new_ids = [pid for pid in player_bboxes if pid not in self.player_team_dict]
 
-        # Predict which team this color belongs to
-        team_id = self.kmeans.predict(player_color.reshape(1, -1))[0]
+        if new_ids:
+            # Otherwise, get jersey colors and predict which team each belongs to
+            player_colors = self.get_player_colors(frame, [player_bboxes[pid] for pid in new_ids])
+            team_ids = self.kmeans.predict(player_colors)
 
-        # Convert from {0,1} to {1,2}
-        team_id += 1
+            for player_id, team_id in zip(new_ids, team_ids):
+                # Convert from {0,1} to {1,2}
+                team_id = int(team_id) + 1
 
-        # hard code the team 2 goalkeeper
-        # TODO: Fix Later for goalkeeper team assigment
-        if player_id in [98,124, 91]:
-            team_id=2
-        # Save assignment
-        self.player_team_dict[player_id] = team_id
+                # Save assignment
+                self.player_team_dict[player_id] = team_id
 
-        return team_id
+        return {pid: self.player_team_dict[pid] for pid in player_bboxes}
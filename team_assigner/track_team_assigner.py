@@ -0,0 +1,207 @@
+import numpy as np
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from config import TEAM_SAMPLES_PER_TRACK, TEAM_COLOR_WORKERS, GOALKEEPER_OUTLIER_FACTOR
+from .team_assigner import TeamAssigner
+
+
+class TrackTeamAssigner(TeamAssigner):
+    """
+    Assigns teams once per track instead of once per first sighting.
+
+    Each track contributes a few well-spaced, unoccluded appearances; their jersey colors
+    are extracted in a thread pool and the track's team is the majority vote. Tracks whose
+    color fits neither team (goalkeepers) join the team whose players stand closest to
+    them in the same frames.
+    """
+
+    def __init__(self, samples_per_track=TEAM_SAMPLES_PER_TRACK, max_workers=TEAM_COLOR_WORKERS,
+                 max_overlap=0.1, outlier_factor=GOALKEEPER_OUTLIER_FACTOR):
+        super().__init__()
+        self.samples_per_track = samples_per_track
+        self.max_workers = max_workers
+        # Appearances with more of their box covered by other players than this are skipped
+        self.max_overlap = max_overlap
+        # Track colors further than outlier_factor x the median distance from both teams are outliers
+        self.outlier_factor = outlier_factor
+        self.outlier_distance = None
+
+    @staticmethod
+    def get_overlaps(bboxes):
+        """Fraction of each box covered by the most overlapping other box of the frame."""
+        boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+        y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+        x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+        y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        np.fill_diagonal(intersection, 0)
+        areas = np.maximum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), 1e-6)
+        return intersection.max(axis=1, initial=0) / areas
+
+    @staticmethod
+    def get_row_overlaps(frame, bboxes, chunk_frames=4096):
+        """get_overlaps of many frames at once: rows given by frame (grouped) and bboxes."""
+        overlaps = np.zeros(len(frame))
+        if len(frame) == 0:
+            return overlaps
+        starts = np.flatnonzero(np.r_[True, frame[1:] != frame[:-1]])
+        ends = np.r_[starts[1:], len(frame)]
+
+        for first in range(0, len(starts), chunk_frames):
+            group_starts, group_ends = starts[first:first + chunk_frames], ends[first:first + chunk_frames]
+            rows = slice(group_starts[0], group_ends[-1])
+            group = np.repeat(np.arange(len(group_starts)), group_ends - group_starts)
+            slot = np.arange(rows.start, rows.stop) - group_starts[group]
+            # Frames padded to the same number of boxes; the padding is zero-area boxes
+            boxes = np.zeros((len(group_starts), slot.max() + 1, 4), dtype=np.float32)
+            boxes[group, slot] = bboxes[rows]
+
+            width = np.minimum(boxes[:, :, None, 2], boxes[:, None, :, 2])
+            width -= np.maximum(boxes[:, :, None, 0], boxes[:, None, :, 0])
+            height = np.minimum(boxes[:, :, None, 3], boxes[:, None, :, 3])
+            height -= np.maximum(boxes[:, :, None, 1], boxes[:, None, :, 1])
+            intersection = np.clip(width, 0, None, out=width) * np.clip(height, 0, None, out=height)
+            diagonal = np.arange(boxes.shape[1])
+            intersection[:, diagonal, diagonal] = 0
+            areas = np.maximum((boxes[:, :, 2] - boxes[:, :, 0]) * (boxes[:, :, 3] - boxes[:, :, 1]), 1e-6)
+            overlaps[rows] = (intersection.max(axis=2) / areas)[group, slot]
+        return overlaps
+
+    def sample_appearances(self, table):
+        """{track_id: rows} - up to samples_per_track well-spaced player rows per track, preferring unoccluded ones."""
+        rows = np.flatnonzero(table.type_mask('players'))
+        if len(rows) == 0:
+            return {}
+        clear = self.get_row_overlaps(table.frame[rows], table['bbox'][rows]) <= self.max_overlap
+
+        # Rows of each track, the clear ones first, each part in frame order
+        order = np.lexsort((table.frame[rows], ~clear, table.track_id[rows]))
+        rows, clear = rows[order], clear[order]
+        track_ids = table.track_id[rows]
+        starts = np.flatnonzero(np.r_[True, track_ids[1:] != track_ids[:-1]])
+        ends = np.r_[starts[1:], len(rows)]
+        clear_counts = np.add.reduceat(clear.astype(np.int64), starts)
+
+        samples = {}
+        for track_id, start, end, clear_count in zip(track_ids[starts].tolist(), starts, ends, clear_counts):
+            candidates = rows[start:start + clear_count] if clear_count else rows[start:end]
+            # Evenly spaced over the track's lifetime
+            picks = np.linspace(0, len(candidates) - 1, min(self.samples_per_track, len(candidates)))
+            samples[track_id] = candidates[np.unique(np.round(picks).astype(np.int64))]
+        return samples
+
+    def extract_sample_colors(self, frames, table, samples, progress=None):
+        """
+        {track_id: [(frame_num, color), ...]}, one batched extraction per sampled frame;
+        progress(stage, done, total) is called after each of them.
+        """
+        by_frame = defaultdict(list)
+        for track_id, rows in samples.items():
+            for row, frame_num in zip(rows.tolist(), table.frame[rows].tolist()):
+                by_frame[frame_num].append((track_id, row))
+        bboxes = table['bbox']
+
+        def extract(frame_num):
+            track_ids, rows = zip(*by_frame[frame_num])
+            return frame_num, track_ids, self.get_player_colors(frames[frame_num], bboxes[list(rows)])
+
+        sample_colors = defaultdict(list)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for done, (frame_num, track_ids, colors) in enumerate(pool.map(extract, sorted(by_frame)), start=1):
+                for track_id, color in zip(track_ids, colors):
+                    sample_colors[track_id].append((frame_num, color))
+                if progress is not None:
+                    progress("Team colors", done, len(by_frame))
+        return sample_colors
+
+    def fit_team_colors(self, track_colors):
+        """Team colors from per-track colors, refitted without the outliers; returns the inlier mask."""
+        from sklearn.cluster import KMeans    # imported on use, sklearn is slow to load
+
+        kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10).fit(track_colors)
+        distances = kmeans.transform(track_colors).min(axis=1)
+        self.outlier_distance = self.outlier_factor * max(np.median(distances), 1.0)
+        inliers = distances <= self.outlier_distance
+        if inliers.sum() >= 2 and not inliers.all():
+            kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10).fit(track_colors[inliers])
+            distances = kmeans.transform(track_colors).min(axis=1)
+            self.outlier_distance = self.outlier_factor * max(np.median(distances[inliers]), 1.0)
+            inliers = distances <= self.outlier_distance
+
+        self.kmeans = kmeans
+        self.team_colors[1] = kmeans.cluster_centers_[0]
+        self.team_colors[2] = kmeans.cluster_centers_[1]
+        return inliers
+
+    def vote_team(self, colors):
+        """Majority team of a track's sample colors."""
+        votes = Counter(int(team) + 1 for team in self.kmeans.predict(np.asarray(colors)))
+        return votes.most_common(1)[0][0]
+
+    @staticmethod
+    def get_team_distances(table, player_teams):
+        """
+        {track_id: (distance to team 1, distance to team 2)} of the player tracks missing from
+        player_teams: the mean horizontal distance between the track and each team's players,
+        taken frame by frame - a pan shifts both alike, so it cancels out. NaN where the
+        track never shares a frame with that team.
+        """
+        rows = np.flatnonzero(table.type_mask('players'))
+        track_ids, inverse = np.unique(table.track_id[rows], return_inverse=True)
+        team = np.array([player_teams.get(track_id, 0) for track_id in track_ids.tolist()], dtype=np.int64)[inverse]
+        frame = table.frame[rows].astype(np.int64)
+        bbox = table['bbox'][rows].astype(np.float64)
+        x = (bbox[:, 0] + bbox[:, 2]) / 2
+
+        # Mean foot x of each team in each frame
+        bins = frame * 3 + team
+        sums = np.bincount(bins, weights=x, minlength=3 * table.num_frames).reshape(-1, 3)
+        counts = np.bincount(bins, minlength=3 * table.num_frames).reshape(-1, 3)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            team_x = (sums / counts)[:, 1:]
+
+        unassigned = team == 0
+        gaps = np.abs(x[unassigned, None] - team_x[frame[unassigned]])
+        track = inverse[unassigned]
+        distances = {}
+        for team_index in range(2):
+            seen = ~np.isnan(gaps[:, team_index])
+            total = np.bincount(track[seen], weights=gaps[seen, team_index], minlength=len(track_ids))
+            count = np.bincount(track[seen], minlength=len(track_ids))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                distances[team_index] = total / count
+        return {int(track_ids[i]): (distances[0][i], distances[1][i]) for i in np.unique(track).tolist()}
+
+    def assign_teams(self, frames, table, progress=None):
+        """
+        Assigns every player track of table (a TrackTable) to team 1 or 2 and returns
+        {track_id: team_id}; per-frame lookups are then a dict access.
+        """
+        self.player_team_dict = {}
+        samples = self.sample_appearances(table)
+        sample_colors = self.extract_sample_colors(frames, table, samples, progress)
+        track_ids = [tid for tid in sample_colors]
+        if not track_ids:
+            return {}
+
+        track_colors = np.array([np.median([c for _, c in sample_colors[tid]], axis=0) for tid in track_ids])
+        inliers = self.fit_team_colors(track_colors)
+
+        # Majority vote over each track's samples
+        for track_id, inlier in zip(track_ids, inliers):
+            if inlier:
+                self.player_team_dict[track_id] = self.vote_team([c for _, c in sample_colors[track_id]])
+
+        # Outliers (goalkeepers): the team whose players stand closest in the same frames
+        distances = self.get_team_distances(table, self.player_team_dict)
+        for index, (track_id, inlier) in enumerate(zip(track_ids, inliers)):
+            if inlier:
+                continue
+            to_team = np.asarray(distances.get(track_id, (np.nan, np.nan)))
+            if np.isnan(to_team).all():
+                self.player_team_dict[track_id] = int(self.kmeans.predict(track_colors[[index]])[0]) + 1
+            else:
+                self.player_team_dict[track_id] = int(np.nanargmin(to_team)) + 1
+
+        return dict(self.player_team_dict)
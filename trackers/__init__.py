@@ -1 +1,6 @@
-from .tracker import Tracker
\ No newline at end of file
+from .tracker import Tracker
+from .track_table import TrackTable, TrackTableView
+from .track_cache import TrackCache, video_fingerprint
+from .detector_backend import DetectorBackend, UltralyticsBackend, OnnxBackend, load_detector
+from .ball_trajectory import BallTrajectory, BALL_MISSING, BALL_OBSERVED, BALL_INTERPOLATED
+from .registry import ModelRegistry, model_registry
@@ -0,0 +1,130 @@
+import numpy as np
+from config import (BALL_MIN_CONFIDENCE, BALL_TILE_SIZE, BALL_TILE_IMGSZ, BALL_SWEEP_AFTER,
+                    BALL_SWEEP_INTERVAL, CONFIDENCE_THRESHOLD)
+
+
+class BallTileDetector:
+    """
+    Second, ball-only detection pass. When a frame has no ball (or only a low confidence
+    one), a small tile around where the ball should be - last known position plus its
+    velocity - is run through the model at a higher input size, which finds the tiny ball
+    far more often than the full frame does. After BALL_SWEEP_AFTER frames without a ball
+    the whole frame is swept in (larger) tiles instead, at most every BALL_SWEEP_INTERVAL frames.
+
+    Frames are refined a batch at a time and the tiles of the whole batch go to the model in
+    one call, so positions within a batch are predicted from the confident sightings only.
+    """
+
+    def __init__(self, detector, min_confidence=BALL_MIN_CONFIDENCE, tile_size=BALL_TILE_SIZE,
+                 tile_imgsz=BALL_TILE_IMGSZ, sweep_after=BALL_SWEEP_AFTER, sweep_interval=BALL_SWEEP_INTERVAL,
+                 confidence=CONFIDENCE_THRESHOLD):
+        self.detector = detector
+        self.min_confidence = min_confidence
+        self.tile_size = tile_size
+        self.tile_imgsz = tile_imgsz
+        self.sweep_after = sweep_after
+        self.sweep_interval = sweep_interval
+        self.confidence = confidence
+
+        self.ball_class = {v: k for k, v in detector.names.items()}['ball']
+        # (frame_num, center) of the last two confident sightings, for the velocity
+        self.history = []
+        self.last_sweep = None
+        # tile_calls / sweep_calls: frames given a tile / a sweep; detector_calls: batched model calls
+        self.stats = {"tile_calls": 0, "sweep_calls": 0, "detector_calls": 0, "recovered": 0}
+
+    def predicted_center(self, frame_num):
+        """Where the ball should be at frame_num: constant velocity from the last two sightings."""
+        (last_frame, last_center) = self.history[-1]
+        if len(self.history) < 2:
+            return last_center
+        (prev_frame, prev_center) = self.history[-2]
+        velocity = (last_center - prev_center) / max(last_frame - prev_frame, 1)
+        return last_center + velocity * (frame_num - last_frame)
+
+    @staticmethod
+    def tile_origin(center, size, frame_shape):
+        h, w = frame_shape[:2]
+        x = int(np.clip(center[0] - size / 2, 0, max(w - size, 0)))
+        y = int(np.clip(center[1] - size / 2, 0, max(h - size, 0)))
+        return x, y
+
+    @staticmethod
+    def sweep_origins(size, frame_shape):
+        # Tiles covering the whole frame with a little overlap
+        h, w = frame_shape[:2]
+        step = int(size * 0.8)
+        xs = sorted({min(x, max(w - size, 0)) for x in range(0, max(w - size, 0) + step, step)})
+        ys = sorted({min(y, max(h - size, 0)) for y in range(0, max(h - size, 0) + step, step)})
+        return [(x, y) for y in ys for x in xs]
+
+    def best_ball(self, origins, tile_detections):
+        """Best ball detection over the tiles at origins, in frame coordinates (or None)."""
+        best = None
+        for (x, y), detections in zip(origins, tile_detections):
+            balls = detections[detections.class_id == self.ball_class]
+            if len(balls) == 0:
+                continue
+            top = balls[np.array([int(np.argmax(balls.confidence))])]
+            if best is None or top.confidence[0] > best.confidence[0]:
+                top.xyxy = top.xyxy + np.array([x, y, x, y], dtype=top.xyxy.dtype)
+                best = top
+        return best
+
+    def plan_tiles(self, frame_num, frame_shape):
+        """(origins, size) of the tiles to search frame_num for a missing ball, or None."""
+        missing = frame_num - self.history[-1][0] if self.history else None
+        if missing is not None and missing <= self.sweep_after:
+            # Tile around the predicted position, a little larger the longer the ball is gone
+            size = int(min(self.tile_size * (1 + missing / self.sweep_after), 2 * self.tile_size))
+            size = min(size, *frame_shape[:2])
+            self.stats["tile_calls"] += 1
+            return [self.tile_origin(self.predicted_center(frame_num), size, frame_shape)], size
+        if self.last_sweep is None or frame_num - self.last_sweep >= self.sweep_interval:
+            # Sweep tiles are twice the size: still 3x the full-frame resolution, a quarter the tiles
+            size = min(2 * self.tile_size, *frame_shape[:2])
+            self.last_sweep = frame_num
+            self.stats["sweep_calls"] += 1
+            return self.sweep_origins(size, frame_shape), size
+        return None
+
+    def refine(self, frame_nums, frames, detections):
+        """Detections of frames (numbered frame_nums, in order), with a recovered ball where one was missing."""
+        plans = []
+        for index, (frame_num, frame, frame_detections) in enumerate(zip(frame_nums, frames, detections)):
+            confident = (frame_detections.class_id == self.ball_class) & \
+                        (frame_detections.confidence >= self.min_confidence)
+            if confident.any():
+                ball_index = int(np.flatnonzero(confident)[np.argmax(frame_detections.confidence[confident])])
+                self.remember(frame_num, frame_detections.xyxy[ball_index])
+                continue
+            plan = self.plan_tiles(frame_num, frame.shape)
+            if plan is not None:
+                plans.append((index, *plan))
+
+        refined = list(detections)
+        if not plans:
+            return refined
+
+        tiles = [frames[index][y:y + size, x:x + size] for index, origins, size in plans for x, y in origins]
+        tile_detections = self.detector.detect(tiles, conf=self.confidence, imgsz=self.tile_imgsz)
+        self.stats["detector_calls"] += 1
+
+        start = 0
+        for index, origins, size in plans:
+            found = self.best_ball(origins, tile_detections[start:start + len(origins)])
+            start += len(origins)
+            if found is None or found.confidence[0] < self.min_confidence:
+                continue
+            self.stats["recovered"] += 1
+            self.remember(frame_nums[index], found.xyxy[0])
+            # The recovered ball replaces any low confidence one
+            frame_detections = detections[index]
+            refined[index] = type(frame_detections).merge(
+                [frame_detections[frame_detections.class_id != self.ball_class], found])
+        return refined
+
+    def remember(self, frame_num, bbox):
+        center = np.array([(bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2], dtype=np.float64)
+        # Recovered balls are remembered after the batch's confident ones, so keep frame order
+        self.history = sorted(self.history + [(frame_num, center)], key=lambda sighting: sighting[0])[-2:]
@@ -0,0 +1,137 @@
+import numpy as np
+from scipy.signal import lfilter
+from config import (BALL_INTERPOLATION_MAX_GAP, BALL_MAX_SPEED, BALL_OUTLIER_MAX_RUN, BALL_SMOOTHING,
+                    BALL_SMOOTHING_NOISE_RATIO)
+
+# Per-frame flags of a trajectory
+BALL_MISSING = 0
+BALL_OBSERVED = 1
+BALL_INTERPOLATED = 2
+
+
+class BallTrajectory:
+    """
+    Cleans up the per-frame ball boxes of a whole video, on arrays only:
+
+    1. outlier rejection: detections are cut into runs wherever the ball would have had
+       to move faster than max_speed (px per frame) to get from one to the next; short
+       runs (<= max_outlier_run detections) that aren't the longest are false positives;
+    2. linear interpolation over gaps of at most max_gap frames (held at the ends),
+       longer gaps stay missing instead of sliding the ball across the pitch;
+    3. optional smoothing with a steady-state constant-velocity Kalman (alpha-beta)
+       filter, run forward and backward over each continuous stretch.
+
+    Every step is linear in the number of frames.
+    """
+
+    def __init__(self, max_gap=BALL_INTERPOLATION_MAX_GAP, max_speed=BALL_MAX_SPEED,
+                 max_outlier_run=BALL_OUTLIER_MAX_RUN, smoothing=BALL_SMOOTHING,
+                 noise_ratio=BALL_SMOOTHING_NOISE_RATIO):
+        self.max_gap = max_gap
+        self.max_speed = max_speed
+        self.max_outlier_run = max_outlier_run
+        self.smoothing = smoothing
+        self.noise_ratio = noise_ratio
+        self.stats = {}
+
+    def as_config(self):
+        # What the trajectory depends on, for cache keys
+        return {"max_gap": self.max_gap, "max_speed": self.max_speed, "max_outlier_run": self.max_outlier_run,
+                "smoothing": self.smoothing, "noise_ratio": self.noise_ratio if self.smoothing else None}
+
+    def reject_outliers(self, frames, bboxes):
+        """Mask of the detections (at frames, in order) that are kept."""
+        kept = np.ones(len(frames), dtype=bool)
+        if self.max_speed is None or len(frames) < 2:
+            return kept
+
+        centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+        speed = np.sqrt((np.diff(centers, axis=0) ** 2).sum(axis=1)) / np.diff(frames)
+        run = np.r_[0, np.cumsum(speed > self.max_speed)]
+        run_length = np.bincount(run)
+        outlier_runs = (run_length <= self.max_outlier_run) & (np.arange(len(run_length)) != run_length.argmax())
+        return ~outlier_runs[run]
+
+    def interpolate(self, frames, bboxes, num_frames):
+        """(num_frames, 4) boxes and flags from the boxes seen at frames."""
+        flags = np.full(num_frames, BALL_MISSING, dtype=np.int8)
+        result = np.full((num_frames, 4), np.nan)
+        if len(frames) == 0:
+            return result, flags
+
+        every_frame = np.arange(num_frames)
+        for c in range(4):
+            result[:, c] = np.interp(every_frame, frames, bboxes[:, c])
+
+        # Length of the gap each frame sits in; the leading / trailing ones count up to the edge
+        after = np.searchsorted(frames, every_frame, side="left")
+        before = after - 1
+        gap_start = np.where(before >= 0, frames[np.maximum(before, 0)] + 1, 0)
+        gap_end = np.where(after < len(frames), frames[np.minimum(after, len(frames) - 1)], num_frames)
+        filled = gap_end - gap_start <= self.max_gap if self.max_gap is not None else np.ones(num_frames, bool)
+
+        flags[filled] = BALL_INTERPOLATED
+        flags[frames] = BALL_OBSERVED
+        result[flags == BALL_MISSING] = np.nan
+        return result, flags
+
+    def alpha_beta_gains(self):
+        # Steady-state gains of a constant-velocity Kalman filter (Kalata's tracking index)
+        ratio = self.noise_ratio
+        r = (4 + ratio - np.sqrt(8 * ratio + ratio ** 2)) / 4
+        alpha = 1 - r ** 2
+        beta = 2 * (2 - alpha) - 4 * np.sqrt(1 - alpha)
+        return alpha, beta
+
+    @staticmethod
+    def alpha_beta(positions, alpha, beta):
+        """
+        One alpha-beta pass over (n, 4) positions, started on the first two (no transient).
+        The filter is linear, so it runs as the equivalent IIR filter in one lfilter call:
+        position = (alpha + (beta - alpha) z^-1) / (1 - (2 - alpha - beta) z^-1 + (1 - alpha) z^-2).
+        """
+        b = np.array([alpha, beta - alpha])
+        a = np.array([1.0, -(2 - alpha - beta), 1 - alpha])
+        # Filter state after the first position, as if the ball had been moving at the
+        # velocity of the first step all along (so no residual before it)
+        start, velocity = positions[0], positions[1] - positions[0]
+        zi = np.stack([b[1] * start - a[1] * start - a[2] * (start - velocity), -a[2] * start])
+
+        filtered = np.empty_like(positions)
+        filtered[0] = start
+        filtered[1:], _ = lfilter(b, a, positions[1:], axis=0, zi=zi)
+        return filtered
+
+    def smooth(self, bboxes, flags):
+        """bboxes run through the alpha-beta filter forwards and backwards, per continuous stretch."""
+        alpha, beta = self.alpha_beta_gains()
+
+        present = flags != BALL_MISSING
+        edges = np.flatnonzero(np.diff(np.r_[False, present, False].astype(np.int8)))
+        smoothed = bboxes.copy()
+        for start, end in zip(edges[::2], edges[1::2]):
+            if end - start > 1:
+                forward = self.alpha_beta(bboxes[start:end], alpha, beta)
+                # Backwards over the forward pass cancels its lag
+                smoothed[start:end] = self.alpha_beta(forward[::-1], alpha, beta)[::-1]
+        return smoothed
+
+    def process(self, bboxes):
+        """
+        Clean trajectory from (num_frames, 4) boxes with NaN (or all-zero) rows where no
+        ball was detected. Returns the boxes (NaN where still missing) and per-frame flags
+        (BALL_OBSERVED / BALL_INTERPOLATED / BALL_MISSING).
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        seen = ~np.isnan(bboxes).any(axis=1) & (bboxes != 0).any(axis=1)
+        frames = np.flatnonzero(seen)
+
+        kept = self.reject_outliers(frames, bboxes[frames])
+        result, flags = self.interpolate(frames[kept], bboxes[frames[kept]], len(bboxes))
+        if self.smoothing:
+            result = self.smooth(result, flags)
+
+        self.stats = {"observed": int((flags == BALL_OBSERVED).sum()), "rejected": int((~kept).sum()),
+                      "interpolated": int((flags == BALL_INTERPOLATED).sum()),
+                      "missing": int((flags == BALL_MISSING).sum())}
+        return result, flags
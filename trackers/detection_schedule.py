@@ -0,0 +1,279 @@
+import itertools
+import cv2
+import numpy as np
+from config import DETAIL_LEVEL, DETECTION_SCHEDULES, BATCH_SIZE, CONFIDENCE_THRESHOLD
+from .track_table import OBJECT_TYPES
+
+
+class DetectionSchedule:
+    """
+    When the detector has to run. Every keyframe_interval-th frame is a keyframe, and
+    so is any frame whose mean absolute difference to the previous one (0-255, on a
+    downscaled grayscale) exceeds motion_threshold, or whose propagated boxes kept less
+    than min_track_quality of their optical flow points. keyframe_interval=1 is "Full".
+    """
+
+    def __init__(self, keyframe_interval=1, motion_threshold=None, min_track_quality=0.0, name=None):
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.motion_threshold = motion_threshold
+        self.min_track_quality = min_track_quality
+        self.name = name
+
+    @classmethod
+    def for_detail_level(cls, detail_level=DETAIL_LEVEL):
+        if detail_level not in DETECTION_SCHEDULES:
+            raise ValueError(f"Unknown detail level '{detail_level}', expected one of {list(DETECTION_SCHEDULES)}")
+        return cls(name=detail_level, **DETECTION_SCHEDULES[detail_level])
+
+    @property
+    def is_full(self):
+        return self.keyframe_interval == 1
+
+    def as_config(self):
+        # What the results depend on, for cache keys
+        if self.is_full:
+            return {"keyframe_interval": 1}
+        return {"keyframe_interval": self.keyframe_interval, "motion_threshold": self.motion_threshold,
+                "min_track_quality": self.min_track_quality}
+
+
+class ScheduleReport:
+    """
+    Detector calls made and saved by a schedule, plus its accuracy against Full if known.
+    tile_calls / sweep_calls count the keyframes that also got a ball tile / sweep pass.
+    """
+
+    def __init__(self, detail_level=None, frames=0, keyframes=0, motion_keyframes=0, quality_keyframes=0,
+                 accuracy=None, tile_calls=0, sweep_calls=0):
+        self.detail_level = detail_level
+        self.frames = frames
+        self.keyframes = keyframes
+        self.motion_keyframes = motion_keyframes
+        self.quality_keyframes = quality_keyframes
+        self.accuracy = accuracy
+        self.tile_calls = tile_calls
+        self.sweep_calls = sweep_calls
+
+    @property
+    def saved(self):
+        """Fraction of frames the detector did not run on."""
+        return 1 - self.keyframes / self.frames if self.frames else 0.0
+
+    def as_dict(self):
+        return {"detail_level": self.detail_level, "frames": self.frames, "keyframes": self.keyframes,
+                "motion_keyframes": self.motion_keyframes, "quality_keyframes": self.quality_keyframes,
+                "accuracy": self.accuracy, "tile_calls": self.tile_calls, "sweep_calls": self.sweep_calls}
+
+    def summary(self):
+        text = (f"Detector ran on {self.keyframes}/{self.frames} frames "
+                f"({100 * self.saved:.0f}% of calls saved, {self.detail_level})")
+        if self.tile_calls or self.sweep_calls:
+            text += f", plus ball tiles on {self.tile_calls} and sweeps on {self.sweep_calls} of them"
+        if self.accuracy:
+            text += " | vs Full: " + ", ".join(
+                f"{obj_type} recall {100 * stats['recall']:.1f}% IoU {stats['mean_iou']:.2f}"
+                for obj_type, stats in self.accuracy.items())
+        return text
+
+
+class KeyframeDetector:
+    """
+    Runs the model on keyframes only; in between, each box is moved by the median optical
+    flow of a few points inside it. The propagated boxes keep their class and keyframe
+    confidence (scaled by how many of their points were tracked) and go through ByteTrack
+    like real detections, so track ids carry over between keyframes.
+    """
+
+    # Propagation works on 1 / 2**level frames
+    flow_level = 1
+    # Points sampled per box, on a grid x grid layout
+    grid = 3
+
+    def __init__(self, detector, schedule, confidence=CONFIDENCE_THRESHOLD, ball_detector=None):
+        self.detector = detector
+        self.schedule = schedule
+        self.confidence = confidence
+        # A BallTileDetector refining the keyframes; a recovered ball is propagated like the rest
+        self.ball_detector = ball_detector
+        self.lk_params = dict(winSize=(15, 15), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.report = ScheduleReport(schedule.name)
+
+    def small_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        for _ in range(self.flow_level):
+            gray = cv2.resize(gray, (max(1, gray.shape[1] // 2), max(1, gray.shape[0] // 2)),
+                              interpolation=cv2.INTER_AREA)
+        return gray
+
+    def predict(self, frame_nums, frames):
+        detections = self.detector.detect(frames, conf=self.confidence)
+        if self.ball_detector is not None:
+            detections = self.ball_detector.refine(frame_nums, frames, detections)
+        return detections
+
+    def propagate(self, detections, old_gray, new_gray, keyframe_confidence=None):
+        """
+        detections moved from old_gray's frame to new_gray's, and the fraction of points tracked.
+        Each box's confidence is its keyframe_confidence (row-aligned, default detections.confidence)
+        times its fraction of points tracked in this step, so it doesn't decay with every frame
+        since the keyframe.
+        """
+        if len(detections) == 0:
+            return detections, 1.0
+
+        scale = 2 ** self.flow_level
+        boxes = detections.xyxy.astype(np.float32) / scale
+        steps = (np.arange(self.grid, dtype=np.float32) + 0.5) / self.grid
+        fx, fy = np.meshgrid(steps, steps)
+        # (boxes, grid * grid, 2) points spread inside each box
+        points = np.stack([boxes[:, None, 0] + fx.ravel()[None] * (boxes[:, None, 2] - boxes[:, None, 0]),
+                           boxes[:, None, 1] + fy.ravel()[None] * (boxes[:, None, 3] - boxes[:, None, 1])], axis=2)
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(old_gray, new_gray, points.reshape(-1, 1, 2), None,
+                                                         **self.lk_params)
+        status = status.reshape(len(boxes), -1).astype(bool)
+        flow = (new_points.reshape(points.shape) - points) * scale
+
+        # Median flow of the tracked points per box; boxes that lost every point stay put
+        shift = np.zeros((len(boxes), 2), dtype=np.float32)
+        tracked = status.any(axis=1)
+        shift[tracked] = np.nanmedian(np.where(status[tracked, :, None], flow[tracked], np.nan), axis=1)
+        box_quality = status.mean(axis=1)
+
+        confidence = detections.confidence if keyframe_confidence is None else keyframe_confidence
+        if confidence is not None:
+            confidence = confidence * box_quality
+        fields = dict(
+            xyxy=detections.xyxy + np.tile(shift, 2),
+            confidence=confidence,
+            class_id=None if detections.class_id is None else detections.class_id.copy(),
+        )
+        if getattr(detections, 'data', None):
+            fields['data'] = {key: np.copy(value) for key, value in detections.data.items()}
+        moved = type(detections)(**fields)
+        return moved, float(box_quality.mean())
+
+    def detect_batches(self, frames):
+        """Same contract as Tracker.detect_batches: (batch_frames, detections) per BATCH_SIZE batch."""
+        frames = iter(frames)
+        last_detections, last_gray, keyframe_confidence = None, None, None
+        since_keyframe, first = 0, 0
+        while True:
+            batch = list(itertools.islice(frames, BATCH_SIZE))
+            if not batch:
+                break
+            grays = [self.small_gray(frame) for frame in batch]
+
+            # Keyframes known up front (interval, motion) are detected in one batched call
+            planned = {}
+            prev_gray, count = last_gray, since_keyframe
+            for i, gray in enumerate(grays):
+                motion = prev_gray is not None and self.schedule.motion_threshold is not None and \
+                    float(cv2.absdiff(prev_gray, gray).mean()) > self.schedule.motion_threshold
+                if prev_gray is None or count + 1 >= self.schedule.keyframe_interval or motion:
+                    planned[i] = 'motion' if motion and count + 1 < self.schedule.keyframe_interval else 'interval'
+                    count = 0
+                else:
+                    count += 1
+                prev_gray = gray
+            predicted = dict(zip(planned, self.predict([first + i for i in planned],
+                                                       [batch[i] for i in planned]))) if planned else {}
+
+            detections = []
+            for i, gray in enumerate(grays):
+                if i in predicted:
+                    current = predicted[i]
+                    self.report.keyframes += 1
+                    self.report.motion_keyframes += planned[i] == 'motion'
+                    since_keyframe = 0
+                    keyframe_confidence = current.confidence
+                else:
+                    current, quality = self.propagate(last_detections, last_gray, gray, keyframe_confidence)
+                    since_keyframe += 1
+                    # Flow lost too many points: detect this frame after all
+                    if quality < self.schedule.min_track_quality:
+                        current = self.predict([first + i], [batch[i]])[0]
+                        self.report.keyframes += 1
+                        self.report.quality_keyframes += 1
+                        keyframe_confidence = current.confidence
+                self.report.frames += 1
+                detections.append(current)
+                last_detections, last_gray = current, gray
+            first += len(batch)
+            yield batch, detections
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) / (M, 4) xyxy arrays."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def match_boxes(ref, cand, iou_threshold):
+    """IoUs of the greedy one-to-one matches (best IoU first) between two lists of boxes."""
+    if not len(ref) or not len(cand):
+        return []
+    iou = box_iou(ref, cand)
+    ious = []
+    for flat in np.argsort(iou, axis=None)[::-1]:
+        r, c = divmod(int(flat), iou.shape[1])
+        if iou[r, c] < iou_threshold:
+            break
+        if np.isnan(iou[r, c]):
+            continue
+        ious.append(iou[r, c])
+        iou[r, :] = np.nan
+        iou[:, c] = np.nan
+    return ious
+
+
+def accuracy_stats(ious, reference_boxes, candidate_boxes):
+    return {
+        "recall": len(ious) / reference_boxes if reference_boxes else 1.0,
+        "precision": len(ious) / candidate_boxes if candidate_boxes else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+    }
+
+
+def compare_tracks(reference, tracks, iou_threshold=0.5):
+    """
+    Box-level accuracy of tracks against reference tracks (e.g. a keyframe schedule
+    against Full): per object type, recall / precision of boxes matched one-to-one at
+    iou_threshold and the mean IoU of the matches. Track ids are not compared.
+    """
+    accuracy = {}
+    for obj_type in reference:
+        ious, reference_boxes, candidate_boxes = [], 0, 0
+        for ref_frame, frame in zip(reference[obj_type], tracks.get(obj_type, [])):
+            ref = [info['bbox'] for info in ref_frame.values()]
+            cand = [info['bbox'] for info in frame.values()]
+            reference_boxes += len(ref)
+            candidate_boxes += len(cand)
+            ious += match_boxes(ref, cand, iou_threshold)
+        accuracy[obj_type] = accuracy_stats(ious, reference_boxes, candidate_boxes)
+    return accuracy
+
+
+def compare_tables(reference, table, iou_threshold=0.5):
+    """compare_tracks on two TrackTables, straight from their bbox columns."""
+    accuracy = {}
+    num_frames = min(reference.num_frames, table.num_frames)
+    for obj_type in OBJECT_TYPES:
+        ious, reference_boxes, candidate_boxes = [], 0, 0
+        for frame_num in range(num_frames):
+            ref = reference['bbox'][reference.frame_rows(frame_num, obj_type)]
+            cand = table['bbox'][table.frame_rows(frame_num, obj_type)]
+            reference_boxes += len(ref)
+            candidate_boxes += len(cand)
+            ious += match_boxes(ref, cand, iou_threshold)
+        accuracy[obj_type] = accuracy_stats(ious, reference_boxes, candidate_boxes)
+    return accuracy
@@ -0,0 +1,266 @@
+import ast
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from config import DETECTOR_BACKEND, INFERENCE_IMGSZ, MODEL_PATH, ONNX_THREADS, ONNX_NMS_IOU, ONNX_MAX_DETECTIONS
+
+DETECTOR_BACKENDS = ("pytorch", "onnx", "onnx-int8")
+
+
+class DetectorBackend:
+    """
+    What the trackers need from a detector: class `names` ({id: name}) and `detect`,
+    which turns a list of BGR frames into one sv.Detections per frame, in frame coordinates.
+    """
+
+    name = None
+    names = {}
+
+    def __init__(self, imgsz=INFERENCE_IMGSZ):
+        # Input size must be a multiple of the model stride (32)
+        self.imgsz = int(np.ceil(imgsz / 32) * 32)
+        # For backends whose model can't run from several threads at once
+        self.lock = threading.Lock()
+
+    def detect(self, frames, conf, imgsz=None):
+        raise NotImplementedError
+
+    def warmup(self):
+        """One inference on a blank frame, so the first real batch doesn't pay for lazy initialization."""
+        self.detect([np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)], conf=0.5)
+
+
+class TimedDetector:
+    """A detector whose detect() calls (one per batch) are reported to a Metrics as latency samples."""
+
+    def __init__(self, detector, metrics, operation="inference"):
+        self.detector = detector
+        self.metrics = metrics
+        self.operation = operation
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+    def detect(self, frames, conf, imgsz=None):
+        start = time.perf_counter()
+        detections = self.detector.detect(frames, conf, imgsz)
+        self.metrics.observe(self.operation, time.perf_counter() - start, items=len(frames))
+        return detections
+
+
+class UltralyticsBackend(DetectorBackend):
+    """The PyTorch .pt model through ultralytics, as the tracker always ran it."""
+
+    name = "pytorch"
+
+    def __init__(self, model_path=MODEL_PATH, imgsz=INFERENCE_IMGSZ):
+        super().__init__(imgsz)
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+
+    def detect(self, frames, conf, imgsz=None):
+        import supervision as sv
+        # The ultralytics predictor keeps per-call state, so a shared model predicts one batch at a time
+        with self.lock:
+            results = self.model.predict(frames, conf=conf, imgsz=imgsz or self.imgsz)
+        detections = [sv.Detections.from_ultralytics(result) for result in results]
+        del results
+        return detections
+
+
+class OnnxBackend(DetectorBackend):
+    """
+    A YOLOv8 model exported to ONNX (see export_onnx), run with ONNX Runtime on the CPU.
+    Pre- and post-processing follow ultralytics: letterbox to a square imgsz, then
+    class-aware NMS on the (4 + classes, anchors) output, so boxes match the PyTorch backend.
+    """
+
+    name = "onnx"
+
+    def __init__(self, onnx_path, imgsz=INFERENCE_IMGSZ, threads=ONNX_THREADS, names=None):
+        super().__init__(imgsz)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+
+        # ultralytics stores the class names in the model metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = names or {int(k): v for k, v in ast.literal_eval(metadata["names"]).items()}
+
+        # A static export only takes its own batch and size
+        batch, _, height, _ = self.input.shape
+        self.fixed_batch = batch if isinstance(batch, int) else None
+        self.fixed_imgsz = height if isinstance(height, int) else None
+
+    def letterbox(self, frame, imgsz):
+        """frame resized into an imgsz square (gray padding), plus the scale and padding used."""
+        h, w = frame.shape[:2]
+        scale = min(imgsz / h, imgsz / w)
+        new_w, new_h = int(round(w * scale)), int(round(h * scale))
+        pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+
+        image = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        image[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        return image, scale, (left, top)
+
+    def preprocess(self, frames, imgsz):
+        letterboxed = [self.letterbox(frame, imgsz) for frame in frames]
+        # BGR HWC uint8 -> RGB CHW float 0-1
+        batch = np.stack([image for image, _, _ in letterboxed])[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        return batch, [(scale, pad) for _, scale, pad in letterboxed]
+
+    def postprocess(self, output, conf, scale, pad, frame_shape):
+        """One image's (4 + classes, anchors) output as sv.Detections in frame coordinates."""
+        import supervision as sv
+        scores = output[4:]
+        class_id = scores.argmax(axis=0)
+        confidence = scores[class_id, np.arange(scores.shape[1])]
+        keep = confidence > conf
+        if not keep.any():
+            return sv.Detections.empty()
+
+        cx, cy, w, h = output[:4, keep]
+        class_id, confidence = class_id[keep], confidence[keep]
+        xywh = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+        indices = np.asarray(cv2.dnn.NMSBoxesBatched(xywh.tolist(), confidence.tolist(), class_id.tolist(),
+                                                     conf, ONNX_NMS_IOU), dtype=int).reshape(-1)
+        indices = indices[np.argsort(-confidence[indices], kind="stable")][:ONNX_MAX_DETECTIONS]
+
+        xyxy = xywh[indices].copy()
+        xyxy[:, 2:] += xyxy[:, :2]
+        xyxy -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=xyxy.dtype)
+        xyxy /= scale
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, frame_shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, frame_shape[0])
+        return sv.Detections(xyxy=xyxy.astype(np.float32), confidence=confidence[indices].astype(np.float32),
+                             class_id=class_id[indices].astype(int))
+
+    def detect(self, frames, conf, imgsz=None):
+        if not frames:
+            return []
+        imgsz = self.fixed_imgsz or int(np.ceil((imgsz or self.imgsz) / 32) * 32)
+        step = self.fixed_batch or len(frames)
+
+        detections = []
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            batch, transforms = self.preprocess(chunk, imgsz)
+            (outputs,) = self.session.run(None, {self.input.name: batch})
+            detections.extend(self.postprocess(output, conf, scale, pad, frame.shape)
+                              for output, (scale, pad), frame in zip(outputs, transforms, chunk))
+        return detections
+
+
+def onnx_model_path(model_path=MODEL_PATH, int8=False):
+    """Where the exported model of model_path lives: best.pt -> best.onnx / best.int8.onnx."""
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}.int8.onnx" if int8 else f"{stem}.onnx"
+
+
+def export_onnx(model_path=MODEL_PATH, imgsz=INFERENCE_IMGSZ):
+    """Export the .pt model to ONNX with dynamic batch and input size; returns its path."""
+    from ultralytics import YOLO
+    exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    target = onnx_model_path(model_path)
+    if os.path.abspath(exported) != os.path.abspath(target):
+        os.replace(exported, target)
+    return target
+
+
+class _CalibrationReader:
+    """Feeds calibration frames to the INT8 quantizer, one letterboxed frame at a time."""
+
+    def __init__(self, backend, frames, imgsz):
+        self.backend = backend
+        self.frames = iter(frames)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            return None
+        batch, _ = self.backend.preprocess([frame], self.imgsz)
+        return {self.backend.input.name: batch}
+
+    def rewind(self):
+        pass
+
+
+def quantize_onnx(onnx_path, calibration_frames, output_path=None, imgsz=INFERENCE_IMGSZ):
+    """
+    Static INT8 quantization (QDQ, per-channel weights) of an exported model, calibrated on
+    calibration_frames (a few dozen frames of a typical clip). The detection head's
+    post-processing stays in float: quantizing the box decoding costs far more accuracy
+    than it saves time.
+    """
+    import onnx
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output_path = output_path or onnx_path.replace(".onnx", ".int8.onnx")
+    prepared_path = output_path + ".prep"
+    quant_pre_process(onnx_path, prepared_path)
+
+    # The head is the last "/model.N/" block; only its convolutions are quantized
+    nodes = onnx.load(prepared_path).graph.node
+    blocks = [int(node.name.split("/")[1].split(".")[1]) for node in nodes if node.name.startswith("/model.")]
+    head = f"/model.{max(blocks)}/" if blocks else None
+    excluded = [node.name for node in nodes if head and node.name.startswith(head) and node.op_type != "Conv"]
+
+    reader = _CalibrationReader(OnnxBackend(onnx_path, imgsz), calibration_frames, imgsz)
+    try:
+        quantize_static(prepared_path, output_path, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, nodes_to_exclude=excluded)
+    finally:
+        os.remove(prepared_path)
+
+    # Keep the class names the ONNX backend reads from the metadata
+    source, quantized = onnx.load(onnx_path), onnx.load(output_path)
+    onnx.helper.set_model_props(quantized, {prop.key: prop.value for prop in source.metadata_props})
+    onnx.save(quantized, output_path)
+    return output_path
+
+
+def load_detector(backend=DETECTOR_BACKEND, model_path=MODEL_PATH, imgsz=INFERENCE_IMGSZ):
+    """
+    Detector for a backend name: "pytorch" (ultralytics, the .pt model), "onnx" (exported
+    on first use) or "onnx-int8" (needs `python validate_backend.py export --int8` first,
+    which calibrates on a sample clip).
+    """
+    if backend == "pytorch":
+        return UltralyticsBackend(model_path, imgsz)
+    if backend == "onnx":
+        onnx_path = onnx_model_path(model_path)
+        if not os.path.exists(onnx_path):
+            export_onnx(model_path, imgsz)
+        return OnnxBackend(onnx_path, imgsz)
+    if backend == "onnx-int8":
+        onnx_path = onnx_model_path(model_path, int8=True)
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"{onnx_path} not found - run `python validate_backend.py export --int8 "
+                                    f"--video <sample clip>` to quantize the model")
+        backend = OnnxBackend(onnx_path, imgsz)
+        backend.name = "onnx-int8"
+        return backend
+    raise ValueError(f"Unknown detector backend '{backend}', expected one of {list(DETECTOR_BACKENDS)}")
+
+
+def detections_by_class(detections, names):
+    """Per-frame detections in the tracks layout ({class name: [{index: {'bbox'}}]}), for compare_tracks."""
+    tracks = {name: [] for name in names.values()}
+    for frame_detections in detections:
+        for name in tracks:
+            tracks[name].append({})
+        for i, (bbox, class_id) in enumerate(zip(frame_detections.xyxy, frame_detections.class_id)):
+            tracks[names[int(class_id)]][-1][i] = {"bbox": bbox.tolist()}
+    return tracks
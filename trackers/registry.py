@@ -0,0 +1,40 @@
+import os
+import threading
+from config import DETECTOR_BACKEND, INFERENCE_IMGSZ, MODEL_PATH, MODEL_WARMUP
+from .detector_backend import load_detector
+
+
+class ModelRegistry:
+    """
+    Detectors shared by the whole process: each (backend, model, imgsz) is loaded and
+    warmed up (one blank inference) the first time it is asked for, then handed to
+    every Tracker. Trackers keep their own ByteTrack / schedule state, so each job
+    still gets fresh tracking; only the weights are shared. Safe to use from worker threads.
+
+        model_registry.detector()            # at startup: load + warm up
+        tracker = Tracker(MODEL_PATH, "Fast")  # per job: no weight loading
+    """
+
+    def __init__(self, warmup=MODEL_WARMUP):
+        self.warmup = warmup
+        self.detectors = {}
+        self.lock = threading.Lock()
+
+    def detector(self, backend=DETECTOR_BACKEND, model_path=MODEL_PATH, imgsz=INFERENCE_IMGSZ):
+        key = (backend, os.path.abspath(model_path), int(imgsz))
+        # One lock for everything: loading a model twice costs more than waiting for it
+        with self.lock:
+            if key not in self.detectors:
+                detector = load_detector(backend, model_path, imgsz)
+                if self.warmup:
+                    detector.warmup()
+                self.detectors[key] = detector
+            return self.detectors[key]
+
+    def clear(self):
+        """Drop every loaded detector (the next request loads it again)."""
+        with self.lock:
+            self.detectors.clear()
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from config import TRACK_CACHE_DIR, TRACK_CACHE_MAX_BYTES, TRACK_CACHE_FULL_HASH
+from .track_table import TrackTable
+
+# Columns written for every cache entry; the rest are derived later in the pipeline
+CACHED_COLUMNS = ("frame", "cls", "track_id", "bbox")
+
+
+def compute_file_hash(filepath, block_size=65536):
+    """Compute MD5 hash of a file for cache validation."""
+    md5 = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def video_fingerprint(filepath, sample_blocks=16, block_size=65536, full_hash=False):
+    """
+    Cheap identity of a video file: size, mtime and a few blocks spread over the file
+    (first and last included), so a multi-GB match is not read end to end on every run.
+    full_hash=True adds the MD5 of the whole file for when mtimes can't be trusted.
+    """
+    stat = os.stat(filepath)
+    md5 = hashlib.md5(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    with open(filepath, "rb") as f:
+        last_block = max(stat.st_size - block_size, 0)
+        for offset in sorted({int(i) for i in np.linspace(0, last_block, sample_blocks)}):
+            f.seek(offset)
+            md5.update(f.read(block_size))
+
+    if full_hash:
+        md5.update(compute_file_hash(filepath, block_size).encode())
+    return md5.hexdigest()
+
+
+class TrackCache:
+    """
+    Detection + tracking results on disk, one directory of raw .npy columns per
+    (video fingerprint, tracker config). Entries load memory-mapped (copy-on-write),
+    without unpickling, and the least recently used ones are evicted once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=TRACK_CACHE_DIR, max_bytes=TRACK_CACHE_MAX_BYTES, full_hash=TRACK_CACHE_FULL_HASH):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.full_hash = full_hash
+
+    def entry_path(self, video_path, config):
+        """Reproducible entry directory for video + config."""
+        base_name = os.path.splitext(os.path.basename(video_path))[0] if video_path else "video"
+        video_hash = video_fingerprint(video_path, full_hash=self.full_hash)[:16] if video_path else "nohash"
+        config_hash = hashlib.md5(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:8]
+        return os.path.join(self.cache_dir, f"{base_name}_{video_hash}_{config_hash}")
+
+    def load(self, entry_path):
+        """TrackTable of a cached entry, or None on a miss."""
+        meta_path = os.path.join(entry_path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(entry_path, f"{name}.npy"), mmap_mode="c")
+                  for name in CACHED_COLUMNS}
+
+        table = TrackTable(arrays["frame"], arrays["cls"], arrays["track_id"], meta["num_frames"])
+        table.columns["bbox"] = arrays["bbox"]
+        table.filled.add("bbox")
+
+        # Last access time drives eviction
+        os.utime(meta_path)
+        return table
+
+    def load_meta(self, entry_path):
+        """meta.json of an entry: num_frames, config and whatever report was saved with it."""
+        meta_path = os.path.join(entry_path, "meta.json")
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def save(self, entry_path, table, config=None, report=None):
+        """Write table's tracker columns as an entry, then evict down to the budget."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Written next to the final location and renamed, so readers never see half an entry
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        try:
+            arrays = {"frame": table.frame, "cls": table.cls, "track_id": table.track_id, "bbox": table["bbox"]}
+            for name in CACHED_COLUMNS:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+            with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+                json.dump({"num_frames": table.num_frames, "config": config, "report": report}, f, default=str)
+
+            if os.path.exists(entry_path):
+                shutil.rmtree(entry_path)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self.evict(keep=entry_path)
+
+    @staticmethod
+    def entry_size(entry_path):
+        return sum(entry.stat().st_size for entry in os.scandir(entry_path) if entry.is_file())
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        if self.max_bytes is None or not os.path.isdir(self.cache_dir):
+            return
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            meta_path = os.path.join(entry.path, "meta.json")
+            if entry.is_dir() and os.path.exists(meta_path):
+                entries.append((os.stat(meta_path).st_mtime, entry.path, self.entry_size(entry.path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
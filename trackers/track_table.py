@@ -0,0 +1,340 @@
+import numpy as np
+from collections.abc import Mapping, MutableMapping, Sequence
+
+OBJECT_TYPES = ("players", "referees", "ball")
+
+# name: (dtype, per-row shape, missing value)
+COLUMNS = {
+    "bbox": (np.float32, (4,), np.nan),
+    "position": (np.float32, (2,), np.nan),
+    "position_adjusted": (np.float32, (2,), np.nan),
+    "position_transformed": (np.float32, (2,), np.nan),
+    "team_id": (np.int16, (), -1),
+    "has_ball": (np.bool_, (), False),
+    "interpolated": (np.bool_, (), False),
+    "speed": (np.float64, (), np.nan),
+    "acceleration": (np.float64, (), np.nan),
+    "distance": (np.float64, (), np.nan),
+}
+
+# Fields that exist but hold None in the dict layout (outside the court)
+NULLABLE = {"position_transformed"}
+
+_MISSING = object()
+
+
+class TrackTable:
+    """
+    Columnar store for every tracked object of a video: one row per (frame, object),
+    NumPy columns for the fields in COLUMNS, rows sorted by frame then object type.
+
+    frame_rows(frame_num, obj_type) and track_rows(obj_type, track_id) give index
+    ranges, so stages can work on whole columns at once. as_tracks() is a view with
+    the old tracks[obj_type][frame_num][track_id][field] access for the code that
+    still walks dicts; reads and writes go straight to the columns.
+    """
+
+    def __init__(self, frame, cls, track_id, num_frames):
+        self.frame = np.asarray(frame, dtype=np.int32)
+        self.cls = np.asarray(cls, dtype=np.int8)
+        self.track_id = np.asarray(track_id, dtype=np.int64)
+        self.num_frames = num_frames
+
+        self.columns = {}
+        for name, (dtype, shape, missing) in COLUMNS.items():
+            self.columns[name] = np.full((len(self.frame),) + shape, missing, dtype=dtype)
+        # Columns that have been written at least once (a missing field vs. not computed yet)
+        self.filled = set()
+        self.team_colors = {}
+        # Fields outside the schema set through the compat view, {(row, field): value}
+        self.extras = {}
+
+        # Offsets of each (frame, object type) group; rows must already be in that order
+        group = self.frame.astype(np.int64) * len(OBJECT_TYPES) + self.cls
+        if len(group) and np.any(np.diff(group) < 0):
+            raise ValueError("TrackTable rows must be sorted by frame and object type")
+        self.group_offsets = np.searchsorted(group, np.arange(num_frames * len(OBJECT_TYPES) + 1))
+        self._track_index = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name][...] = values
+        self.filled.add(name)
+
+    # ---------------- BUILDING ---------------- #
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """Build a table from the usual tracks[obj_type][frame_num][track_id] dicts."""
+        num_frames = max((len(tracks.get(obj_type, [])) for obj_type in OBJECT_TYPES), default=0)
+        frames, classes, track_ids, rows = [], [], [], []
+        for frame_num in range(num_frames):
+            for cls_index, obj_type in enumerate(OBJECT_TYPES):
+                object_tracks = tracks.get(obj_type, [])
+                if frame_num >= len(object_tracks):
+                    continue
+                for track_id, track_info in object_tracks[frame_num].items():
+                    frames.append(frame_num)
+                    classes.append(cls_index)
+                    track_ids.append(track_id)
+                    rows.append(track_info)
+
+        table = cls(frames, classes, track_ids, num_frames)
+        # One bulk assignment per column; anything else goes through set_value
+        for field, (_, shape, missing) in COLUMNS.items():
+            present = [(row, info[field]) for row, info in enumerate(rows) if field in info]
+            if present:
+                indices, values = zip(*present)
+                missing_value = np.full(shape, missing) if shape else missing
+                table.columns[field][list(indices)] = [missing_value if v is None else v for v in values]
+                table.filled.add(field)
+        for row, track_info in enumerate(rows):
+            for field, value in track_info.items():
+                if field not in COLUMNS:
+                    table.set_value(row, field, value)
+        return table
+
+    @classmethod
+    def from_frame_rows(cls, frame_rows):
+        """Build a table from each frame's (cls, track_id, bbox) arrays, ordered by object type."""
+        if not frame_rows:
+            return cls([], [], [], 0)
+        classes, track_ids, bboxes = zip(*frame_rows)
+        frames = np.repeat(np.arange(len(frame_rows)), [len(c) for c in classes])
+        table = cls(frames, np.concatenate(classes), np.concatenate(track_ids), len(frame_rows))
+        table['bbox'] = np.concatenate(bboxes).reshape(-1, 4)
+        return table
+
+    def replace_rows(self, obj_type, frame, track_id, **columns):
+        """
+        New table with obj_type's rows replaced by the given ones: their frame numbers,
+        track id(s) and column values; every other row keeps its values.
+        """
+        keep = np.flatnonzero(~self.type_mask(obj_type))
+        frame = np.asarray(frame, dtype=np.int32)
+        frames = np.concatenate([self.frame[keep], frame])
+        classes = np.concatenate([self.cls[keep], np.full(len(frame), OBJECT_TYPES.index(obj_type), np.int8)])
+        track_ids = np.concatenate([self.track_id[keep], np.broadcast_to(np.asarray(track_id, np.int64), frame.shape)])
+        # Stable, so the kept rows of a frame stay in their order
+        order = np.lexsort((classes, frames))
+        table = TrackTable(frames[order], classes[order], track_ids[order], self.num_frames)
+
+        for name, column in self.columns.items():
+            added = np.full((len(frame),) + column.shape[1:], COLUMNS[name][2], dtype=column.dtype)
+            if name in columns:
+                added[...] = columns[name]
+            table.columns[name] = np.concatenate([column[keep], added])[order]
+        table.filled = self.filled | set(columns)
+        table.team_colors = dict(self.team_colors)
+
+        new_rows = np.full(len(self), -1, dtype=np.int64)
+        new_rows[keep] = np.argsort(order)[:len(keep)]
+        table.extras = {(int(new_rows[row]), field): value for (row, field), value in self.extras.items()
+                        if new_rows[row] != -1}
+        return table
+
+    def to_tracks(self):
+        """Plain nested dicts again (what get_object_tracks returns, what pickles, ...)."""
+        tracks = {obj_type: [{} for _ in range(self.num_frames)] for obj_type in OBJECT_TYPES}
+        fields = [(field, self._python_values(field)) for field in COLUMNS if field in self.filled]
+        team_ids = self.columns["team_id"].tolist()
+        extras = {}
+        for (row, field), value in self.extras.items():
+            extras.setdefault(row, {})[field] = value
+
+        for row, (frame_num, cls_index, track_id) in enumerate(zip(self.frame.tolist(), self.cls.tolist(),
+                                                                 self.track_id.tolist())):
+            info = {field: values[row] for field, values in fields if values[row] is not _MISSING}
+            if team_ids[row] in self.team_colors:
+                info["team_color"] = self.team_colors[team_ids[row]]
+            info.update(extras.get(row, ()))
+            tracks[OBJECT_TYPES[cls_index]][frame_num][track_id] = info
+        return tracks
+
+    def _python_values(self, field):
+        # Column as Python values, _MISSING where the field is absent (None where it is nullable)
+        column = self.columns[field]
+        if column.dtype == np.bool_:
+            present = column
+        elif field == "team_id":
+            present = column != -1
+        else:
+            present = ~np.isnan(column).reshape(len(column), -1).any(axis=1)
+        absent = None if field in NULLABLE else _MISSING
+        return [value if ok else absent for value, ok in zip(column.tolist(), present.tolist())]
+
+    # ---------------- INDEXING ---------------- #
+
+    def frame_rows(self, frame_num, obj_type=None):
+        """Slice of the rows of frame_num (only obj_type's if given)."""
+        n = len(OBJECT_TYPES)
+        if obj_type is None:
+            return slice(int(self.group_offsets[frame_num * n]), int(self.group_offsets[(frame_num + 1) * n]))
+        group = frame_num * n + OBJECT_TYPES.index(obj_type)
+        return slice(int(self.group_offsets[group]), int(self.group_offsets[group + 1]))
+
+    def type_mask(self, obj_type):
+        return self.cls == OBJECT_TYPES.index(obj_type)
+
+    def _build_track_index(self):
+        # Rows ordered by object type, track id, frame; plus where each track starts
+        order = np.lexsort((self.frame, self.track_id, self.cls))
+        keys = np.stack([self.cls[order].astype(np.int64), self.track_id[order]], axis=1)
+        starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)]) if len(order) else np.array([], int)
+        ends = np.r_[starts[1:], len(order)]
+        index = {(OBJECT_TYPES[k[0]], int(k[1])): (s, e) for k, s, e in zip(keys[starts].tolist(), starts, ends)}
+        self._track_index = (order, index)
+
+    def track_rows(self, obj_type, track_id):
+        """Row indices of one track, in frame order."""
+        if self._track_index is None:
+            self._build_track_index()
+        order, index = self._track_index
+        start, end = index.get((obj_type, track_id), (0, 0))
+        return order[start:end]
+
+    def track_ids(self, obj_type):
+        if self._track_index is None:
+            self._build_track_index()
+        return [track_id for kind, track_id in self._track_index[1] if kind == obj_type]
+
+    # ---------------- COMPAT VIEW ---------------- #
+
+    def as_tracks(self):
+        return TrackTableView(self)
+
+    def get_value(self, row, field):
+        if field == "team_color":
+            team_id = int(self.columns["team_id"][row])
+            if team_id == -1 or team_id not in self.team_colors:
+                raise KeyError(field)
+            return self.team_colors[team_id]
+
+        if field not in COLUMNS:
+            return self.extras[(row, field)]
+
+        value = self.columns[field][row]
+        if field not in self.filled:
+            raise KeyError(field)
+        if COLUMNS[field][0] is np.bool_:
+            # Flags only show up where they are set
+            if not value:
+                raise KeyError(field)
+            return True
+        if field == "team_id":
+            if value == -1:
+                raise KeyError(field)
+            return int(value)
+        if np.ndim(value):
+            if np.isnan(value).any():
+                if field in NULLABLE:
+                    return None
+                raise KeyError(field)
+            return value.tolist()
+        if np.isnan(value):
+            raise KeyError(field)
+        return float(value)
+
+    def set_value(self, row, field, value):
+        if field == "team_color":
+            team_id = int(self.columns["team_id"][row])
+            self.team_colors[team_id] = value
+            return
+        if field not in COLUMNS:
+            self.extras[(row, field)] = value
+            return
+
+        missing = COLUMNS[field][2]
+        self.columns[field][row] = missing if value is None else value
+        self.filled.add(field)
+
+
+class TrackTableView(Mapping):
+    """tracks[obj_type][frame_num][track_id][field] on top of a TrackTable."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, obj_type):
+        if obj_type not in OBJECT_TYPES:
+            raise KeyError(obj_type)
+        return _FrameListView(self.table, obj_type)
+
+    def __iter__(self):
+        return iter(OBJECT_TYPES)
+
+    def __len__(self):
+        return len(OBJECT_TYPES)
+
+
+class _FrameListView(Sequence):
+    def __init__(self, table, obj_type):
+        self.table = table
+        self.obj_type = obj_type
+
+    def __len__(self):
+        return self.table.num_frames
+
+    def __getitem__(self, frame_num):
+        if isinstance(frame_num, slice):
+            return [self[i] for i in range(*frame_num.indices(len(self)))]
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        return _FrameView(self.table, self.table.frame_rows(frame_num, self.obj_type))
+
+
+class _FrameView(Mapping):
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = dict(zip(table.track_id[rows].tolist(), range(rows.start, rows.stop)))
+
+    def __getitem__(self, track_id):
+        return _RowView(self.table, self.rows[track_id])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class _RowView(MutableMapping):
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, field):
+        return self.table.get_value(self.row, field)
+
+    def __setitem__(self, field, value):
+        self.table.set_value(self.row, field, value)
+
+    def __delitem__(self, field):
+        if field not in COLUMNS:
+            del self.table.extras[(self.row, field)]
+            return
+        self.table.columns[field][self.row] = COLUMNS[field][2]
+
+    def __iter__(self):
+        fields = list(COLUMNS) + ["team_color"]
+        fields += [field for row, field in self.table.extras if row == self.row]
+        return (field for field in fields if field in self)
+
+    def __contains__(self, field):
+        try:
+            self.table.get_value(self.row, field)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return sum(1 for _ in self)
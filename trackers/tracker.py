@@ -1,42 +1,35 @@
-from ultralytics import YOLO
-import supervision as sv
-import pickle
-import os
-from utils import get_bbox_width, get_center_of_bbox, get_foot_position
+from utils import get_center_of_bbox, get_foot_position, prefetch
+from annotation_renderer import frame_renderer, LAYER_MARKER_FILL, LAYER_HUD
+from player_ball_assigner import PossessionStats
+from .track_cache import TrackCache
+from .track_table import TrackTable, OBJECT_TYPES
+from .ball_detector import BallTileDetector
+from .ball_trajectory import BallTrajectory, BALL_MISSING, BALL_INTERPOLATED
+from .registry import model_registry
+from .detector_backend import TimedDetector
+from .detection_schedule import DetectionSchedule, KeyframeDetector, ScheduleReport, compare_tables
 import cv2
-import gzip
 import numpy as np
 from config import *
-import pandas as pd
-import hashlib
-
-
-STUB_DIR = "stubs"
-os.makedirs(STUB_DIR, exist_ok=True)
-
-
-def compute_file_hash(filepath, block_size=65536):
-    """Compute MD5 hash of a file for cache validation."""
-    md5 = hashlib.md5()
-    with open(filepath, "rb") as f:
-        for block in iter(lambda: f.read(block_size), b""):
-            md5.update(block)
-    return md5.hexdigest()
-
-
-def get_stub_path(video_path, config):
-    """Generate reproducible stub filename based on video + config."""
-    base_name = os.path.splitext(os.path.basename(video_path))[0]
-    video_hash = compute_file_hash(video_path)[:8] if video_path else "nohash"
-    config_hash = hashlib.md5(str(config).encode()).hexdigest()[:8]
-    stub_name = f"{base_name}_{video_hash}_{config_hash}.pkl.gz"
-    return os.path.join(STUB_DIR, stub_name)
+import itertools
 
 
 class Tracker:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, detail_level=DETAIL_LEVEL, backend=DETECTOR_BACKEND, imgsz=INFERENCE_IMGSZ,
+                 detector=None):
+        import supervision as sv
+        # PyTorch (ultralytics) or ONNX Runtime detector, see detector_backend.py. It is loaded
+        # once per process (model_registry) and shared; everything below is this tracker's own
+        self.detector = detector if detector is not None else model_registry.detector(backend, model_path, imgsz)
         self.tracker = sv.ByteTrack()
+        # Which frames the detector runs on ("Full": all of them) and what the last run did
+        self.schedule = DetectionSchedule.for_detail_level(detail_level)
+        self.schedule_report = ScheduleReport(self.schedule.name)
+        # Ball-only tile pass around the predicted ball position (BallTileDetector)
+        self.ball_recovery = BALL_RECOVERY
+        self.ball_detector = None
+        # Outlier rejection / gap interpolation of the ball boxes
+        self.ball_trajectory = BallTrajectory()
 
     def add_position_to_tracks(self, tracks):
         for obj_type, object_tracks in tracks.items():
@@ -51,155 +44,274 @@ class Tracker:
                         position = get_foot_position(bbox)
                     tracks[obj_type][frame_num][track_id]['position'] = position
 
-    def interpolate_ball_positions(self, ball_positions):
-        bboxes = []
-        for frame in ball_positions:
-            bbox = frame.get(1, {}).get('bbox')
-            if bbox is None or bbox == [0, 0, 0, 0]:
-                bboxes.append([None, None, None, None])
-            else:
-                bboxes.append(bbox)
-
-        df = pd.DataFrame(bboxes)
-        df = df.interpolate().bfill().ffill()
-        return [{1: {'bbox': row.tolist()}} for _, row in df.iterrows()]
+    def add_position_to_table(self, table):
+        """Columnar add_position_to_tracks: foot position for people, bbox center for the ball."""
+        bbox = table['bbox'].astype(np.float64)
+        ball = table.type_mask('ball')
+        # Same rounding as get_foot_position / get_center_of_bbox
+        x = np.where(ball, np.trunc((bbox[:, 0] + bbox[:, 2]) / 2), np.floor((bbox[:, 0] + bbox[:, 2]) / 2))
+        y = np.where(ball, np.trunc((bbox[:, 1] + bbox[:, 3]) / 2), bbox[:, 3])
+        table['position'] = np.stack([x, y], axis=1)
+
+    def interpolate_ball_positions(self, table):
+        """
+        table (a TrackTable) with its ball rows replaced: outliers dropped and gaps up to
+        BALL_INTERPOLATION_MAX_GAP filled (flagged 'interpolated'); frames in longer gaps
+        are left without a ball.
+        """
+        rows = np.flatnonzero(table.type_mask('ball'))
+        bboxes = np.full((table.num_frames, 4), np.nan)
+        bboxes[table.frame[rows]] = table['bbox'][rows]
+
+        bboxes, flags = self.ball_trajectory.process(bboxes)
+        print(f"[INFO] Ball trajectory: {self.ball_trajectory.stats}")
+
+        frames = np.flatnonzero(flags != BALL_MISSING)
+        return table.replace_rows('ball', frames, 1, bbox=bboxes[frames],
+                                  interpolated=flags[frames] == BALL_INTERPOLATED)
+
+    def detect_batches(self, frames, metrics=None):
+        """
+        Yield (batch_frames, detections) for each BATCH_SIZE batch of any frame iterable.
+        Every ultralytics Results (boxes plus a copy of the image) is turned into a compact
+        sv.Detections right away and dropped, so only plain arrays are kept around.
+        With a keyframe schedule, boxes between keyframes are propagated instead, and with
+        ball recovery on, keyframes without a confident ball get a tiled ball-only pass (one
+        detector call per batch) whose ball is then propagated with the rest.
+        With metrics (a Metrics), every detector call is recorded as a latency sample.
+        """
+        detector = self.detector if metrics is None else TimedDetector(self.detector, metrics, "inference")
+        self.ball_detector = None
+        if self.ball_recovery:
+            tile_detector = self.detector if metrics is None else TimedDetector(self.detector, metrics, "ball_tile_inference")
+            self.ball_detector = BallTileDetector(tile_detector)
+
+        for batch, detections in self.detect_scheduled_batches(frames, detector):
+            if self.ball_detector is not None:
+                self.schedule_report.tile_calls = self.ball_detector.stats["tile_calls"]
+                self.schedule_report.sweep_calls = self.ball_detector.stats["sweep_calls"]
+            yield batch, detections
+
+    def detect_scheduled_batches(self, frames, detector=None):
+        detector = detector or self.detector
+        if not self.schedule.is_full:
+            keyframes = KeyframeDetector(detector, self.schedule, ball_detector=self.ball_detector)
+            self.schedule_report = keyframes.report
+            yield from keyframes.detect_batches(frames)
+            return
+
+        self.schedule_report = ScheduleReport(self.schedule.name)
+        frames = iter(frames)
+        while True:
+            batch = list(itertools.islice(frames, BATCH_SIZE))
+            if not batch:
+                break
+            first = self.schedule_report.frames
+            self.schedule_report.frames += len(batch)
+            self.schedule_report.keyframes += len(batch)
+            detections = detector.detect(batch, conf=CONFIDENCE_THRESHOLD)
+            if self.ball_detector is not None:
+                detections = self.ball_detector.refine(range(first, first + len(batch)), batch, detections)
+            yield batch, detections
 
     def detect_frames(self, frames):
         detections = []
-        for i in range(0, len(frames), BATCH_SIZE):
-            batch = self.model.predict(frames[i:i + BATCH_SIZE], conf=CONFIDENCE_THRESHOLD)
-            detections.extend(batch)
+        for _, batch_detections in self.detect_batches(frames):
+            detections.extend(batch_detections)
         return detections
 
-    def get_object_tracks(self, frames, video_path, use_stub=True):
+    def get_frame_rows(self, detection):
+        """
+        Run ByteTrack on one frame's detections (sv.Detections or a Results) and return the
+        frame's objects as (cls, track_id, bbox) arrays ordered by object type (OBJECT_TYPES),
+        the rows TrackTable.from_frame_rows takes. The ball is untracked and gets id 1.
+        """
+        import supervision as sv
+        cls_names = self.detector.names
+        cls_names_inv = {v: k for k, v in cls_names.items()}
+        if isinstance(detection, sv.Detections):
+            detection_supervision = detection
+        else:
+            detection_supervision = sv.Detections.from_ultralytics(detection)
+
+        # Fix goalkeeper → player
+        for idx, class_id in enumerate(detection_supervision.class_id):
+            if cls_names[class_id] == "goalkeeper":
+                detection_supervision.class_id[idx] = cls_names_inv["player"]
+
+        tracked = self.tracker.update_with_detections(detection_supervision)
+        players = np.flatnonzero(tracked.class_id == cls_names_inv['player'])
+        referees = np.flatnonzero(tracked.class_id == cls_names_inv['referee'])
+        # One ball per frame: the last one detected
+        ball = np.flatnonzero(detection_supervision.class_id == cls_names_inv['ball'])[-1:]
+
+        cls = np.repeat(np.arange(len(OBJECT_TYPES)), [len(players), len(referees), len(ball)])
+        track_id = np.concatenate([tracked.tracker_id[players], tracked.tracker_id[referees], np.ones(len(ball))])
+        bbox = np.concatenate([tracked.xyxy[players], tracked.xyxy[referees], detection_supervision.xyxy[ball]])
+        return cls, track_id.astype(np.int64), bbox.reshape(-1, 4)
+
+    def get_frame_tracks(self, detection):
+        """get_frame_rows split by object type: {obj_type: {track_id: {'bbox': bbox}}}."""
+        frame_tracks = {obj_type: {} for obj_type in OBJECT_TYPES}
+        for cls_index, track_id, bbox in zip(*(rows.tolist() for rows in self.get_frame_rows(detection))):
+            frame_tracks[OBJECT_TYPES[cls_index]][track_id] = {"bbox": bbox}
+        return frame_tracks
+
+    @staticmethod
+    def inference_queue_batches():
+        # Detected batches stream_object_tracks queues for tracking
+        return max(1, PIPELINE_QUEUE_FRAMES // BATCH_SIZE)
+
+    def stream_object_tracks(self, frames, metrics=None):
+        """
+        Streaming variant of get_object_tracks: consumes any frame iterable and
+        yields (frame, frame_tracks) pairs. Decoding and inference run in their own
+        threads, each at most PIPELINE_QUEUE_FRAMES frames (whole batches for inference)
+        ahead; tracking stays in frame order.
+        """
+        frames = prefetch(frames, PIPELINE_QUEUE_FRAMES, "decode")
+        batches = prefetch(self.detect_batches(frames, metrics), self.inference_queue_batches(), "inference")
+        for batch, detections in batches:
+            for frame, detection in zip(batch, detections):
+                yield frame, self.get_frame_tracks(detection)
+
+    def track_cache_config(self, schedule=None):
         # Metadata for reproducibility
+        schedule = schedule or self.schedule
         config = {
             "model": MODEL_PATH,
             "confidence": CONFIDENCE_THRESHOLD,
             "batch_size": BATCH_SIZE,
         }
-
-        stub_path = get_stub_path(video_path, config)
-
-        # === 1. Load Stub if Exists === #
-        if use_stub and os.path.exists(stub_path):
-            with gzip.open(stub_path, 'rb') as f:
-                saved = pickle.load(f)
-            print(f"[INFO] Loaded cached tracks from {stub_path} ✅")
-            return saved["tracks"]
+        # Full runs of the default detector keep the keys they always had
+        if self.detector.name != "pytorch" or self.detector.imgsz != 640:
+            config["backend"] = {"name": self.detector.name, "imgsz": self.detector.imgsz}
+        if not schedule.is_full:
+            config["schedule"] = schedule.as_config()
+        if self.ball_recovery:
+            # version 2: keyframes only, one tile call per batch
+            config["ball_recovery"] = {"min_confidence": BALL_MIN_CONFIDENCE, "tile_size": BALL_TILE_SIZE,
+                                       "tile_imgsz": BALL_TILE_IMGSZ, "sweep_after": BALL_SWEEP_AFTER,
+                                       "sweep_interval": BALL_SWEEP_INTERVAL, "version": 2}
+        return config
+
+    def get_track_table(self, frames, video_path, use_stub=True, progress=None, metrics=None):
+        """
+        Detection + tracking as a TrackTable, served from the track cache when possible.
+        progress(stage, done, total) is called after every batch; inference latencies go to metrics.
+        """
+        config = self.track_cache_config()
+        cache = TrackCache()
+        entry_path = cache.entry_path(video_path, config)
+
+        # === 1. Load cached tracks if they exist === #
+        if use_stub:
+            table = cache.load(entry_path)
+            if table is not None:
+                print(f"[INFO] Loaded cached tracks from {entry_path} ✅")
+                report = cache.load_meta(entry_path).get("report")
+                self.schedule_report = ScheduleReport(**report) if report else ScheduleReport(self.schedule.name)
+                return table
 
         # === 2. Run Detection + Tracking === #
-        detections = self.detect_frames(frames)
-        tracks = {"players": [], "referees": [], "ball": []}
-
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v: k for k, v in cls_names.items()}
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
-            # Fix goalkeeper → player
-            for idx, class_id in enumerate(detection_supervision.class_id):
-                if cls_names[class_id] == "goalkeeper":
-                    detection_supervision.class_id[idx] = cls_names_inv["player"]
-
-            tracked = self.tracker.update_with_detections(detection_supervision)
-
-            tracks["players"].append({})
-            tracks["referees"].append({})
-            tracks["ball"].append({})
-
-            for det in tracked:
-                bbox, cls_id, track_id = det[0].tolist(), det[3], det[4]
-                if cls_id == cls_names_inv['player']:
-                    tracks["players"][frame_num][track_id] = {"bbox": bbox}
-                elif cls_id == cls_names_inv['referee']:
-                    tracks["referees"][frame_num][track_id] = {"bbox": bbox}
-
-            for det in detection_supervision:
-                bbox, cls_id = det[0].tolist(), det[3]
-                if cls_id == cls_names_inv['ball']:
-                    tracks["ball"][frame_num][1] = {"bbox": bbox}
-
-        # === 3. Save Stub === #
-        with gzip.open(stub_path, 'wb') as f:
-            pickle.dump({"config": config, "tracks": tracks}, f)
-        print(f"[INFO] Saved tracks to stub: {stub_path}")
-
-        return tracks
+        # Inference runs in a worker thread while ByteTrack follows in frame order
+        frame_rows = []
+        total = len(frames) if hasattr(frames, '__len__') else None
+
+        for _, detections in prefetch(self.detect_batches(frames, metrics), PIPELINE_QUEUE_SIZE, "inference"):
+            frame_rows.extend(self.get_frame_rows(detection) for detection in detections)
+            if progress is not None:
+                progress("Detection + tracking", len(frame_rows), total)
+        table = TrackTable.from_frame_rows(frame_rows)
+
+        # Accuracy against Full, when Full tracks of this video are already in the cache
+        if not self.schedule.is_full and video_path:
+            reference = cache.load(cache.entry_path(video_path, self.track_cache_config(DetectionSchedule())))
+            if reference is not None:
+                self.schedule_report.accuracy = compare_tables(reference, table)
+        print(f"[INFO] {self.schedule_report.summary()}")
+        if self.ball_detector is not None:
+            print(f"[INFO] Ball recovery: {self.ball_detector.stats}")
+
+        # === 3. Save to the cache === #
+        cache.save(entry_path, table, config, report=self.schedule_report.as_dict())
+        print(f"[INFO] Saved tracks to cache: {entry_path}")
+
+        return table
+
+    def get_object_tracks(self, frames, video_path, use_stub=True, progress=None, metrics=None):
+        # The dict layout, for callers that still want it; the pipeline uses get_track_table
+        return self.get_track_table(frames, video_path, use_stub, progress, metrics).to_tracks()
 
     # ---------------- DRAWING ---------------- #
 
-    def draw_player_marker(self, frame, bbox, color, track_id=None, has_ball=False):
+    def draw_player_marker(self, frame, bbox, color, track_id=None, has_ball=False, renderer=None):
         x_center, y_bottom = get_center_of_bbox(bbox)
         y_bottom = int(bbox[3])
 
-        overlay = frame.copy()
-        cv2.circle(overlay, (x_center, y_bottom), 20, color, -1)
-        cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
-        cv2.circle(frame, (x_center, y_bottom), 20, (0, 0, 0), 2)
-
+        shapes = [('circle', 20, color, -1, 0.6), ('circle', 20, (0, 0, 0), 2, 1.0)]
         if has_ball:
-            cv2.circle(frame, (x_center, y_bottom), 28, (0, 0, 255), 3)
+            shapes.append(('circle', 28, (0, 0, 255), 3, 1.0))
 
-        if track_id is not None:
-            cv2.putText(frame, str(track_id), (x_center - 10, y_bottom - 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 3)
-            cv2.putText(frame, str(track_id), (x_center - 10, y_bottom - 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1)
+        with frame_renderer(frame, renderer) as r:
+            r.marker((x_center, y_bottom), shapes, layer=LAYER_MARKER_FILL)
+
+            if track_id is not None:
+                r.label(str(track_id), (x_center - 10, y_bottom - 30), (255, 255, 255), 0.7, 1,
+                        outline_color=(0, 0, 0), outline_thickness=3)
 
         return frame
 
-    def draw_referee_marker(self, frame, bbox):
+    def draw_referee_marker(self, frame, bbox, renderer=None):
         x_center, y_bottom = get_center_of_bbox(bbox)
         y_bottom = int(bbox[3])
-        cv2.rectangle(frame, (x_center - 5, y_bottom - 5),
-                      (x_center + 5, y_bottom + 5), (0, 255, 255), -1)
+        with frame_renderer(frame, renderer) as r:
+            r.marker((x_center, y_bottom), [('rect', 5, (0, 255, 255), -1, 1.0)])
         return frame
 
-    def draw_ball_marker(self, frame, bbox):
+    def draw_ball_marker(self, frame, bbox, renderer=None):
         x, y = get_center_of_bbox(bbox)
-        cv2.circle(frame, (x, y), 8, (255, 255, 255), -1)
-        cv2.circle(frame, (x, y), 10, (0, 0, 0), 2)
-        cv2.circle(frame, (x, y), 15, (0, 255, 255), 2)
+        with frame_renderer(frame, renderer) as r:
+            r.marker((x, y), [('circle', 8, (255, 255, 255), -1, 1.0),
+                              ('circle', 10, (0, 0, 0), 2, 1.0),
+                              ('circle', 15, (0, 255, 255), 2, 1.0)])
         return frame
 
-    def draw_team_ball_control(self, frame, frame_num, team_ball_control, team_colors=None):
-        overlay = frame.copy()
+    def draw_team_ball_control(self, frame, frame_num, team_ball_control, team_colors=None, renderer=None):
         h, w = frame.shape[:2]
 
         bar_x1, bar_y1 = 100, h - 60
         bar_x2, bar_y2 = w - 100, h - 20
 
-        team_control_frame = team_ball_control[:frame_num + 1]
-        team_counts = {}
-        for team_id in set(team_control_frame):
-            team_counts[team_id] = team_control_frame.count(team_id)
+        # Pass a PossessionStats (built once per video) to keep this O(1) per frame
+        if not isinstance(team_ball_control, PossessionStats):
+            team_ball_control = PossessionStats(team_ball_control[:frame_num + 1])
+        team_counts = team_ball_control.counts_up_to(frame_num)
         total = max(1, sum(team_counts.values()))
 
-        x_start = bar_x1
-        for team_id, count in team_counts.items():
-            ratio = count / total
-            color = team_colors.get(team_id, (0, 0, 255)) if team_colors else (0, 0, 255)
-            x_end = x_start + int((bar_x2 - bar_x1) * ratio)
+        with frame_renderer(frame, renderer) as r:
+            x_start = bar_x1
+            for team_id, count in team_counts.items():
+                ratio = count / total
+                color = team_colors.get(team_id, (0, 0, 255)) if team_colors else (0, 0, 255)
+                x_end = x_start + int((bar_x2 - bar_x1) * ratio)
 
-            cv2.rectangle(overlay, (x_start, bar_y1), (x_end, bar_y2), color, -1)
-            cv2.rectangle(overlay, (x_start, bar_y1), (x_end, bar_y2), (0, 0, 0), 3)
+                r.rectangle((x_start, bar_y1), (x_end, bar_y2), color, -1, alpha=0.9, layer=LAYER_HUD)
+                r.rectangle((x_start, bar_y1), (x_end, bar_y2), (0, 0, 0), 3, alpha=0.9, layer=LAYER_HUD)
 
-            percentage = int(ratio * 100)
-            text = f"{percentage}% ({count})"
-            text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
+                percentage = int(ratio * 100)
+                text = f"{percentage}% ({count})"
+                text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
 
-            text_x = x_start + (x_end - x_start - text_size[0]) // 2
-            text_y = bar_y1 - 10
+                text_x = x_start + (x_end - x_start - text_size[0]) // 2
+                text_y = bar_y1 - 10
 
-            cv2.putText(frame, text, (text_x, text_y),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 3)
-            cv2.putText(frame, text, (text_x, text_y),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+                # The labels sit under the 0.9 bar blend, so they only ever showed at 10%
+                r.text(text, (text_x, text_y), (0, 0, 0), 0.8, 3, alpha=0.1, layer=LAYER_HUD)
+                r.text(text, (text_x, text_y), (255, 255, 255), 0.8, 2, alpha=0.1, layer=LAYER_HUD)
 
-            x_start = x_end
+                x_start = x_end
 
-        cv2.addWeighted(overlay, 0.9, frame, 0.1, 0, frame)
         return frame
 
     def draw_annotations(self, video_frames, tracks, team_ball_control):
@@ -211,6 +323,8 @@ class Tracker:
         else:
             team_colors = {}
 
+        possession = PossessionStats(team_ball_control)
+
         for frame_num, frame in enumerate(video_frames):
             frame = frame.copy()
             try:
@@ -221,19 +335,28 @@ class Tracker:
                 output_video_frames.append(frame)
                 continue
 
+            frame = self.draw_frame_annotations(frame, frame_num, players_dict, referees_dict, ball_dict,
+                                                possession, team_colors)
+            output_video_frames.append(frame)
+
+        return output_video_frames
+
+    def draw_frame_annotations(self, frame, frame_num, players_dict, referees_dict, ball_dict,
+                               team_ball_control, team_colors, renderer=None):
+        """Draw every marker and the possession bar onto a single frame (in place)."""
+        with frame_renderer(frame, renderer) as r:
             for track_id, player in players_dict.items():
-                frame = self.draw_player_marker(
-                    frame, player['bbox'], player['team_color'],
-                    track_id, has_ball=player.get('has_ball', False)
+                self.draw_player_marker(
+                    frame, player['bbox'], player.get('team_color', (0, 0, 255)),
+                    track_id, has_ball=player.get('has_ball', False), renderer=r
                 )
 
             for _, referee in referees_dict.items():
-                frame = self.draw_referee_marker(frame, referee['bbox'])
+                self.draw_referee_marker(frame, referee['bbox'], r)
 
             for _, ball in ball_dict.items():
-                frame = self.draw_ball_marker(frame, ball['bbox'])
+                self.draw_ball_marker(frame, ball['bbox'], r)
 
-            frame = self.draw_team_ball_control(frame, frame_num, team_ball_control, team_colors)
-            output_video_frames.append(frame)
+            self.draw_team_ball_control(frame, frame_num, team_ball_control, team_colors, r)
 
-        return output_video_frames
+        return frame
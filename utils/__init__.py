@@ -1,2 +1,6 @@
 from .video_utils import *
-from .bbox_utils import *
\ No newline at end of file
+from .video_encoder import VideoEncoder
+from .bbox_utils import *
+from .frame_cache import FrameCache
+from .prefetch import prefetch
+from .metrics import Metrics, SamplingProfiler
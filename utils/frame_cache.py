@@ -0,0 +1,69 @@
+import cv2
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    """
+    Lazily computed, memoized derivatives of the decoded frames - grayscale and a
+    1/2, 1/4, ... downscaled pyramid - shared by every stage so each conversion
+    happens at most once per frame. Bounded LRU over frame numbers.
+
+    Attach it to a frame list (FrameCache(video_frames)) or, when frames are streamed,
+    pass the frame along with its number. Derivatives are of the frame as it was first
+    seen, so annotate frames only after every stage has pulled what it needs.
+    """
+
+    def __init__(self, frames=None, max_frames=32):
+        self.frames = frames
+        self.max_frames = max_frames
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _entry(self, frame_num, frame):
+        with self.lock:
+            entry = self.entries.get(frame_num)
+            if entry is not None:
+                self.entries.move_to_end(frame_num)
+                return entry
+
+            if frame is None:
+                frame = self.frames[frame_num]
+            entry = {('bgr', 0): frame}
+            self.entries[frame_num] = entry
+            while len(self.entries) > self.max_frames:
+                self.entries.popitem(last=False)
+            return entry
+
+    def get(self, frame_num, color='bgr', level=0, frame=None):
+        """
+        Frame frame_num in color 'bgr' or 'gray', downscaled by 2**level.
+        Each derivative is built from the next larger one of the same color.
+        """
+        entry = self._entry(frame_num, frame)
+        key = (color, level)
+        image = entry.get(key)
+        if image is not None:
+            return image
+
+        if level > 0:
+            larger = self.get(frame_num, color, level - 1, frame)
+            image = cv2.resize(larger, (max(1, larger.shape[1] // 2), max(1, larger.shape[0] // 2)),
+                               interpolation=cv2.INTER_AREA)
+        elif color == 'gray':
+            image = cv2.cvtColor(entry[('bgr', 0)], cv2.COLOR_BGR2GRAY)
+        else:
+            raise ValueError(f"Unknown color '{color}'")
+
+        # Racing threads may both compute it; the results are identical
+        entry[key] = image
+        return image
+
+    def frame(self, frame_num, frame=None):
+        return self.get(frame_num, 'bgr', 0, frame)
+
+    def gray(self, frame_num, level=0, frame=None):
+        return self.get(frame_num, 'gray', level, frame)
+
+    def downscaled(self, frame_num, level, frame=None):
+        return self.get(frame_num, 'bgr', level, frame)
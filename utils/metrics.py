@@ -0,0 +1,289 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from config import METRICS_PREFIX, PROFILE_STAGE, PROFILE_INTERVAL
+
+try:
+    import resource
+except ImportError:    # Windows
+    resource = None
+
+
+def current_rss():
+    """Resident memory of this process in bytes (None if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """Highest resident memory of this process so far in bytes (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMetrics:
+    """Totals of one stage: wall / CPU seconds, calls, items (frames) and the memory it saw."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items = 0
+        self.peak_rss = None
+        self.rss_delta = 0
+        # Streaming stage this one pulls its items from (see Metrics.stream)
+        self.upstream = None
+
+    def as_dict(self):
+        return {"calls": self.calls, "wall_seconds": round(self.wall, 4), "cpu_seconds": round(self.cpu, 4),
+                "items": self.items, "items_per_second": round(self.items / self.wall, 2) if self.wall > 0 else None,
+                "peak_rss_bytes": self.peak_rss, "rss_delta_bytes": self.rss_delta}
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of one thread (thread_ident) each `interval` seconds, for
+    flame graphs: write_folded() gives one "thread;outer;...;inner count" line per
+    distinct stack (the collapsed format of flamegraph.pl and speedscope). With `active`,
+    a callable, only the samples taken while active() is true count.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_ident=None, active=None):
+        self.interval = interval
+        self.thread_ident = thread_ident if thread_ident is not None else threading.get_ident()
+        self.active = active
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        if self.active is not None and not self.active():
+            return
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != self.thread_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Metrics:
+    """
+    Instrumentation of one job: per-stage wall time, CPU time (of the whole process, so
+    worker threads count), items (frames) per second and memory, plus latency samples of
+    repeated operations such as inference batches. Exported as a JSON report or in the
+    Prometheus text format; with profile_stage set, that stage runs under the sampling
+    profiler, a stage() block or a stream() stage alike. Only the thread running the stage
+    is sampled, not the threads it hands work to (prefetch, thread pools, the encoder).
+
+        metrics = Metrics(job="match_1")
+        with metrics.stage("decode", items=len(frames)):
+            ...
+        metrics.observe("inference", seconds, items=len(batch))
+        metrics.write(output_dir)    # metrics.json, metrics.prom (+ profile_<stage>.folded)
+    """
+
+    def __init__(self, job=None, profile_stage=PROFILE_STAGE, profile_interval=PROFILE_INTERVAL,
+                 prefix=METRICS_PREFIX):
+        self.job = job
+        self.profile_stage = profile_stage
+        self.profile_interval = profile_interval
+        self.prefix = prefix
+        self.stages = {}
+        self.latencies = {}
+        self.profiles = {}
+        # {thread ident: streaming stage whose next item that thread is getting}
+        self.streaming = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def stage_metrics(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """Time the block as stage `name`; items is what it processed (frames), for the throughput."""
+        profiler = None
+        if name == self.profile_stage:
+            profiler = SamplingProfiler(self.profile_interval, threading.get_ident())
+            profiler.start()
+        rss_before = current_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profiler is not None:
+                profiler.stop()
+                self.profiles[name] = profiler
+            rss_after = current_rss()
+            with self.lock:
+                stage = self.stage_metrics(name)
+                stage.calls += 1
+                stage.wall += wall
+                stage.cpu += cpu
+                stage.items += items or 0
+                stage.peak_rss = peak_rss()
+                if rss_before is not None and rss_after is not None:
+                    stage.rss_delta += rss_after - rss_before
+
+    def stream(self, name, iterable, upstream=None):
+        """
+        Yield from a streaming stage, timing the time spent getting its items. Each stage
+        pulls from the one before, so pass that one as upstream: its time is taken out.
+        A profiled stage is sampled only while its own code runs, not its upstream's.
+        """
+        stage = self.stage_metrics(name)
+        stage.calls += 1
+        stage.upstream = upstream
+        iterator = iter(iterable)
+        profiler = None
+        try:
+            while True:
+                ident = threading.get_ident()
+                if name == self.profile_stage and profiler is None:
+                    # On the thread that consumes the stage, once it is first pulled
+                    profiler = SamplingProfiler(self.profile_interval, ident,
+                                                active=lambda ident=ident: self.streaming.get(ident) == name)
+                    profiler.start()
+                outer = self.streaming.get(ident)
+                self.streaming[ident] = name
+                wall, cpu = time.perf_counter(), time.process_time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    stage.wall += time.perf_counter() - wall
+                    stage.cpu += time.process_time() - cpu
+                    self.streaming[ident] = outer
+                stage.items += 1
+                yield item
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                self.profiles[name] = profiler
+
+    def exclusive(self):
+        """Stages with the time of their streaming upstream taken out."""
+        stages = {}
+        for name, stage in self.stages.items():
+            result = stage.as_dict()
+            upstream = self.stages.get(stage.upstream)
+            if upstream is not None:
+                result["wall_seconds"] = round(max(stage.wall - upstream.wall, 0.0), 4)
+                result["cpu_seconds"] = round(max(stage.cpu - upstream.cpu, 0.0), 4)
+                result["items_per_second"] = (round(stage.items / (stage.wall - upstream.wall), 2)
+                                              if stage.wall > upstream.wall else None)
+            stages[name] = result
+        return stages
+
+    def observe(self, name, seconds, items=1):
+        """One latency sample of a repeated operation (e.g. an inference batch of `items` frames)."""
+        with self.lock:
+            self.latencies.setdefault(name, []).append((seconds, items))
+
+    @staticmethod
+    def quantile(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def latency_summary(self, name):
+        samples = self.latencies[name]
+        seconds = [s for s, _ in samples]
+        items = sum(n for _, n in samples)
+        return {"count": len(samples), "items": items, "sum_seconds": round(sum(seconds), 4),
+                "mean_seconds": round(sum(seconds) / len(seconds), 5),
+                "p50_seconds": round(self.quantile(seconds, 0.5), 5),
+                "p90_seconds": round(self.quantile(seconds, 0.9), 5),
+                "p99_seconds": round(self.quantile(seconds, 0.99), 5),
+                "max_seconds": round(max(seconds), 5)}
+
+    def wall_times(self):
+        """{stage: wall seconds}, for summaries."""
+        return {name: stage["wall_seconds"] for name, stage in self.exclusive().items()}
+
+    def as_dict(self):
+        return {"job": self.job, "started": self.started, "peak_rss_bytes": peak_rss(),
+                "stages": self.exclusive(),
+                "latency": {name: self.latency_summary(name) for name in self.latencies}}
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        def labels(**values):
+            values = {"job": self.job, **values} if self.job is not None else values
+            escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for v in values.values())
+            return "{" + ",".join(f'{key}="{value}"' for key, value in zip(values, escaped)) + "}"
+
+        p = self.prefix
+        lines = []
+        stages = self.exclusive()
+        for metric, key, help_text in [
+            ("stage_wall_seconds", "wall_seconds", "Wall-clock time spent in a pipeline stage"),
+            ("stage_cpu_seconds", "cpu_seconds", "Process CPU time (all threads) during a pipeline stage"),
+            ("stage_items", "items", "Items (frames) a pipeline stage processed"),
+            ("stage_items_per_second", "items_per_second", "Throughput of a pipeline stage"),
+            ("stage_peak_rss_bytes", "peak_rss_bytes", "Process peak resident memory at the end of a stage"),
+        ]:
+            lines += [f"# HELP {p}_{metric} {help_text}", f"# TYPE {p}_{metric} gauge"]
+            lines += [f"{p}_{metric}{labels(stage=name)} {stage[key]}"
+                      for name, stage in stages.items() if stage[key] is not None]
+
+        if self.latencies:
+            lines += [f"# HELP {p}_latency_seconds Latency of repeated operations (inference batches, ...)",
+                      f"# TYPE {p}_latency_seconds summary"]
+            for name in self.latencies:
+                summary = self.latency_summary(name)
+                for quantile, key in (("0.5", "p50_seconds"), ("0.9", "p90_seconds"), ("0.99", "p99_seconds")):
+                    lines.append(f"{p}_latency_seconds{labels(operation=name, quantile=quantile)} {summary[key]}")
+                lines.append(f"{p}_latency_seconds_sum{labels(operation=name)} {summary['sum_seconds']}")
+                lines.append(f"{p}_latency_seconds_count{labels(operation=name)} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir, prefix=""):
+        """metrics.json and metrics.prom in output_dir, plus profile_<stage>.folded when profiling."""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = [os.path.join(output_dir, f"{prefix}metrics.json"), os.path.join(output_dir, f"{prefix}metrics.prom")]
+        with open(paths[0], "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        with open(paths[1], "w") as f:
+            f.write(self.to_prometheus())
+        for stage, profiler in self.profiles.items():
+            paths.append(os.path.join(output_dir, f"{prefix}profile_{stage}.folded"))
+            profiler.write_folded(paths[-1])
+        return paths
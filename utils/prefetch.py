@@ -0,0 +1,55 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(iterable, max_buffered=4, name="prefetch"):
+    """
+    Iterate `iterable` in a background thread and yield its items, in order, through a
+    bounded queue: the producer runs at most max_buffered items ahead of the consumer.
+    Chaining these (decode -> inference -> tracking -> encode) overlaps the stages, so
+    wall-clock time tends towards the slowest stage instead of their sum.
+
+    Exceptions raised by the producer are re-raised in the consumer; when the consumer
+    stops early the producer is told to stop at its next item.
+    """
+    items = queue.Queue(maxsize=max(1, max_buffered))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as error:
+            put(_Failure(error))
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
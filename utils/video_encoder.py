@@ -0,0 +1,161 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import cv2
+from config import FPS, VIDEO_CODEC, FFMPEG_PATH, H264_CRF, H264_PRESET, PIPELINE_QUEUE_SIZE
+
+# OpenCV fourcc per codec name
+FOURCC = {"xvid": "XVID", "mp4v": "mp4v", "mjpg": "MJPG"}
+
+_DONE = object()
+
+
+def find_ffmpeg():
+    """ffmpeg executable: FFMPEG_PATH, the one on PATH, or imageio-ffmpeg's bundled one (None if none)."""
+    if FFMPEG_PATH:
+        return FFMPEG_PATH
+    found = shutil.which("ffmpeg")
+    if found:
+        return found
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def resolve_codec(output_path, codec=VIDEO_CODEC):
+    """
+    "auto" picks by container: H.264 through ffmpeg for .mp4 (browsers play it as is),
+    falling back to mp4v when there is no ffmpeg; XVID for everything else.
+    """
+    if codec != "auto":
+        return codec
+    if os.path.splitext(output_path)[1].lower() == ".mp4":
+        return "h264" if find_ffmpeg() else "mp4v"
+    return "xvid"
+
+
+class _OpenCVWriter:
+    def __init__(self, output_path, fps, size, codec):
+        self.writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*FOURCC[codec]), fps, size)
+        if not self.writer.isOpened():
+            raise IOError(f"OpenCV can't write {codec} to {output_path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+class _FFmpegWriter:
+    """Raw BGR frames piped into ffmpeg, encoded to H.264 / yuv420p with the index up front (faststart)."""
+
+    def __init__(self, output_path, fps, size, crf=H264_CRF, preset=H264_PRESET):
+        ffmpeg = find_ffmpeg()
+        if ffmpeg is None:
+            raise RuntimeError("The h264 codec needs ffmpeg (on PATH, FFMPEG_PATH or pip install imageio-ffmpeg)")
+        command = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+            "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-movflags", "+faststart", output_path,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame.tobytes())
+
+    def close(self):
+        _, errors = self.process.communicate()
+        if self.process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed ({self.process.returncode}): {errors.decode(errors='replace').strip()}")
+
+
+class VideoEncoder:
+    """
+    Encodes frames on a background thread: write() only queues the frame (blocking once
+    max_buffered frames are waiting), so encoding overlaps whatever produces the frames.
+    The writer opens on the first frame, which gives the output size.
+
+        with VideoEncoder(output_path, fps) as encoder:
+            for frame in frames:
+                encoder.write(frame)
+
+    codec: "auto", "h264" (ffmpeg pipe, browser-playable .mp4), "xvid", "mp4v" or "mjpg".
+    Errors of the encoding thread are raised by the next write() or by close().
+    """
+
+    def __init__(self, output_path, fps=FPS, codec=VIDEO_CODEC, max_buffered=PIPELINE_QUEUE_SIZE):
+        self.output_path = output_path
+        self.fps = fps
+        self.codec = resolve_codec(output_path, codec)
+        self.frames = queue.Queue(maxsize=max(1, max_buffered))
+        self.error = None
+        self.frame_count = 0
+        self.thread = threading.Thread(target=self._encode, name="encode", daemon=True)
+        self.thread.start()
+
+    def _open(self, frame):
+        size = (frame.shape[1], frame.shape[0])
+        if self.codec == "h264":
+            return _FFmpegWriter(self.output_path, self.fps, size)
+        if self.codec not in FOURCC:
+            raise ValueError(f"Unknown codec '{self.codec}', expected auto, h264 or one of {list(FOURCC)}")
+        return _OpenCVWriter(self.output_path, self.fps, size, self.codec)
+
+    def _encode(self):
+        writer = None
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is _DONE:
+                    break
+                if writer is None:
+                    writer = self._open(frame)
+                writer.write(frame)
+        except BaseException as error:
+            self.error = error
+            # Keep draining so a blocked write() can notice the error
+            while self.frames.get() is not _DONE:
+                pass
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except BaseException as error:
+                    self.error = self.error or error
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, frame):
+        self._raise_error()
+        self.frames.put(frame)
+        self.frame_count += 1
+
+    def close(self):
+        """Wait for every queued frame to be written and finish the file."""
+        if self.thread.is_alive():
+            self.frames.put(_DONE)
+            self.thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Already unwinding (e.g. JobCancelled): still finish the file, but an encoder error
+        # must not replace the exception that is on its way out
+        try:
+            self.close()
+        except BaseException as error:
+            print(f"[WARN] Video encoder failed while handling {exc_type.__name__}: {error!r}")
@@ -1,4 +1,7 @@
-import cv2 
+import cv2
+import math
+from config import FPS, VIDEO_CODEC
+from .video_encoder import VideoEncoder
 
 def read_video(path):
     cap = cv2.VideoCapture(path)
@@ -6,18 +9,44 @@ def read_video(path):
 
     while True:
         ret, frame = cap.read() # ret is a flag if there's a frame or not
-        if not ret: 
+        if not ret:
             break
 
         frames.append(frame)
 
     return frames
 
-def save_video(output_frames, output_path, fps=30):
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out = cv2.VideoWriter(output_path, fourcc, 24, (output_frames[0].shape[1], output_frames[0].shape[0]))
+def iter_video(path):
+    """Yield frames one at a time instead of loading the whole video into memory."""
+    cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def get_video_fps(path, default=FPS):
+    """Frame rate the video file reports (default when it reports none)."""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps > 0 and math.isfinite(fps) else default
+
+def get_video_frame_count(path):
+    """Number of frames the video file reports (None when it doesn't say)."""
+    cap = cv2.VideoCapture(path)
+    count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    return int(count) if count > 0 else None
 
-    for frame in output_frames:
-        out.write(frame)
-    
-    out.release()
+def save_video(output_frames, output_path, fps=FPS, codec=VIDEO_CODEC):
+    """
+    Encode any frame iterable (list or generator) to output_path. Encoding runs on a
+    background thread (VideoEncoder), so a generator producing the frames overlaps it.
+    """
+    with VideoEncoder(output_path, fps, codec) as encoder:
+        for frame in output_frames:
+            encoder.write(frame)
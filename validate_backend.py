@@ -0,0 +1,89 @@
+import argparse
+import itertools
+import time
+from utils import iter_video
+from config import *
+from trackers.detector_backend import (DETECTOR_BACKENDS, export_onnx, load_detector, onnx_model_path,
+                                       quantize_onnx, detections_by_class)
+from trackers.detection_schedule import compare_tracks
+
+
+def read_clip(video_path, max_frames, step=1):
+    return list(itertools.islice(iter_video(video_path), 0, max_frames * step, step))
+
+
+def time_backend(detector, frames, imgsz):
+    """Detections of every frame (in BATCH_SIZE batches) and the mean time per frame in ms."""
+    # Warm-up: the first call pays for graph optimization / lazy init
+    detector.detect(frames[:BATCH_SIZE], conf=CONFIDENCE_THRESHOLD, imgsz=imgsz)
+
+    detections = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), BATCH_SIZE):
+        detections.extend(detector.detect(frames[i:i + BATCH_SIZE], conf=CONFIDENCE_THRESHOLD, imgsz=imgsz))
+    elapsed = time.perf_counter() - start
+    return detections, 1000 * elapsed / len(frames)
+
+
+def export(args):
+    onnx_path = export_onnx(args.model, args.imgsz)
+    print(f"Exported {args.model} -> {onnx_path}")
+
+    if args.int8:
+        if not args.video:
+            raise SystemExit("--int8 needs --video: the quantizer calibrates on frames of a sample clip")
+        # Spread the calibration frames over the clip rather than taking the first seconds
+        frames = read_clip(args.video, args.calibration_frames, step=args.calibration_step)
+        int8_path = quantize_onnx(onnx_path, frames, onnx_model_path(args.model, int8=True), args.imgsz)
+        print(f"Quantized on {len(frames)} frames -> {int8_path}")
+
+
+def validate(args):
+    frames = read_clip(args.video, args.frames)
+    print(f"=== Detector backends on {len(frames)} frames of {args.video} (imgsz {args.imgsz}) ===\n")
+
+    reference = load_detector("pytorch", args.model, args.imgsz)
+    reference_detections, reference_ms = time_backend(reference, frames, args.imgsz)
+    reference_tracks = detections_by_class(reference_detections, reference.names)
+    print(f"pytorch: {reference_ms:.1f} ms/frame")
+
+    for backend in args.backends:
+        if backend == "pytorch":
+            continue
+        detector = load_detector(backend, args.model, args.imgsz)
+        detections, ms = time_backend(detector, frames, args.imgsz)
+
+        # Box agreement per class, with the PyTorch detections as ground truth
+        agreement = compare_tracks(reference_tracks, detections_by_class(detections, detector.names))
+        print(f"{backend}: {ms:.1f} ms/frame, {reference_ms / ms:.2f}x speedup")
+        for class_name, stats in agreement.items():
+            print(f"  {class_name:<12} recall {100 * stats['recall']:5.1f}%  precision {100 * stats['precision']:5.1f}%  "
+                  f"IoU {stats['mean_iou']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the detector to ONNX (optionally INT8) and compare "
+                                                 "backends against PyTorch on a sample clip.")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=INFERENCE_IMGSZ)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export MODEL to ONNX, and INT8 with --int8")
+    export_parser.add_argument("--int8", action="store_true")
+    export_parser.add_argument("--video", help="calibration clip for --int8")
+    export_parser.add_argument("--calibration-frames", type=int, default=64)
+    export_parser.add_argument("--calibration-step", type=int, default=10, help="use every n-th frame")
+    export_parser.set_defaults(func=export)
+
+    validate_parser = commands.add_parser("validate", help="speedup and detection agreement vs PyTorch")
+    validate_parser.add_argument("--video", default=INPUT_VIDEO_PATH)
+    validate_parser.add_argument("--frames", type=int, default=100)
+    validate_parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=DETECTOR_BACKENDS)
+    validate_parser.set_defaults(func=validate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
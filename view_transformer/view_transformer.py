@@ -27,27 +27,61 @@ class ViewTransformer:
         self.perspective_transformer = cv2.getPerspectiveTransform(self.pixel_vertices, self.target_vertices)
 
 
-    def transform_point(self, point):
-        p = int(point[0]), int(point[1])
-        is_inside = cv2.pointPolygonTest(self.pixel_vertices, p, False) >= 0
+    def points_inside(self, points):
+        """
+        Vectorized cv2.pointPolygonTest(..., False) >= 0 for an (N, 2) array: points on the
+        edges count as inside. Like transform_point, coordinates are truncated to ints first.
+        """
+        points = np.trunc(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+        x, y = points[:, 0, None], points[:, 1, None]
+        x1, y1 = self.pixel_vertices[:, 0].astype(np.float64), self.pixel_vertices[:, 1].astype(np.float64)
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
 
-        if not is_inside:
-            return None
+        # On an edge: collinear with it and within its bounding box
+        cross = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+        on_edge = ((cross == 0) & (np.minimum(x1, x2) <= x) & (x <= np.maximum(x1, x2))
+                   & (np.minimum(y1, y2) <= y) & (y <= np.maximum(y1, y2)))
 
-        reshaped_point = point.reshape(1, -1, 2).astype(np.float32)
-        transformed_point = cv2.perspectiveTransform(reshaped_point, self.perspective_transformer)
-        return transformed_point.reshape(-1, 2)
+        # Even-odd rule: count the edges a ray to the right of the point crosses
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crosses = ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+        return (crosses.sum(axis=1) % 2 == 1) | on_edge.any(axis=1)
 
-    def add_transformed_position_to_tracks(self,tracks):
-        for object, object_tracks in tracks.items():
-            for frame_num, track in enumerate(object_tracks):
-                for track_id, track_info in track.items():
-                        position = track_info['position_adjusted']
-                        position = np.array(position)
-                        position_transformed = self.transform_point(position)
+    def transform_points(self, points):
+        """
+        Court positions (meters) of an (N, 2) array of pixel positions in one
+        perspectiveTransform call. Returns the (N, 2) result and the inside mask;
+        rows of points outside the court are NaN.
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        inside = self.points_inside(points)
+        transformed = np.full(points.shape, np.nan, dtype=np.float32)
+        if inside.any():
+            transformed[inside] = cv2.perspectiveTransform(points[inside].reshape(1, -1, 2),
+                                                           self.perspective_transformer).reshape(-1, 2)
+        return transformed, inside
 
-                        if position_transformed is not None:
-                            position_transformed = position_transformed.squeeze().tolist()
-                        tracks[object][frame_num][track_id]['position_transformed'] = position_transformed
+    def transform_point(self, point):
+        transformed, inside = self.transform_points(point)
+        if not inside[0]:
+            return None
+        return transformed
+
+    def add_transformed_position_to_table(self, table):
+        # Columnar add_transformed_position_to_tracks; positions outside the court stay NaN
+        table['position_transformed'], _ = self.transform_points(table['position_adjusted'])
 
+    def add_transformed_position_to_tracks(self,tracks):
+        # Gather every position, transform them all at once and scatter the results back
+        entries = [track_info
+                   for object_tracks in tracks.values()
+                   for track in object_tracks
+                   for track_info in track.values()]
+        if not entries:
+            return
 
+        positions = np.array([track_info['position_adjusted'] for track_info in entries], dtype=np.float32)
+        transformed, inside = self.transform_points(positions)
+        transformed = transformed.tolist()
+        for track_info, position_transformed, is_inside in zip(entries, transformed, inside.tolist()):
+            track_info['position_transformed'] = position_transformed if is_inside else None